@@ -6,60 +6,97 @@ Created on 4 déc. 2013
 
 OpenLR decoder
 
+Public names are imported on first access: workers that only parse
+location references do not import the decoder, and bitstring is only
+imported by the bitstring backend.
+
 '''
 
-from .version import __version_info__, __version_info__
-
-from .parser import (BinaryParseError,
-                     BinaryVersionError,
-                     InvalidDataSizeError,
-                     init_binary_parsing,
-                     parse_binary,
-                     LocationType,
-                     LineLocation,
-                     GeoCoordinateLocation,
-                     BBox,
-                     CircleLocation,
-                     RectangleLocation,
-                     GridLocation,
-                     PolygonLocation,
-                     PoiWithAccessPointLocation,
-                     ClosedLineLocation,
-                     PointAlongLineLocation,
-                     GeoCoordinateLocation,
-                     PoiWithAccessPointLocation,
-                     RectangleLocation,
-                     BBox)
-
-from .binary import (Coords,
-                     LocationReferencePoint)
-
-from .constants import (LocationType,
-                        LENGTH_INTERVAL,
-                        BEARING_SECTOR,
-                        RELATIVE_OFFSET_LENGTH,
-                        RIGTH_SIDE,
-                        LEFT_SIDE,
-                        BOTH_SIDE,
-                        NO_ORIENTATION_OR_UNKNOWN,
-                        WITH_LINE_DIRECTION,
-                        AGAINST_LINE_DIRECTION,
-                        BOTH_DIRECTIONS,
-                        ON_ROAD_OR_UNKNOWN)
-
-
-
-import fow
-
-
-from .decoder import (DecoderError,
-                      DecoderInvalidLocation,
-                      RouteSearchException,
-                      RouteNotFoundException,
-                      RouteConstructionFailed,
-                      MapDatabase,
-                      DecoderBase,
-                      RatingCalculator,
-                      ClassicDecoder)
-
-Decoder = ClassicDecoder
+import sys
+
+from .version import __version_info__
+from .utils import LazyModule
+
+
+def _exports(module, *names):
+    return [(name, (module, name)) for name in names]
+
+
+_EXPORTS = dict(
+    _exports('.parser',
+             'BinaryParseError',
+             'BinaryVersionError',
+             'InvalidDataSizeError',
+             'init_binary_parsing',
+             'parse_binary',
+             'parse_binary_many',
+             'peek_location_type',
+             'decode_base64_many',
+             'iter_length_prefixed',
+             'buffer_view',
+             'ON_ERROR_YIELD',
+             'ON_ERROR_SKIP',
+             'ON_ERROR_RAISE',
+             'BITSTRING_BACKEND',
+             'FAST_BACKEND',
+             'LineLocation',
+             'LazyPoints',
+             'spatial_location',
+             'InternTable',
+             'pack_locations',
+             'unpack_locations',
+             'GeoCoordinateLocation',
+             'BBox',
+             'CircleLocation',
+             'RectangleLocation',
+             'GridLocation',
+             'PolygonLocation',
+             'PoiWithAccessPointLocation',
+             'ClosedLineLocation',
+             'PointAlongLineLocation') +
+
+    _exports('.binary',
+             'Coords',
+             'LocationReferencePoint') +
+
+    _exports('.constants',
+             'LocationType',
+             'LENGTH_INTERVAL',
+             'BEARING_SECTOR',
+             'RELATIVE_OFFSET_LENGTH',
+             'RIGTH_SIDE',
+             'LEFT_SIDE',
+             'BOTH_SIDE',
+             'NO_ORIENTATION_OR_UNKNOWN',
+             'WITH_LINE_DIRECTION',
+             'AGAINST_LINE_DIRECTION',
+             'BOTH_DIRECTIONS',
+             'ON_ROAD_OR_UNKNOWN') +
+
+    _exports('.decoder',
+             'DecoderError',
+             'DecoderInvalidLocation',
+             'RouteSearchException',
+             'RouteNotFoundException',
+             'RouteConstructionFailed',
+             'MapDatabase',
+             'DecoderBase',
+             'RatingCalculator',
+             'ClassicDecoder') +
+
+    [('Decoder', ('.decoder', 'ClassicDecoder'))] +
+
+    # Submodules
+    [(name, ('.' + name, None)) for name in ('binary',
+                                             'constants',
+                                             'decoder',
+                                             'fow',
+                                             'parser',
+                                             'rating',
+                                             'spatial',
+                                             'utils',
+                                             'validation',
+                                             'values')])
+
+
+sys.modules[__name__] = LazyModule(sys.modules[__name__], _EXPORTS)
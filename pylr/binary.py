@@ -6,12 +6,24 @@
 '''
 
 from collections import namedtuple
+from struct import Struct
 from .values import (coordinates_values,
                      rel_coordinates_values,
-                     distance_estimate,
-                     relative_distance)
-
-from .constants import (BINARY_VERSION_2, BINARY_VERSION_3)
+                     DISTANCE_ESTIMATES,
+                     OFFSET_ESTIMATES)
+
+from .constants import DECA_MICRO_DEG_FACTOR
+from .constants import (MIN_BYTES_LINE_LOCATION,
+                        MIN_BYTES_CLOSED_LINE_LOCATION,
+                        MIN_BYTES_POLYGON,
+                        POINT_ALONG_LINE_SIZE,
+                        POINT_WITH_ACCESS_SIZE,
+                        CIRCLE_BASE_SIZE,
+                        LARGE_RECTANGLE_SIZE,
+                        LARGE_GRID_SIZE,
+                        LRP_SIZE,
+                        RELATIVE_COORD_SIZE,
+                        LocationType)
 
 # lon (float) : longitude (in degrees)
 # lat (float) : latituded (in degrees)
@@ -59,6 +71,28 @@ ATTR4_BITS = (RFU_BITS, POFFF_BITS, NOFFF_BITS, BEAR_BITS)
 ATTR5_BITS = (NR_RFU2, FRC_BITS, FOW_BITS)
 ATTR6_BITS = (NR_RFU3, BEAR_BITS)
 
+# Struct layouts used by the fast reader.
+# Once grouped, all fields are byte aligned: 24 bits coordinates are read
+# as a signed short followed by an unsigned byte, attributes are read as
+# whole bytes and split with shifts and masks.
+HEADER_FMT = 'B'
+ABS_COORDS_FMT = 'hBhB'
+REL_COORDS_FMT = 'hh'
+FIRST_LRP_FMT = ABS_COORDS_FMT + 'BBB'
+LRP_FMT = REL_COORDS_FMT + 'BBB'
+LAST_LRP_FMT = REL_COORDS_FMT + 'BB'
+LAST_CLOSED_LINE_FMT = 'BB'
+OFFSET_FMT = 'B'
+GRID_DIMENSIONS_FMT = 'HH'
+RADIUS_FMT = ('B', 'H', 'HB', 'I')
+
+# Number of unpacked values for each layout
+FIRST_LRP_FIELDS = len(FIRST_LRP_FMT)
+LRP_FIELDS = len(LRP_FMT)
+LAST_LRP_FIELDS = len(LAST_LRP_FMT)
+ABS_COORDS_FIELDS = len(ABS_COORDS_FMT)
+REL_COORDS_FIELDS = len(REL_COORDS_FMT)
+
 def _parse_attr1(rb):
     ''' Parse the raw binary data bits defined by ATTR1_BITS
     
@@ -177,7 +211,7 @@ def _parse_lrp(rb, bits, rel_coords):
     frcnp, bear = _parse_attr2(rb)
     dnp, = _parse_attr3(rb)
 
-    dnp = distance_estimate(dnp)
+    dnp = DISTANCE_ESTIMATES[dnp]
 
     return LocationReferencePoint(coords, bear, orient, frc, fow, frcnp, dnp)
 
@@ -238,11 +272,7 @@ def _parse_offset(rb):
         :rtype: int
     '''
     offs, = rb.getbits(OFFSET_BITS)
-    if rb.version == BINARY_VERSION_2:
-        offs = distance_estimate(offs)
-    elif rb.version == BINARY_VERSION_3:
-        offs = relative_distance(offs)
-    return offs
+    return _offset_value(offs, rb.version)
 
 
 def _parse_radius(rb, radius_size):
@@ -267,3 +297,214 @@ def _parse_grid_dimensions(rb):
     cols, = rb.getbits(GRID_CELL_BITS)
     rows, = rb.getbits(GRID_CELL_BITS)
     return cols, rows
+
+
+# ----------------
+# Read plans
+# ----------------
+
+def _line_layout(num_bytes):
+    """ Layout of a line location: header, first LRP, intermediate LRPs,
+        last LRP and the trailing offsets.
+    """
+    num_intermediates, num_offsets = divmod(num_bytes - MIN_BYTES_LINE_LOCATION, LRP_SIZE)
+    return (HEADER_FMT + FIRST_LRP_FMT + LRP_FMT * num_intermediates +
+            LAST_LRP_FMT + OFFSET_FMT * num_offsets)
+
+
+def _point_along_line_layout(num_bytes):
+    return (HEADER_FMT + FIRST_LRP_FMT + LAST_LRP_FMT +
+            OFFSET_FMT * (num_bytes - POINT_ALONG_LINE_SIZE))
+
+
+def _geo_coordinates_layout(num_bytes):
+    return HEADER_FMT + ABS_COORDS_FMT
+
+
+def _poi_with_access_point_layout(num_bytes):
+    return (HEADER_FMT + FIRST_LRP_FMT + LAST_LRP_FMT +
+            OFFSET_FMT * (num_bytes - POINT_WITH_ACCESS_SIZE) + REL_COORDS_FMT)
+
+
+def _circle_layout(num_bytes):
+    radius_size = num_bytes - CIRCLE_BASE_SIZE
+    if not 0 < radius_size <= len(RADIUS_FMT):
+        return None
+    return HEADER_FMT + ABS_COORDS_FMT + RADIUS_FMT[radius_size-1]
+
+
+def _rectangle_layout(num_bytes):
+    if num_bytes == LARGE_RECTANGLE_SIZE:
+        return HEADER_FMT + ABS_COORDS_FMT + ABS_COORDS_FMT
+    return HEADER_FMT + ABS_COORDS_FMT + REL_COORDS_FMT
+
+
+def _grid_layout(num_bytes):
+    if num_bytes == LARGE_GRID_SIZE:
+        return HEADER_FMT + ABS_COORDS_FMT + ABS_COORDS_FMT + GRID_DIMENSIONS_FMT
+    return HEADER_FMT + ABS_COORDS_FMT + REL_COORDS_FMT + GRID_DIMENSIONS_FMT
+
+
+# Trailing bytes that do not make a whole LRP or coordinates pair are
+# skipped ('x' pad bytes), as the bitstring backend ignores them
+
+def _closed_line_layout(num_bytes):
+    num_intermediates, trailing = divmod(num_bytes - MIN_BYTES_CLOSED_LINE_LOCATION, LRP_SIZE)
+    return HEADER_FMT + FIRST_LRP_FMT + LRP_FMT * num_intermediates + LAST_CLOSED_LINE_FMT + 'x' * trailing
+
+
+def _polygon_layout(num_bytes):
+    num_intermediates, trailing = divmod(num_bytes - MIN_BYTES_POLYGON, RELATIVE_COORD_SIZE)
+    return HEADER_FMT + ABS_COORDS_FMT + REL_COORDS_FMT * (2 + num_intermediates) + 'x' * trailing
+
+
+_LAYOUTS = {LocationType.LINE_LOCATION: _line_layout,
+            LocationType.POINT_ALONG_LINE: _point_along_line_layout,
+            LocationType.GEO_COORDINATES: _geo_coordinates_layout,
+            LocationType.POI_WITH_ACCESS_POINT: _poi_with_access_point_layout,
+            LocationType.CIRCLE: _circle_layout,
+            LocationType.RECTANGLE: _rectangle_layout,
+            LocationType.GRID: _grid_layout,
+            LocationType.CLOSED_LINE: _closed_line_layout,
+            LocationType.POLYGON: _polygon_layout}
+
+# Maximum number of cached read plans
+MAX_READ_PLANS = 1024
+
+_READ_PLANS = {}
+
+
+def read_plan(loc_type, num_bytes):
+    """ Return the precompiled struct reading a whole location reference
+        of the given type and size in one call.
+
+        :param int loc_type: Location type
+        :param int num_bytes: Size of the location reference, in bytes
+        :returns: Compiled layout, or None if the size does not match the location type
+        :rtype: struct.Struct
+    """
+    key = (loc_type, num_bytes)
+    try:
+        return _READ_PLANS[key]
+    except KeyError:
+        pass
+    layout = _LAYOUTS[loc_type](num_bytes)
+    plan = Struct('>' + layout) if layout is not None else None
+    if len(_READ_PLANS) < MAX_READ_PLANS:
+        _READ_PLANS[key] = plan
+    return plan
+
+
+# ----------------
+# Unpacked fields decoding
+# ----------------
+
+def _unpack_absolute_coordinates(v, i):
+    """ Decode absolute coordinates from unpacked fields
+
+        :param tuple v: Unpacked fields
+        :param int i: Index of the first coordinates field
+        :returns: Coordinates
+        :rtype: Coords
+    """
+    lon, lat = coordinates_values((v[i] << 8) | v[i+1], (v[i+2] << 8) | v[i+3])
+    return Coords(lon, lat)
+
+
+def _unpack_relative_coordinates(v, i, rel):
+    """ Decode relative coordinates from unpacked fields
+
+        :param tuple v: Unpacked fields
+        :param int i: Index of the first coordinates field
+        :param Coords rel: Reference coordinates
+        :returns: Coordinates
+        :rtype: Coords
+    """
+    lon, lat = rel_coordinates_values(rel, v[i], v[i+1])
+    return Coords(lon, lat)
+
+
+def _unpack_lrp(coords, attr1, attr2, dnp):
+    """ Build a location reference point from its attribute bytes
+
+        :param Coords coords: Coordinates of the point
+        :param int attr1: orientation, FRC, FOW
+        :param int attr2: lowest FRC to next LR-point, bearing
+        :param int dnp: distance interval to next LR-point
+        :returns: Location Reference Point
+        :rtype: LocationReferencePoint
+    """
+    return LocationReferencePoint(coords, attr2 & 0x1f, attr1 >> 6, (attr1 >> 3) & 0x7,
+                                  attr1 & 0x7, attr2 >> 5, DISTANCE_ESTIMATES[dnp])
+
+
+def _unpack_first_lrp(v, i):
+    """ Decode the first location reference point from unpacked fields
+        (laid out as FIRST_LRP_FMT)
+    """
+    return _unpack_lrp(_unpack_absolute_coordinates(v, i), v[i+4], v[i+5], v[i+6])
+
+
+def _unpack_intermediate_lrp(v, i, rel):
+    """ Decode an intermediate location reference point from unpacked fields
+        (laid out as LRP_FMT)
+    """
+    return _unpack_lrp(_unpack_relative_coordinates(v, i, rel.coords), v[i+2], v[i+3], v[i+4])
+
+
+def _unpack_last_line_lrp(v, i, rel):
+    """ Decode the last location reference point from unpacked fields
+        (laid out as LAST_LRP_FMT)
+
+        :param Coords rel: Reference coordinates
+        :returns: Location Reference Point, positive offset flag, negative offset flag
+        :rtype: LocationReferencePoint, int, int
+    """
+    coords = _unpack_relative_coordinates(v, i, rel)
+    attr1, attr4 = v[i+2], v[i+3]
+    lrp = LocationReferencePoint(coords, attr4 & 0x1f, attr1 >> 6, (attr1 >> 3) & 0x7,
+                                 attr1 & 0x7, None, None)
+    return lrp, (attr4 >> 6) & 0x1, (attr4 >> 5) & 0x1
+
+
+def _sum_relative_coordinates(v, i, count, rel):
+    """ Apply the relative coordinates of consecutive intermediate location
+        reference points (laid out as LRP_FMT), without decoding them.
+
+        :param tuple v: Unpacked fields
+        :param int i: Index of the first intermediate LRP
+        :param int count: Number of intermediate LRPs
+        :param Coords rel: Reference coordinates
+        :returns: Coordinates of the last intermediate LRP
+        :rtype: Coords
+    """
+    if not count:
+        return rel
+    lon, lat = rel
+    for j in xrange(i, i + count * LRP_FIELDS, LRP_FIELDS):
+        # Same operations as rel_coordinates_values
+        lon = lon + v[j] / DECA_MICRO_DEG_FACTOR
+        lat = lat + v[j+1] / DECA_MICRO_DEG_FACTOR
+    return Coords(lon, lat)
+
+
+def _unpack_last_closed_line_attrs(v, i):
+    """ Decode the last attributes of a closed line location
+        (laid out as LAST_CLOSED_LINE_FMT)
+
+        :returns: Functionnal Road Class, Form Of Way, bearing sector
+        :rtype: int, int, int
+    """
+    attr5, attr6 = v[i], v[i+1]
+    return (attr5 >> 3) & 0x7, attr5 & 0x7, attr6 & 0x1f
+
+
+def _offset_value(offs, version):
+    """ Convert an offset interval according to the binary version
+
+        :param int offs: Offset interval
+        :param int version: Binary version
+        :returns: Estimate distance (version 2) or percentage (version 3)
+    """
+    table = OFFSET_ESTIMATES.get(version)
+    return offs if table is None else table[offs]
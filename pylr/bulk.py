@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+''' Columnar bulk parser for fixed size location references
+
+    .. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+    Point along line, geo coordinates, POI with access point, rectangle,
+    grid and circle location references have a fixed byte size. A batch of
+    location references of the same type and size is decoded at once as an
+    uint8 matrix (one row per location), with vectorized shifts and masks.
+
+    Results are numpy structured arrays, with one column per field instead
+    of one namedtuple per location.
+
+    This module requires numpy.
+'''
+
+from collections import defaultdict
+import numpy as np
+
+from .constants import (BIT24FACTOR_REVERSED,
+                        DECA_MICRO_DEG_FACTOR,
+                        BINARY_VERSION_2,
+                        BINARY_VERSION_3,
+                        POINT_ALONG_LINE_SIZE,
+                        POINT_WITH_ACCESS_SIZE,
+                        LARGE_RECTANGLE_SIZE,
+                        LARGE_GRID_SIZE,
+                        CIRCLE_BASE_SIZE,
+                        LocationType)
+from .values import DISTANCE_ESTIMATES, RELATIVE_DISTANCES
+from .binary import read_plan
+from .parser import _HEADERS, _HEADER_STRUCT, _MIN_BYTES, _check_location_type, decode_base64_many
+
+
+''' The location types handled by the bulk parser '''
+FIXED_SIZE_TYPES = (LocationType.POINT_ALONG_LINE,
+                    LocationType.GEO_COORDINATES,
+                    LocationType.POI_WITH_ACCESS_POINT,
+                    LocationType.RECTANGLE,
+                    LocationType.GRID,
+                    LocationType.CIRCLE)
+
+# Columns of the first and last LRPs
+_LRP_COLUMNS = [('lon', np.float64),
+                ('lat', np.float64),
+                ('bear', np.uint8),
+                ('orient', np.uint8),
+                ('frc', np.uint8),
+                ('fow', np.uint8),
+                ('lfrcnp', np.uint8),
+                ('dnp', np.float64)]
+
+_LAST_LRP_COLUMNS = [('llrp_lon', np.float64),
+                     ('llrp_lat', np.float64),
+                     ('llrp_bear', np.uint8),
+                     ('llrp_orient', np.uint8),
+                     ('llrp_frc', np.uint8),
+                     ('llrp_fow', np.uint8)]
+
+_HEAD_COLUMNS = [('index', np.int64),
+                 ('version', np.uint8)]
+
+_BBOX_COLUMNS = [('minx', np.float64),
+                 ('miny', np.float64),
+                 ('maxx', np.float64),
+                 ('maxy', np.float64)]
+
+''' Structured array types of each location type '''
+DTYPES = {
+    LocationType.POINT_ALONG_LINE: np.dtype(_HEAD_COLUMNS + _LRP_COLUMNS + _LAST_LRP_COLUMNS +
+                                            [('poffs', np.float64)]),
+    LocationType.GEO_COORDINATES: np.dtype(_HEAD_COLUMNS + [('lon', np.float64),
+                                                            ('lat', np.float64)]),
+    LocationType.POI_WITH_ACCESS_POINT: np.dtype(_HEAD_COLUMNS + _LRP_COLUMNS + _LAST_LRP_COLUMNS +
+                                                 [('poffs', np.float64),
+                                                  ('poi_lon', np.float64),
+                                                  ('poi_lat', np.float64)]),
+    LocationType.RECTANGLE: np.dtype(_HEAD_COLUMNS + _BBOX_COLUMNS),
+    LocationType.GRID: np.dtype(_HEAD_COLUMNS + _BBOX_COLUMNS + [('cols', np.uint16),
+                                                                 ('rows', np.uint16)]),
+    LocationType.CIRCLE: np.dtype(_HEAD_COLUMNS + [('lon', np.float64),
+                                                   ('lat', np.float64),
+                                                   ('radius', np.uint32)]),
+}
+
+# Interval estimates, indexed by the encoded interval
+_DISTANCES = np.array(DISTANCE_ESTIMATES, dtype=np.float64)
+_RELATIVE_DISTANCES = np.array(RELATIVE_DISTANCES, dtype=np.float64)
+
+
+# ----------------
+# Vectorized field decoding
+# ----------------
+
+def _uint(m, j, size):
+    """ Read big endian unsigned integers of 'size' bytes, starting at column j """
+    v = m[:, j].astype(np.int64)
+    for k in range(j+1, j+size):
+        v = (v << 8) | m[:, k]
+    return v
+
+
+def _int(m, j, size):
+    """ Read big endian signed integers of 'size' bytes, starting at column j """
+    v = _uint(m, j, size)
+    nbits = 8 * size
+    return v - ((v >> (nbits - 1)) << nbits)
+
+
+def _degrees(v):
+    """ Vectorized :py:func:`pylr.values.coordinates_values` """
+    return (v - np.sign(v) * 0.5) * BIT24FACTOR_REVERSED
+
+
+def _absolute_coordinates(m, j):
+    return _degrees(_int(m, j, 3)), _degrees(_int(m, j+3, 3))
+
+
+def _relative_coordinates(m, j, lon, lat):
+    """ Vectorized :py:func:`pylr.values.rel_coordinates_values` """
+    return lon + _int(m, j, 2) / DECA_MICRO_DEG_FACTOR, lat + _int(m, j+2, 2) / DECA_MICRO_DEG_FACTOR
+
+
+def _offsets(offs, version):
+    """ Vectorized :py:func:`pylr.binary._offset_value` """
+    return np.where(version == BINARY_VERSION_2, _DISTANCES[offs],
+                    np.where(version == BINARY_VERSION_3, _RELATIVE_DISTANCES[offs], offs))
+
+
+def _first_lrp(t, m, j):
+    """ Decode the first LRP, starting at column j """
+    t['lon'], t['lat'] = _absolute_coordinates(m, j)
+    attr1, attr2 = m[:, j+6], m[:, j+7]
+    t['orient'] = attr1 >> 6
+    t['frc'] = (attr1 >> 3) & 0x7
+    t['fow'] = attr1 & 0x7
+    t['lfrcnp'] = attr2 >> 5
+    t['bear'] = attr2 & 0x1f
+    t['dnp'] = _DISTANCES[m[:, j+8]]
+
+
+def _last_line_lrp(t, m, j):
+    """ Decode the last LRP, starting at column j
+
+        :returns: positive offset flags
+    """
+    t['llrp_lon'], t['llrp_lat'] = _relative_coordinates(m, j, t['lon'], t['lat'])
+    attr1, attr4 = m[:, j+4], m[:, j+5]
+    t['llrp_orient'] = attr1 >> 6
+    t['llrp_frc'] = (attr1 >> 3) & 0x7
+    t['llrp_fow'] = attr1 & 0x7
+    t['llrp_bear'] = attr4 & 0x1f
+    return (attr4 >> 6) & 0x1
+
+
+def _point_along_line(t, m):
+    _first_lrp(t, m, 1)
+    pofff = _last_line_lrp(t, m, 10)
+    if m.shape[1] > POINT_ALONG_LINE_SIZE:
+        t['poffs'] = np.where(pofff, _offsets(m[:, 16], t['version']), 0)
+
+
+def _geo_coordinates(t, m):
+    t['lon'], t['lat'] = _absolute_coordinates(m, 1)
+
+
+def _poi_with_access_point(t, m):
+    _first_lrp(t, m, 1)
+    pofff = _last_line_lrp(t, m, 10)
+    j = 16
+    if m.shape[1] > POINT_WITH_ACCESS_SIZE:
+        t['poffs'] = np.where(pofff, _offsets(m[:, 16], t['version']), 0)
+        j += 1
+    t['poi_lon'], t['poi_lat'] = _relative_coordinates(m, j, t['lon'], t['lat'])
+
+
+def _bbox(t, m, large):
+    t['minx'], t['miny'] = _absolute_coordinates(m, 1)
+    if large:
+        t['maxx'], t['maxy'] = _absolute_coordinates(m, 7)
+        return 13
+    t['maxx'], t['maxy'] = _relative_coordinates(m, 7, t['minx'], t['miny'])
+    return 11
+
+
+def _rectangle(t, m):
+    _bbox(t, m, m.shape[1] == LARGE_RECTANGLE_SIZE)
+
+
+def _grid(t, m):
+    j = _bbox(t, m, m.shape[1] == LARGE_GRID_SIZE)
+    t['cols'] = _uint(m, j, 2)
+    t['rows'] = _uint(m, j+2, 2)
+
+
+def _circle(t, m):
+    t['lon'], t['lat'] = _absolute_coordinates(m, 1)
+    t['radius'] = _uint(m, 7, m.shape[1] - CIRCLE_BASE_SIZE)
+
+
+def _missing_offsets(loc_type, m):
+    """ Find the rows whose positive offset flag is set while the
+        location reference has no offset byte.
+
+        :returns: Boolean mask, or None if all rows are valid
+    """
+    if (loc_type == LocationType.POINT_ALONG_LINE and m.shape[1] == POINT_ALONG_LINE_SIZE or
+            loc_type == LocationType.POI_WITH_ACCESS_POINT and m.shape[1] == POINT_WITH_ACCESS_SIZE):
+        # attribute byte of the last LRP
+        mask = ((m[:, 15] >> 6) & 0x1).astype(bool)
+        if mask.any():
+            return mask
+    return None
+
+
+_DECODERS = {LocationType.POINT_ALONG_LINE: _point_along_line,
+             LocationType.GEO_COORDINATES: _geo_coordinates,
+             LocationType.POI_WITH_ACCESS_POINT: _poi_with_access_point,
+             LocationType.RECTANGLE: _rectangle,
+             LocationType.GRID: _grid,
+             LocationType.CIRCLE: _circle}
+
+
+# ----------------
+# Bulk parsers
+# ----------------
+
+def parse_matrix(loc_type, matrix):
+    """ Decode location references of the same type and size.
+
+        The matrix must hold one location reference per row, and must
+        have been validated (e.g. with :py:func:`pylr.parser.peek_location_type`
+        or :py:func:`parse_bulk`).
+
+        :param int loc_type: Location type, one of FIXED_SIZE_TYPES
+        :param matrix: uint8 array of shape (number of locations, location size)
+        :returns: Structured array (see DTYPES), the 'index' column holds the row numbers
+        :rtype: numpy.ndarray
+    """
+    m = np.asarray(matrix, dtype=np.uint8)
+    if m.ndim != 2:
+        raise ValueError("Expecting a 2 dimensions matrix")
+    t = np.zeros(m.shape[0], dtype=DTYPES[loc_type])
+    t['index'] = np.arange(m.shape[0])
+    t['version'] = m[:, 0] & 0x7
+    _DECODERS[loc_type](t, m)
+    return t
+
+
+def parse_bulk(payloads, base64=False):
+    """ Parse a batch of location references.
+
+        Location references are grouped by type and size, each group being
+        decoded at once by :py:func:`parse_matrix`. Location references with
+        a type not in FIXED_SIZE_TYPES, or invalid, are rejected.
+
+        :param payloads: iterable of strings (encoded or not) describing the locations
+        :param bool base64: True if encoded in base 64 (see :py:func:`pylr.parser.decode_base64_many`)
+        :returns: dict of structured arrays by location type, index of the rejected payloads.
+                  The 'index' column of the arrays holds the position of the payload in the input.
+        :rtype: dict, list
+    """
+    groups = defaultdict(list)
+    rejected = []
+
+    if base64:
+        decoded, spans = decode_base64_many(payloads)
+        payloads = (decoded[s[0]:s[0] + s[1]] if isinstance(s, tuple) else None for s in spans)
+
+    for i, data in enumerate(payloads):
+        if data is None:
+            rejected.append(i)
+            continue
+        sz = len(data)
+        if sz < _MIN_BYTES:
+            rejected.append(i)
+            continue
+        loc_type, error = _check_location_type(_HEADERS[_HEADER_STRUCT.unpack_from(data)[0]], sz)
+        if error is not None or loc_type not in _DECODERS:
+            rejected.append(i)
+            continue
+        plan = read_plan(loc_type, sz)
+        if plan is None or plan.size != sz:
+            rejected.append(i)
+            continue
+        groups[(loc_type, sz)].append((i, data))
+
+    tables = defaultdict(list)
+    for (loc_type, sz), items in groups.items():
+        index, data = zip(*items)
+        index = np.array(index, dtype=np.int64)
+        m = np.frombuffer(b''.join(data), dtype=np.uint8).reshape(-1, sz)
+        invalid = _missing_offsets(loc_type, m)
+        if invalid is not None:
+            rejected.extend(index[invalid].tolist())
+            index, m = index[~invalid], m[~invalid]
+        t = parse_matrix(loc_type, m)
+        t['index'] = index
+        tables[loc_type].append(t)
+
+    result = {}
+    for loc_type, parts in tables.items():
+        t = np.concatenate(parts)
+        result[loc_type] = t[np.argsort(t['index'], kind='mergesort')]
+
+    return result, sorted(rejected)
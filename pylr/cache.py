@@ -0,0 +1,391 @@
+# -*- coding: utf-8 -*-
+''' Cache of parsed locations and of candidate lines
+
+    .. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+    Feeds send the same location references many times. Location references
+    are identified by a canonical key (their decoded bytes), and parsed
+    locations are kept in a bounded LRU cache, so a repeated location
+    reference is parsed only once.
+
+    Many locations also share the same junctions: the candidate lines of an
+    LRP may be kept in a :py:class:`CandidateCache` given to the decoder, so
+    the map database is queried once per junction.
+'''
+
+import time
+from collections import namedtuple, OrderedDict
+from binascii import a2b_base64, Error as BinasciiError
+
+from .parser import (parse_binary,
+                     buffer_view,
+                     BinaryParseError,
+                     DEFAULT_BACKEND)
+
+
+''' Default maximum number of cached locations '''
+DEFAULT_CACHE_SIZE = 10000
+
+
+def location_key(data, base64=False):
+    """ Canonical key of a location reference: its decoded bytes.
+
+        Base64 encoded references are decoded, so references differing only by
+        their padding (or by unused trailing bits) have the same key.
+
+        :param data: string (encoded or not) describing the location, or any
+                     object supporting the buffer protocol
+        :param bool base64: True if encoded in base 64
+        :returns: Hashable key
+        :rtype: string
+        :raises BinaryParseError: if data is not valid base 64
+    """
+    if base64:
+        if not isinstance(data, basestring):
+            data = buffer_view(data).tobytes()
+        data = data.rstrip('=')
+        try:
+            return a2b_base64(data + '=' * (-len(data) % 4))
+        except (BinasciiError, UnicodeError) as e:
+            raise BinaryParseError("Invalid base64 data: {}".format(e))
+    if isinstance(data, str):
+        return data
+    return buffer_view(data).tobytes()
+
+
+CacheInfo = namedtuple('CacheInfo', ('hits', 'misses', 'maxsize', 'currsize'))
+
+
+class ParseCache(object):
+    """ LRU cache of parsed locations, in front of :py:func:`pylr.parser.parse_binary`.
+
+        Cached locations are shared between callers and must not be modified.
+        Parse errors are not cached.
+
+        :param int maxsize: Maximum number of cached locations
+        :param bool base64: True if location references are encoded in base 64
+        :param backend: Parser backend
+    """
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE, base64=False, backend=DEFAULT_BACKEND):
+        if maxsize < 1:
+            raise ValueError("Invalid cache size {}".format(maxsize))
+        self.maxsize = maxsize
+        self.base64 = base64
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self._locations = OrderedDict()
+
+    def parse(self, data):
+        """ Parse a location reference, or get it from the cache
+
+            :param data: string (encoded or not) describing the location
+            :returns: Object describing the location
+        """
+        key = location_key(data, self.base64)
+        locations = self._locations
+        try:
+            location = locations.pop(key)
+        except KeyError:
+            self.misses += 1
+            location = parse_binary(key, backend=self.backend)
+            if len(locations) >= self.maxsize:
+                locations.popitem(last=False)
+        else:
+            self.hits += 1
+        # Most recently used last
+        locations[key] = location
+        return location
+
+    __call__ = parse
+
+    def info(self):
+        """ Cache statistics
+
+            :rtype: CacheInfo
+        """
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._locations))
+
+    def clear(self):
+        """ Empty the cache and reset statistics """
+        self._locations.clear()
+        self.hits = self.misses = 0
+
+    def __len__(self):
+        return len(self._locations)
+
+    def __contains__(self, data):
+        return location_key(data, self.base64) in self._locations
+
+
+''' Default maximum number of LRPs with cached candidate lines '''
+DEFAULT_CANDIDATE_CACHE_SIZE = 100000
+
+''' Default resolution of the coordinates of cached LRPs (in degrees, about one meter) '''
+DEFAULT_CANDIDATE_RESOLUTION = 1e-5
+
+''' Default maximum number of line pairs with cached routes '''
+DEFAULT_ROUTE_CACHE_SIZE = 100000
+
+
+class _DecoderCache(object):
+    """ LRU cache of map database results, bounded by a number of entries and
+        by a total number of lines.
+
+        Entries expire after ttl seconds. The cache is emptied when the
+        version of the map database changes (see :py:meth:`check_version`).
+    """
+
+    def __init__(self, maxsize, max_lines=None, ttl=None, clock=time.time):
+        if maxsize < 1:
+            raise ValueError("Invalid cache size {}".format(maxsize))
+        self.maxsize = maxsize
+        self.max_lines = max_lines
+        self.ttl = ttl
+        self.clock = clock
+        self.map_version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.num_lines = 0
+        self._entries = OrderedDict()
+
+    def _lookup(self, key):
+        """ Cached value, None if not cached or expired """
+        entries = self._entries
+        try:
+            expires, num_lines, value = entries.pop(key)
+        except KeyError:
+            return None
+        if expires is not None and expires <= self.clock():
+            self.num_lines -= num_lines
+            return None
+        # Most recently used last
+        entries[key] = expires, num_lines, value
+        return value
+
+    def _store(self, key, value, num_lines):
+        entries = self._entries
+        if key in entries:
+            self.num_lines -= entries.pop(key)[1]
+        max_lines = self.max_lines
+        if max_lines is not None and num_lines > max_lines:
+            return
+        while entries and (len(entries) >= self.maxsize or
+                           max_lines is not None and self.num_lines + num_lines > max_lines):
+            self.num_lines -= entries.popitem(last=False)[1][1]
+            self.evictions += 1
+        expires = self.clock() + self.ttl if self.ttl is not None else None
+        entries[key] = expires, num_lines, value
+        self.num_lines += num_lines
+
+    def check_version(self, map_version):
+        """ Empty the cache if the version of the map database changed
+
+            :param map_version: Version of the map database
+            :returns: True if the cache was emptied
+        """
+        if map_version == self.map_version:
+            return False
+        if self._entries:
+            self.invalidations += 1
+        self._entries.clear()
+        self.num_lines = 0
+        self.map_version = map_version
+        return True
+
+    @property
+    def hit_rate(self):
+        """ Ratio of cache hits to lookups """
+        lookups = self.hits + self.misses
+        return self.hits / float(lookups) if lookups else 0.0
+
+    def info(self):
+        """ Cache statistics
+
+            :rtype: CacheInfo
+        """
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._entries))
+
+    def clear(self):
+        """ Empty the cache and reset statistics """
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = self.invalidations = self.num_lines = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class CandidateCache(_DecoderCache):
+    """ LRU cache of the candidate lines of LRPs, used by
+        :py:class:`pylr.decoder.ClassicDecoder`.
+
+        LRPs are identified by their coordinates, rounded to the given
+        resolution, by the attributes used for rating lines (bearing, frc
+        and fow) and by the search direction: LRPs differing by less than the
+        resolution share the candidate lines found for the first one.
+
+        Cached lines depend on the decoder settings: a cache must only be
+        used by decoders with the same settings and map database. Cached lists
+        are shared between callers and must not be modified.
+
+        :param int maxsize: Maximum number of cached LRPs
+        :param int max_lines: Maximum number of cached lines (default: no limit)
+        :param float ttl: Time to live of cached lines, in seconds (default: no expiry)
+        :param float resolution: Resolution of coordinates, in degrees
+        :param clock: Function returning the current time, in seconds
+    """
+
+    def __init__(self, maxsize=DEFAULT_CANDIDATE_CACHE_SIZE, max_lines=None, ttl=None,
+                 resolution=DEFAULT_CANDIDATE_RESOLUTION, clock=time.time):
+        if not resolution > 0:
+            raise ValueError("Invalid resolution {}".format(resolution))
+        super(CandidateCache, self).__init__(maxsize, max_lines, ttl, clock)
+        self.resolution = resolution
+
+    def key(self, lrp, beardir):
+        """ Cache key of the candidate lines of an LRP
+
+            :param LocationReferencePoint lrp: Location reference point
+            :param int beardir: Search direction
+            :returns: Hashable key
+        """
+        lon, lat = lrp.coords
+        resolution = self.resolution
+        return (int(round(lon / resolution)), int(round(lat / resolution)),
+                lrp.bear, lrp.frc, lrp.fow, beardir)
+
+    def get(self, key):
+        """ Cached candidate lines
+
+            :returns: list of (line, rating), None if not cached or expired
+        """
+        lines = self._lookup(key)
+        if lines is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return lines
+
+    def put(self, key, lines):
+        """ Cache candidate lines
+
+            :param lines: list of (line, rating)
+        """
+        self._store(key, lines, len(lines))
+
+
+class RouteCache(_DecoderCache):
+    """ LRU cache of the routes computed by
+        :py:meth:`pylr.decoder.MapDatabase.calculate_route`, used by
+        :py:class:`pylr.decoder.ClassicDecoder`.
+
+        Routes are identified by the ids of the start and end lines, the
+        lowest frc allowed and the last LRP flag. As routes are shortest
+        paths, a route of length L found with any distance bound is the
+        result for all bounds greater than L, and no route exists for bounds
+        lower than L. A search failing with a distance bound fails with all
+        lower bounds.
+
+        The start and end lines of a route depend on the LRP projections
+        (see ``projected_len``): only the lines between them are cached, and
+        routes are rebuilt with the start and end lines of each call.
+
+        :param int maxsize: Maximum number of cached line pairs
+        :param int max_lines: Maximum number of lines in cached routes (default: no limit)
+        :param float ttl: Time to live of cached routes, in seconds (default: no expiry)
+        :param clock: Function returning the current time, in seconds
+    """
+
+    def __init__(self, maxsize=DEFAULT_ROUTE_CACHE_SIZE, max_lines=None, ttl=None, clock=time.time):
+        super(RouteCache, self).__init__(maxsize, max_lines, ttl, clock)
+
+    def _cached(self, key, maxdist):
+        """ Look for a cached answer
+
+            :returns: True and the cached route (None if no route is shorter than maxdist),
+                      or False and None if the answer is not known
+        """
+        entry = self._lookup(key)
+        if entry is not None:
+            route, unreachable = entry
+            if route is not None:
+                self.hits += 1
+                return True, (route if route[3] <= maxdist else None)
+            if maxdist <= unreachable:
+                self.hits += 1
+                return True, None
+        self.misses += 1
+        return False, None
+
+    def _store_route(self, key, route, maxdist, l1, l2):
+        """ Cache a route, without its start and end lines
+
+            :returns: the cached route
+        """
+        if route is None:
+            self._store(key, (None, maxdist), 0)
+            return None
+        lines, length = route
+        lines = tuple(lines)
+        head = bool(lines) and lines[0].id == l1.id
+        tail = len(lines) > head and lines[-1].id == l2.id
+        route = (head, lines[head:len(lines) - tail], tail, length)
+        self._store(key, (route, None), len(lines))
+        return route
+
+    @staticmethod
+    def _route(route, l1, l2):
+        """ Rebuild a cached route with the given start and end lines """
+        head, inner, tail, length = route
+        return ((l1,) if head else ()) + inner + ((l2,) if tail else ()), length
+
+    def calculate_route(self, map_database, l1, l2, maxdist, lfrc, islastrp):
+        """ Calculate the shortest path between two lines, or get it from the
+            cache. Arguments and results are the ones of
+            :py:meth:`pylr.decoder.MapDatabase.calculate_route`; the route
+            is returned as a tuple of lines.
+
+            :raises RouteNotFoundException: if no route is shorter than maxdist
+        """
+        # The decoder is only imported by decoding processes
+        from .decoder import RouteNotFoundException
+
+        key = (l1.id, l2.id, lfrc, islastrp)
+        known, route = self._cached(key, maxdist)
+        if not known:
+            try:
+                route = map_database.calculate_route(l1, l2, maxdist, lfrc, islastrp)
+            except RouteNotFoundException:
+                self._store_route(key, None, maxdist, l1, l2)
+                raise
+            route = self._store_route(key, route, maxdist, l1, l2)
+        if route is None:
+            raise RouteNotFoundException("openlr: no route from {} to {} within {}".format(l1.id, l2.id, maxdist))
+        return self._route(route, l1, l2)
+
+    def calculate_routes(self, map_database, l1, targets, maxdist, lfrc, islastrp):
+        """ Calculate the shortest paths from one line to several lines, or get
+            them from the cache. Arguments and results are the ones of
+            :py:meth:`pylr.decoder.MapDatabase.calculate_routes`: the map
+            database is only queried for the routes not cached. Cached
+            routes start with l1 and end with the target lines given.
+        """
+        routes = {}
+        missing = []
+        for l2 in targets:
+            key = (l1.id, l2.id, lfrc, islastrp)
+            known, route = self._cached(key, maxdist)
+            if not known:
+                missing.append((key, l2))
+            elif route is not None:
+                routes[l2.id] = self._route(route, l1, l2)
+        if missing:
+            found = map_database.calculate_routes(l1, [l2 for _, l2 in missing], maxdist, lfrc, islastrp)
+            for key, l2 in missing:
+                route = self._store_route(key, found.get(l2.id), maxdist, l1, l2)
+                if route is not None:
+                    routes[l2.id] = self._route(route, l1, l2)
+        return routes
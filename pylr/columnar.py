@@ -0,0 +1,508 @@
+# -*- coding: utf-8 -*-
+''' Columnar storage of parsed locations
+
+    .. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+    A batch of parsed locations (of any types) is converted to a dict of
+    numpy arrays, which may be saved as ``.npz`` archives or as a directory
+    of ``.npy`` files. The ``.npy`` files can be memory-mapped back, so
+    large batches are available at once, without parsing the location
+    references again.
+
+    Columns are organized in three tables:
+
+    * the location table, one row per location: ``type``, ``version``,
+      ``poffs``, ``noffs``, ``radius`` (circle), ``cols``, ``rows`` (grid),
+      ``frc``, ``fow``, ``bear`` (last line of closed lines). Unused values
+      are 0.
+    * the LRP table: ``lrp_lon``, ``lrp_lat``, ``lrp_bear``, ``lrp_orient``,
+      ``lrp_frc``, ``lrp_fow``, ``lrp_lfrcnp``, ``lrp_dnp``. The last LRP of
+      a location has no distance to next point: its ``lrp_dnp`` is NaN.
+    * the coordinates table: ``coord_lon``, ``coord_lat``, holding the
+      coordinates of geo coordinates, circle, POI (point of interest),
+      rectangle and grid (lower left then upper right corners) and polygon
+      locations.
+
+    The LRPs of location i are the rows ``lrp_offsets[i]`` to
+    ``lrp_offsets[i+1]`` of the LRP table (first LRP, intermediate LRPs, last
+    LRP), and its coordinates the rows ``coord_offsets[i]`` to
+    ``coord_offsets[i+1]`` of the coordinates table.
+
+    :py:func:`reject_mask_columns` checks the columns with the checks of
+    :py:mod:`pylr.validation`, applied to whole columns.
+
+    This module requires numpy.
+'''
+
+import os
+from itertools import izip
+import numpy as np
+
+from .constants import LocationType, BINARY_VERSION_2, BINARY_VERSION_3
+from .binary import Coords, LocationReferencePoint
+from .parser import (LineLocation,
+                     PointAlongLineLocation,
+                     GeoCoordinateLocation,
+                     PoiWithAccessPointLocation,
+                     CircleLocation,
+                     RectangleLocation,
+                     GridLocation,
+                     ClosedLineLocation,
+                     PolygonLocation,
+                     BBox)
+from .spatial import distances
+from .validation import (DNP_TOLERANCE,
+                         MAX_DNP,
+                         MAX_RELATIVE_OFFSET,
+                         BEARING_SECTORS,
+                         FRC_COUNT,
+                         FOW_COUNT)
+
+
+''' Columns of the location table '''
+LOCATION_COLUMNS = [('type', np.uint8),
+                    ('version', np.uint8),
+                    ('poffs', np.float64),
+                    ('noffs', np.float64),
+                    ('radius', np.uint32),
+                    ('cols', np.uint16),
+                    ('rows', np.uint16),
+                    ('frc', np.uint8),
+                    ('fow', np.uint8),
+                    ('bear', np.uint8)]
+
+''' Columns of the LRP table '''
+LRP_COLUMNS = [('lrp_lon', np.float64),
+               ('lrp_lat', np.float64),
+               ('lrp_bear', np.uint8),
+               ('lrp_orient', np.uint8),
+               ('lrp_frc', np.uint8),
+               ('lrp_fow', np.uint8),
+               ('lrp_lfrcnp', np.uint8),
+               ('lrp_dnp', np.float64)]
+
+''' Columns of the coordinates table '''
+COORD_COLUMNS = [('coord_lon', np.float64),
+                 ('coord_lat', np.float64)]
+
+''' Row offsets of the LRPs and coordinates of each location '''
+OFFSET_COLUMNS = [('lrp_offsets', np.int64),
+                  ('coord_offsets', np.int64)]
+
+''' All the columns, with their types '''
+COLUMNS = LOCATION_COLUMNS + LRP_COLUMNS + COORD_COLUMNS + OFFSET_COLUMNS
+
+_NAN = float('nan')
+
+
+# ----------------
+# Locations to columns
+# ----------------
+
+class _ColumnsBuilder(object):
+    """ Accumulate the values of the columns in lists """
+
+    def __init__(self):
+        self.values = dict((name, []) for name, _ in COLUMNS)
+        self.values['lrp_offsets'].append(0)
+        self.values['coord_offsets'].append(0)
+        self.nlrps = 0
+        self.ncoords = 0
+
+    def add_lrps(self, lrps):
+        v = self.values
+        for p in lrps:
+            v['lrp_lon'].append(p.coords.lon)
+            v['lrp_lat'].append(p.coords.lat)
+            v['lrp_bear'].append(p.bear)
+            v['lrp_orient'].append(p.orient)
+            v['lrp_frc'].append(p.frc)
+            v['lrp_fow'].append(p.fow)
+            if p.dnp is None:
+                v['lrp_lfrcnp'].append(0)
+                v['lrp_dnp'].append(_NAN)
+            else:
+                v['lrp_lfrcnp'].append(p.lfrcnp)
+                v['lrp_dnp'].append(p.dnp)
+            self.nlrps += 1
+
+    def add_coords(self, coords):
+        v = self.values
+        for c in coords:
+            v['coord_lon'].append(c.lon)
+            v['coord_lat'].append(c.lat)
+            self.ncoords += 1
+
+    def add(self, location, poffs=0, noffs=0, radius=0, cols=0, rows=0, frc=0, fow=0, bear=0):
+        v = self.values
+        v['type'].append(location.type)
+        v['version'].append(location.version)
+        v['poffs'].append(poffs)
+        v['noffs'].append(noffs)
+        v['radius'].append(radius)
+        v['cols'].append(cols)
+        v['rows'].append(rows)
+        v['frc'].append(frc)
+        v['fow'].append(fow)
+        v['bear'].append(bear)
+        v['lrp_offsets'].append(self.nlrps)
+        v['coord_offsets'].append(self.ncoords)
+
+    def columns(self):
+        v = self.values
+        return dict((name, np.array(v[name], dtype=dtype)) for name, dtype in COLUMNS)
+
+
+def _add_line(b, loc):
+    b.add_lrps([loc.flrp])
+    b.add_lrps(loc.points)
+    b.add_lrps([loc.llrp])
+    b.add(loc, poffs=loc.poffs, noffs=loc.noffs)
+
+
+def _add_point_along_line(b, loc):
+    b.add_lrps((loc.flrp, loc.llrp))
+    b.add(loc, poffs=loc.poffs)
+
+
+def _add_geo_coordinates(b, loc):
+    b.add_coords((loc.coords,))
+    b.add(loc)
+
+
+def _add_poi_with_access_point(b, loc):
+    b.add_lrps((loc.flrp, loc.llrp))
+    b.add_coords((loc.coords,))
+    b.add(loc, poffs=loc.poffs)
+
+
+def _add_circle(b, loc):
+    b.add_coords((loc.coords,))
+    b.add(loc, radius=loc.radius)
+
+
+def _add_bbox(b, bbox):
+    b.add_coords((Coords(bbox.minx, bbox.miny), Coords(bbox.maxx, bbox.maxy)))
+
+
+def _add_rectangle(b, loc):
+    _add_bbox(b, loc.bbox)
+    b.add(loc)
+
+
+def _add_grid(b, loc):
+    _add_bbox(b, loc.bbox)
+    b.add(loc, cols=loc.cols, rows=loc.rows)
+
+
+def _add_closed_line(b, loc):
+    b.add_lrps([loc.flrp])
+    b.add_lrps(loc.points)
+    b.add(loc, frc=loc.frc, fow=loc.fow, bear=loc.bear)
+
+
+def _add_polygon(b, loc):
+    b.add_coords(loc.points)
+    b.add(loc)
+
+
+_WRITERS = {LocationType.LINE_LOCATION: _add_line,
+            LocationType.POINT_ALONG_LINE: _add_point_along_line,
+            LocationType.GEO_COORDINATES: _add_geo_coordinates,
+            LocationType.POI_WITH_ACCESS_POINT: _add_poi_with_access_point,
+            LocationType.CIRCLE: _add_circle,
+            LocationType.RECTANGLE: _add_rectangle,
+            LocationType.GRID: _add_grid,
+            LocationType.CLOSED_LINE: _add_closed_line,
+            LocationType.POLYGON: _add_polygon}
+
+
+def to_columns(locations):
+    """ Convert parsed locations to columns
+
+        :param locations: iterable of objects describing the locations, as
+                          returned by :py:func:`pylr.parser.parse_binary`
+        :returns: dict of arrays by column name (see COLUMNS)
+        :rtype: dict
+        :raises ValueError: if a location has an unknown type
+    """
+    b = _ColumnsBuilder()
+    for loc in locations:
+        try:
+            writer = _WRITERS[loc.type]
+        except KeyError:
+            raise ValueError("Unknown location type {}".format(loc.type))
+        writer(b, loc)
+    return b.columns()
+
+
+# ----------------
+# Columns to locations
+# ----------------
+#
+# Readers get the Python values of the needed rows (v), the LRPs of the
+# needed rows (lrps), the location row (i), and the row ranges of its LRPs and
+# coordinates.
+
+def _lrps(columns):
+    """ LRPs of the LRP table rows """
+    lrps = []
+    for lon, lat, bear, orient, frc, fow, lfrcnp, dnp in izip(*columns):
+        if dnp != dnp:
+            # NaN: last LRP
+            lfrcnp = dnp = None
+        lrps.append(LocationReferencePoint(Coords(lon, lat), bear, orient, frc, fow, lfrcnp, dnp))
+    return lrps
+
+
+def _coords(v, j):
+    return Coords(v['coord_lon'][j], v['coord_lat'][j])
+
+
+def _bbox(v, j):
+    return BBox(v['coord_lon'][j], v['coord_lat'][j], v['coord_lon'][j + 1], v['coord_lat'][j + 1])
+
+
+def _read_line(v, lrps, i, (a, z), coords):
+    return LineLocation(v['version'][i], v['type'][i], lrps[a], lrps[z - 1],
+                        lrps[a + 1:z - 1], v['poffs'][i], v['noffs'][i])
+
+
+def _read_point_along_line(v, lrps, i, (a, _), coords):
+    return PointAlongLineLocation(v['version'][i], v['type'][i], lrps[a], lrps[a + 1],
+                                  v['poffs'][i])
+
+
+def _read_geo_coordinates(v, lrps, i, _, (c, _z)):
+    return GeoCoordinateLocation(v['version'][i], v['type'][i], _coords(v, c))
+
+
+def _read_poi_with_access_point(v, lrps, i, (a, _), (c, _z)):
+    return PoiWithAccessPointLocation(v['version'][i], v['type'][i], lrps[a], lrps[a + 1],
+                                      v['poffs'][i], _coords(v, c))
+
+
+def _read_circle(v, lrps, i, _, (c, _z)):
+    return CircleLocation(v['version'][i], v['type'][i], _coords(v, c), v['radius'][i])
+
+
+def _read_rectangle(v, lrps, i, _, (c, _z)):
+    return RectangleLocation(v['version'][i], v['type'][i], _bbox(v, c))
+
+
+def _read_grid(v, lrps, i, _, (c, _z)):
+    return GridLocation(v['version'][i], v['type'][i], _bbox(v, c), v['cols'][i], v['rows'][i])
+
+
+def _read_closed_line(v, lrps, i, (a, z), coords):
+    return ClosedLineLocation(v['version'][i], v['type'][i], lrps[a],
+                              lrps[a + 1:z], v['frc'][i], v['fow'][i], v['bear'][i])
+
+
+def _read_polygon(v, lrps, i, _, (c, z)):
+    return PolygonLocation(v['version'][i], v['type'][i], [_coords(v, j) for j in xrange(c, z)])
+
+
+_READERS = {LocationType.LINE_LOCATION: _read_line,
+            LocationType.POINT_ALONG_LINE: _read_point_along_line,
+            LocationType.GEO_COORDINATES: _read_geo_coordinates,
+            LocationType.POI_WITH_ACCESS_POINT: _read_poi_with_access_point,
+            LocationType.CIRCLE: _read_circle,
+            LocationType.RECTANGLE: _read_rectangle,
+            LocationType.GRID: _read_grid,
+            LocationType.CLOSED_LINE: _read_closed_line,
+            LocationType.POLYGON: _read_polygon}
+
+
+def from_columns(columns, start=0, stop=None):
+    """ Convert columns back to locations.
+
+        Only the rows of the requested locations are read, so a slice of
+        memory-mapped columns is converted without loading the whole files.
+        Offsets are given as floats.
+
+        :param dict columns: dict of arrays by column name, as returned by
+                             :py:func:`to_columns` or :py:func:`load_columns`
+        :param int start: Index of the first location
+        :param int stop: Index after the last location (default: all locations)
+        :returns: list of objects describing the locations
+        :rtype: list
+    """
+    start, stop, _ = slice(start, stop).indices(len(columns['type']))
+    if start >= stop:
+        return []
+    lrp_offsets = columns['lrp_offsets'][start:stop + 1].tolist()
+    coord_offsets = columns['coord_offsets'][start:stop + 1].tolist()
+    la, lz = lrp_offsets[0], lrp_offsets[-1]
+    ca, cz = coord_offsets[0], coord_offsets[-1]
+
+    # Python values of the needed rows, indexed from the first needed row
+    v = dict((name, columns[name][start:stop].tolist()) for name, _ in LOCATION_COLUMNS)
+    v.update((name, columns[name][ca:cz].tolist()) for name, _ in COORD_COLUMNS)
+    lrps = _lrps([columns[name][la:lz].tolist() for name, _ in LRP_COLUMNS])
+
+    return [_READERS[t](v, lrps, i,
+                        (lrp_offsets[i] - la, lrp_offsets[i + 1] - la),
+                        (coord_offsets[i] - ca, coord_offsets[i + 1] - ca))
+            for i, t in enumerate(v['type'])]
+
+
+# ----------------
+# Files
+# ----------------
+
+def _check_columns(columns):
+    missing = [name for name, _ in COLUMNS if name not in columns]
+    if missing:
+        raise ValueError("Missing columns: {}".format(', '.join(missing)))
+
+
+def save_npz(f, columns, compressed=False):
+    """ Save columns in a ``.npz`` archive
+
+        :param f: File name or file object
+        :param dict columns: dict of arrays by column name
+        :param bool compressed: True to compress the archive
+    """
+    _check_columns(columns)
+    save = np.savez_compressed if compressed else np.savez
+    save(f, **dict((name, columns[name]) for name, _ in COLUMNS))
+
+
+def save_npy(directory, columns):
+    """ Save columns as ``.npy`` files (one per column), which may be
+        memory-mapped by :py:func:`load_columns`
+
+        :param str directory: Directory of the files, created if needed
+        :param dict columns: dict of arrays by column name
+    """
+    _check_columns(columns)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for name, dtype in COLUMNS:
+        np.save(os.path.join(directory, name + '.npy'), np.asarray(columns[name], dtype=dtype))
+
+
+def load_columns(path, mmap_mode='r'):
+    """ Load columns saved by :py:func:`save_npz` or :py:func:`save_npy`
+
+        :param path: ``.npz`` archive (file name or file object), or directory
+                     of ``.npy`` files
+        :param mmap_mode: Memory-map mode of ``.npy`` files (see
+                          :py:func:`numpy.load`), None to read them. ``.npz``
+                          archives are always read.
+        :returns: dict of arrays by column name
+        :rtype: dict
+        :raises ValueError: if columns are missing
+    """
+    if isinstance(path, basestring) and os.path.isdir(path):
+        columns = {}
+        for name, _ in COLUMNS:
+            filename = os.path.join(path, name + '.npy')
+            if os.path.exists(filename):
+                columns[name] = np.load(filename, mmap_mode=mmap_mode)
+    else:
+        archive = np.load(path)
+        try:
+            columns = dict((name, archive[name]) for name in archive.files)
+        finally:
+            archive.close()
+    _check_columns(columns)
+    return columns
+
+
+# ----------------
+# Validation
+# ----------------
+
+def _invalid_coords(lon, lat):
+    return ~((np.abs(lon) <= 180.0) & (np.abs(lat) <= 90.0))
+
+
+def _invalid_lrps(c, lrp_offsets, lrp_owner, tolerance):
+    """ Check the LRP table
+
+        :returns: Boolean mask of the invalid LRPs
+    """
+    m = len(lrp_owner)
+    lon, lat, dnp, frc, lfrcnp = c['lrp_lon'], c['lrp_lat'], c['lrp_dnp'], c['lrp_frc'], c['lrp_lfrcnp']
+    last = np.isnan(dnp)
+
+    # Last LRP of each location
+    end = np.zeros(m, dtype=bool)
+    end[lrp_offsets[1:][np.diff(lrp_offsets) > 0] - 1] = True
+
+    bad = _invalid_coords(lon, lat)
+    bad |= (c['lrp_bear'] >= BEARING_SECTORS) | (frc >= FRC_COUNT) | (c['lrp_fow'] >= FOW_COUNT)
+    # Only the last LRP of a line or point location has no distance to next point
+    bad |= last != (end & (c['type'][lrp_owner] != LocationType.CLOSED_LINE))
+    with np.errstate(invalid='ignore'):
+        bad |= ~last & ~((dnp > 0) & (dnp <= MAX_DNP))
+    bad |= ~last & ((lfrcnp < frc) | (lfrcnp >= FRC_COUNT))
+
+    # The next LRP of the last LRP of a closed line is its first LRP
+    nextlrp = np.arange(1, m + 1)
+    nextlrp[end] = lrp_offsets[:-1][lrp_owner[end]]
+    d = distances(lon, lat, lon[nextlrp], lat[nextlrp])
+    with np.errstate(invalid='ignore'):
+        bad |= ~last & (d > dnp + tolerance)
+    return bad
+
+
+def _invalid_offsets(c, lrp_offsets, tolerance):
+    """ Vectorized offset checks of line and point locations """
+    t, version, poffs, noffs = c['type'], c['version'], c['poffs'], c['noffs']
+    bad = (poffs < 0) | (noffs < 0)
+
+    v3 = version == BINARY_VERSION_3
+    bad |= v3 & ((poffs >= MAX_RELATIVE_OFFSET) | (noffs >= MAX_RELATIVE_OFFSET))
+    bad |= v3 & (np.diff(lrp_offsets) == 2) & (poffs + noffs >= MAX_RELATIVE_OFFSET)
+
+    v2 = np.flatnonzero((version == BINARY_VERSION_2) &
+                        np.in1d(t, (LocationType.LINE_LOCATION,
+                                    LocationType.POINT_ALONG_LINE,
+                                    LocationType.POI_WITH_ACCESS_POINT)) &
+                        (np.diff(lrp_offsets) >= 2))
+    dnp = c['lrp_dnp']
+    with np.errstate(invalid='ignore'):
+        bad[v2] |= ((poffs[v2] > dnp[lrp_offsets[v2]] + tolerance) |
+                    (noffs[v2] > dnp[lrp_offsets[v2 + 1] - 2] + tolerance))
+    return bad
+
+
+def reject_mask_columns(columns, tolerance=DNP_TOLERANCE):
+    """ Check locations stored as columns, with the checks of
+        :py:func:`pylr.validation.location_error` applied to whole columns.
+
+        :param dict columns: dict of arrays by column name
+        :param float tolerance: Tolerance on distances to next point (in meters)
+        :returns: Boolean mask, True for the rejected locations
+        :rtype: numpy.ndarray
+    """
+    c = columns
+    t = c['type']
+    n = len(t)
+    lrp_offsets = np.asarray(c['lrp_offsets'])
+    coord_offsets = np.asarray(c['coord_offsets'])
+    lrp_owner = np.repeat(np.arange(n), np.diff(lrp_offsets))
+    coord_owner = np.repeat(np.arange(n), np.diff(coord_offsets))
+
+    reject = ~np.in1d(c['version'], (BINARY_VERSION_2, BINARY_VERSION_3)) | ~np.in1d(t, list(_READERS))
+
+    reject[lrp_owner[_invalid_lrps(c, lrp_offsets, lrp_owner, tolerance)]] = True
+    reject |= _invalid_offsets(c, lrp_offsets, tolerance)
+
+    lon, lat = c['coord_lon'], c['coord_lat']
+    reject[coord_owner[_invalid_coords(lon, lat)]] = True
+
+    # Bounding boxes: lower left corner, then upper right corner
+    boxes = np.flatnonzero(np.in1d(t, (LocationType.RECTANGLE, LocationType.GRID)))
+    first = coord_offsets[boxes]
+    reject[boxes] |= (lon[first] > lon[first + 1]) | (lat[first] > lat[first + 1])
+
+    reject |= (t == LocationType.CIRCLE) & (c['radius'] == 0)
+    reject |= (t == LocationType.GRID) & ((c['cols'] == 0) | (c['rows'] == 0))
+    reject |= (t == LocationType.POLYGON) & (np.diff(coord_offsets) < 3)
+    reject |= (t == LocationType.CLOSED_LINE) & ((c['bear'] >= BEARING_SECTORS) | (c['frc'] >= FRC_COUNT) |
+                                                  (c['fow'] >= FOW_COUNT))
+    return reject
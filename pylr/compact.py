@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+''' Compact representation of parsed locations
+
+    .. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+    A parsed location holds one LocationReferencePoint namedtuple per LRP,
+    each with a nested Coords namedtuple and float values. The compact
+    locations defined here store instead, for each location:
+
+    * the raw 24 bits (first LRP) and 16 bits (other LRPs) coordinates in
+      one ``array('i')``,
+    * the raw attribute bytes of all LRPs (and offsets) in one string.
+
+    They expose the same attributes as the namedtuple locations. LRPs and
+    coordinates are converted on access, with the same operations as the
+    parser, and are not kept: the compact location stays compact.
+
+    Compact locations are meant for storing many locations; use
+    :py:meth:`expand` to get the usual namedtuple before decoding.
+'''
+
+from array import array
+from struct import Struct
+
+from .constants import (LocationType,
+                        DECA_MICRO_DEG_FACTOR,
+                        MIN_BYTES_LINE_LOCATION,
+                        LRP_SIZE)
+from .values import coordinates_values, DISTANCE_ESTIMATES
+from .binary import (Coords,
+                     LocationReferencePoint,
+                     _offset_value,
+                     FIRST_LRP_FIELDS,
+                     LRP_FIELDS,
+                     LAST_LRP_FIELDS,
+                     REL_COORDS_FIELDS)
+from .parser import (LineLocation,
+                     PointAlongLineLocation,
+                     PoiWithAccessPointLocation,
+                     init_binary_parsing,
+                     _FastBinaryData,
+                     BinaryParseError,
+                     InvalidDataSizeError)
+
+
+_ATTRS_SIZE = 3
+
+_ATTRS_STRUCT = Struct('>BBB')
+
+
+class _CompactLRPLocation(object):
+    """ Base class of compact locations defined by location reference points.
+
+        Coordinates are stored as [lon, lat] of the first LRP (24 bits values),
+        followed by the relative [lon, lat] of the next LRPs (16 bits values).
+        Attributes are stored as 3 bytes per LRP: (attr1, attr2, dnp) for all
+        LRPs but the last one, (attr1, attr4, 0) for the last one. The raw offsets
+        follow.
+    """
+
+    __slots__ = ('version', '_coords', '_attrs')
+
+    def __init__(self, version, coords, attrs):
+        self.version = version
+        self._coords = coords
+        self._attrs = attrs
+
+    @property
+    def _num_lrps(self):
+        return len(self._coords) // 2
+
+    def _lonlat(self, k):
+        """ Compute the coordinates of the k-th LRP """
+        c = self._coords
+        lon, lat = coordinates_values(c[0], c[1])
+        for j in xrange(2, 2 * k + 2, 2):
+            # Same operations as rel_coordinates_values
+            lon = lon + c[j] / DECA_MICRO_DEG_FACTOR
+            lat = lat + c[j+1] / DECA_MICRO_DEG_FACTOR
+        return Coords(lon, lat)
+
+    def _lrps(self, start, end):
+        """ Build the LRPs of index start to end (excluded).
+            Not applicable to the last LRP, which has other attributes.
+        """
+        c, attrs, result = self._coords, self._attrs, []
+        coords = self._lonlat(start)
+        for k in xrange(start, end):
+            if k > start:
+                coords = Coords(coords.lon + c[2*k] / DECA_MICRO_DEG_FACTOR,
+                                coords.lat + c[2*k+1] / DECA_MICRO_DEG_FACTOR)
+            attr1, attr2, dnp = _ATTRS_STRUCT.unpack_from(attrs, k * _ATTRS_SIZE)
+            result.append(LocationReferencePoint(coords, attr2 & 0x1f, attr1 >> 6, (attr1 >> 3) & 0x7,
+                                                 attr1 & 0x7, attr2 >> 5, DISTANCE_ESTIMATES[dnp]))
+        return result
+
+    @property
+    def flrp(self):
+        return self._lrps(0, 1)[0]
+
+    @property
+    def llrp(self):
+        k = self._num_lrps - 1
+        attr1, attr4, _ = _ATTRS_STRUCT.unpack_from(self._attrs, k * _ATTRS_SIZE)
+        return LocationReferencePoint(self._lonlat(k), attr4 & 0x1f, attr1 >> 6, (attr1 >> 3) & 0x7,
+                                      attr1 & 0x7, None, None)
+
+    def _offsets(self):
+        """ Decode the offsets following the attributes
+
+            :returns: positive offset, negative offset
+        """
+        k = self._num_lrps - 1
+        attr4 = ord(self._attrs[k * _ATTRS_SIZE + 1])
+        i = (k + 1) * _ATTRS_SIZE
+        poffs = noffs = 0
+        if (attr4 >> 6) & 0x1:
+            poffs = _offset_value(ord(self._attrs[i]), self.version)
+            i += 1
+        if (attr4 >> 5) & 0x1:
+            noffs = _offset_value(ord(self._attrs[i]), self.version)
+        return poffs, noffs
+
+    def __eq__(self, other):
+        return self.expand() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Compact' + repr(self.expand())
+
+    def __getstate__(self):
+        return self.version, self._coords, self._attrs
+
+    def __setstate__(self, state):
+        self.version, self._coords, self._attrs = state
+
+
+class CompactLineLocation(_CompactLRPLocation):
+    """ Compact version of :py:class:`pylr.parser.LineLocation` """
+
+    __slots__ = ()
+
+    type = LocationType.LINE_LOCATION
+
+    @property
+    def points(self):
+        return self._lrps(1, self._num_lrps - 1)
+
+    @property
+    def poffs(self):
+        return self._offsets()[0]
+
+    @property
+    def noffs(self):
+        return self._offsets()[1]
+
+    def expand(self):
+        """ Convert to a LineLocation """
+        poffs, noffs = self._offsets()
+        lrps = self._lrps(0, self._num_lrps - 1)
+        return LineLocation(self.version, self.type, lrps[0], self.llrp, lrps[1:], poffs, noffs)
+
+
+class CompactPointAlongLineLocation(_CompactLRPLocation):
+    """ Compact version of :py:class:`pylr.parser.PointAlongLineLocation` """
+
+    __slots__ = ()
+
+    type = LocationType.POINT_ALONG_LINE
+
+    @property
+    def poffs(self):
+        return self._offsets()[0]
+
+    def expand(self):
+        """ Convert to a PointAlongLineLocation """
+        return PointAlongLineLocation(self.version, self.type, self.flrp, self.llrp, self.poffs)
+
+
+class CompactPoiWithAccessPointLocation(_CompactLRPLocation):
+    """ Compact version of :py:class:`pylr.parser.PoiWithAccessPointLocation`.
+        The POI relative coordinates are stored after the ones of the LRPs.
+    """
+
+    __slots__ = ()
+
+    type = LocationType.POI_WITH_ACCESS_POINT
+
+    @property
+    def _num_lrps(self):
+        return len(self._coords) // 2 - 1
+
+    @property
+    def poffs(self):
+        return self._offsets()[0]
+
+    @property
+    def coords(self):
+        c = self._coords
+        flrp = self._lonlat(0)
+        return Coords(flrp.lon + c[-2] / DECA_MICRO_DEG_FACTOR, flrp.lat + c[-1] / DECA_MICRO_DEG_FACTOR)
+
+    def expand(self):
+        """ Convert to a PoiWithAccessPointLocation """
+        return PoiWithAccessPointLocation(self.version, self.type, self.flrp, self.llrp,
+                                          self.poffs, self.coords)
+
+
+# ----------------
+# Compact parsing
+# ----------------
+
+def _compact_lrps(v, num_intermediates):
+    """ Extract raw coordinates and attributes of the LRPs from unpacked fields
+
+        :returns: raw coordinates, raw attributes, index of the next field
+        :rtype: array, list, int
+    """
+    coords = array('i', ((v[1] << 8) | v[2], (v[3] << 8) | v[4]))
+    attrs = list(v[5:8])
+    i = 1 + FIRST_LRP_FIELDS
+    for _ in xrange(num_intermediates):
+        coords.extend(v[i:i+2])
+        attrs.extend(v[i+2:i+5])
+        i += LRP_FIELDS
+    coords.extend(v[i:i+2])
+    attrs.extend((v[i+2], v[i+3], 0))
+    return coords, attrs, i + LAST_LRP_FIELDS
+
+
+def _compact_line(rb, v):
+    num_intermediates = (rb.num_bytes - MIN_BYTES_LINE_LOCATION) // LRP_SIZE
+    coords, attrs, i = _compact_lrps(v, num_intermediates)
+    attrs.extend(v[i:])
+    return CompactLineLocation(rb.version, coords, array('B', attrs).tostring())
+
+
+def _compact_point_along_line(rb, v):
+    coords, attrs, i = _compact_lrps(v, 0)
+    attrs.extend(v[i:])
+    return CompactPointAlongLineLocation(rb.version, coords, array('B', attrs).tostring())
+
+
+def _compact_poi_with_access_point(rb, v):
+    coords, attrs, i = _compact_lrps(v, 0)
+    attrs.extend(v[i:-REL_COORDS_FIELDS])
+    coords.extend(v[-REL_COORDS_FIELDS:])
+    return CompactPoiWithAccessPointLocation(rb.version, coords, array('B', attrs).tostring())
+
+
+_COMPACT_PARSERS = {LocationType.LINE_LOCATION: _compact_line,
+                    LocationType.POINT_ALONG_LINE: _compact_point_along_line,
+                    LocationType.POI_WITH_ACCESS_POINT: _compact_poi_with_access_point}
+
+''' Location types having a compact representation '''
+COMPACT_TYPES = frozenset(_COMPACT_PARSERS)
+
+
+def parse_compact(data, base64=False):
+    """ Parse binary data into a compact location.
+
+        :param data: string (encoded or not) describing the location, or an
+                     object returned by init_binary_parsing(...)
+        :param bool base64: True if encoded in base 64
+        :returns: Compact location, for location types in COMPACT_TYPES
+        :raises BinaryParseError: For other location types
+    """
+    if not isinstance(data, _FastBinaryData):
+        data = init_binary_parsing(data, base64)
+    try:
+        parser = _COMPACT_PARSERS[data.location_type]
+    except KeyError:
+        raise BinaryParseError("No compact representation for location type {}".format(data.location_type))
+    location = parser(data, data.unpack())
+    # Check that the flagged offsets are present
+    try:
+        location._offsets()
+    except IndexError:
+        raise InvalidDataSizeError("not enough bytes for offsets")
+    return location
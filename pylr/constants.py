@@ -35,6 +35,9 @@ BIT24FACTOR_REVERSED = 1 / BIT24FACTOR
 ''' The BEARING_SECTOR defines the length of a bearing interval. '''
 BEARING_SECTOR = 11.25
 
+''' Number of bearing sectors '''
+BEARING_SECTORS = 32
+
 ''' The LENGTH_INTERVAL defines the length of a dnp and offset interval. '''
 LENGTH_INTERVAL = 58.6
 
@@ -10,13 +10,14 @@
 from __future__ import print_function
 
 from collections import namedtuple
-from itertools import ifilter, groupby, chain
+from itertools import ifilter, groupby, chain, izip, islice
 import rating as Rating
 from .constants import (LocationType,
                         WITH_LINE_DIRECTION,
                         AGAINST_LINE_DIRECTION,
                         BINARY_VERSION_2,
                         BINARY_VERSION_3)
+from .validation import location_error
 
 
 ''' The Max_ node_ distance '''
@@ -152,8 +153,13 @@ class MapDatabase(object):
         :py:class:`MapDatabase.Line`
 
         These structures may be extended by MapDatabase implementor accordings to their specific needs.          
+
+        Decoder caches are emptied when the :py:attr:`version` of the database changes.
     """
 
+    version = None
+    """ Version of the map data (None if unknown) """
+
     Node = namedtuple('Node', ('distance',))
     """
         .. attribute:: distance
@@ -240,6 +246,70 @@ class MapDatabase(object):
         """
         raise NotImplementedError("MapDatabase:calculate_route")
 
+    def calculate_routes(self, l1, targets, maxdist, lfrc, islastrp):
+        """ Calculate the shortest paths from one line to several lines
+
+            Optional: when implemented, the decoder settles all the candidate
+            lines of an LRP with a single search (e.g. one bounded Dijkstra
+            from l1), instead of one calculate_route call per candidate pair.
+
+            :param l1: the candidate line to begin the search from
+            :param targets: the candidate lines to stop the search to
+            :param maxdist: The maximum distance allowed
+            :param lfrc: The least frc allowed
+            :param islastrp: True if we are calculating the routes to the last
+            reference point
+            :return: a dict holding for each target line id reached within maxdist
+            a tuple (route, length), as returned by calculate_route. Target
+            lines not reached are omitted.
+        """
+        raise NotImplementedError("MapDatabase:calculate_routes")
+
+    # Batch requests: the decoder gathers the requests for all the LRPs of a
+    # location. The default implementations call the methods above for each
+    # request; databases with remote storage should override them.
+
+    def find_closeby_nodes_many(self, coords_list, max_node_dist):
+        """ Look for the nodes close to each of the given coordinates
+
+            :param coords_list: a sequence of coordinates
+            :param max_node_dist: max distance to search for nodes
+
+            return a list holding an iterable of Node objects for each coordinates
+        """
+        return [self.find_closeby_nodes(coords, max_node_dist) for coords in coords_list]
+
+    def connected_lines_many(self, requests):
+        """ Return the lines connected to several nodes
+
+            :param requests: a sequence of (node, frc_max, beardir) tuples, see
+            :py:meth:`connected_lines`
+
+            return a list holding an iterable of Line objects for each request
+        """
+        return [self.connected_lines(node, frc_max=frc_max, beardir=beardir)
+                for node, frc_max, beardir in requests]
+
+    def find_closeby_lines_many(self, requests, max_node_dist):
+        """ Look for the lines close to several coordinates
+
+            :param requests: a sequence of (coords, frc_max, beardir) tuples, see
+            :py:meth:`find_closeby_lines`
+            :param max_node_dist: max distance to search for lines
+
+            return a list holding an iterable of (Line, distance) for each request
+        """
+        return [self.find_closeby_lines(coords, max_node_dist, frc_max=frc_max, beardir=beardir)
+                for coords, frc_max, beardir in requests]
+
+
+def implements(map_database, name):
+    """ Check if a map database implements an optional method of
+        :py:class:`MapDatabase`
+    """
+    method = getattr(type(map_database), name, None)
+    return method is not None and getattr(method, 'im_func', method) is not MapDatabase.__dict__.get(name)
+
 # ----------------
 # Decoder
 # ----------------
@@ -341,6 +411,9 @@ class ClassicDecoder(DecoderBase, RatingCalculator):
                  minimum_acc_rating=MIN_ACC_RATING,
                  find_lines_directly=True,
                  max_retry=MAX_NR_RETRIES,
+                 validate=False,
+                 candidate_cache=None,
+                 route_cache=None,
                  verbose=False,
                  logger=lambda m: print(m)):
         """ Initialize the  decoder
@@ -353,6 +426,13 @@ class ClassicDecoder(DecoderBase, RatingCalculator):
                                     from lrp projection
             :param max_retry: maximum number of retry when searching for route
                 between consecutive lines
+            :param validate: opt-in: check locations (see :py:mod:`pylr.validation`)
+                before any map database access, and reject invalid ones with
+                DecoderInvalidLocation
+            :param candidate_cache: cache of candidate lines shared between
+                locations (see :py:class:`pylr.cache.CandidateCache`)
+            :param route_cache: cache of routes between lines shared between
+                locations (see :py:class:`pylr.cache.RouteCache`)
         """
         self._mdb = map_database
         self._max_node_dist = max_node_distance
@@ -360,6 +440,10 @@ class ClassicDecoder(DecoderBase, RatingCalculator):
         self._min_acc_rating = minimum_acc_rating
         self._max_retry = max_retry
         self._dnp_variance = dnp_variance
+        self.validate = validate
+        self.candidate_cache = candidate_cache
+        self.route_cache = route_cache
+        self._one_to_many = implements(map_database, 'calculate_routes')
         self.verbose = verbose
         self.find_lines_directly = find_lines_directly
         self.logger = logger
@@ -383,33 +467,125 @@ class ClassicDecoder(DecoderBase, RatingCalculator):
             The connectedlines method takes a 'beardir' argument indicating
             inwards (AGAINST_LINE_DIRECTION) or outwards (WITH_LINE_DIRECTION) arcs
         """
+        cache = self.candidate_cache
+        if cache is None or with_details:
+            return self._find_candidate_lines(lrp, beardir, with_details)
+        key = cache.key(lrp, beardir)
+        lines = cache.get(key)
+        if lines is None:
+            try:
+                lines = self._find_candidate_lines(lrp, beardir)
+            except DecoderNoCandidateLines:
+                lines = []
+            cache.put(key, lines)
+        if not lines:
+            raise DecoderNoCandidateLines("No candidate lines found....")
+        return lines
+
+    def _find_candidate_lines(self, lrp, beardir=WITH_LINE_DIRECTION, with_details=False):
         frc_max = lrp.frc + self._frc_var
         nodes = list(self.find_candidate_nodes(lrp))
 
+        connected = (self._mdb.connected_lines(n, frc_max=frc_max, beardir=beardir) for n in nodes)
+        direct = None
+        if self.find_lines_directly:
+            direct = self.find_candidate_lines_directly(lrp, frc_max=frc_max, alreadyfound=bool(nodes),
+                                                        beardir=beardir)
+        lines = self._select_candidates(lrp, nodes, connected, direct, with_details)
+        if not with_details and not lines:
+            raise DecoderNoCandidateLines("No candidate lines found....")
+        return lines
+
+    def _select_candidates(self, lrp, nodes, connected, direct, with_details=False):
+        """ Rate and sort the candidate lines of an LRP
+
+            :param nodes: the candidate nodes
+            :param connected: an iterable holding the lines connected to each node
+            :param direct: rated lines found directly, None if not searched
+        """
         rating_f = self.rating
         min_acc = self._min_acc_rating
 
         rating_key = lambda (l, r): r
         group_key = lambda (l, r): l.id
 
-        candidates = ((l, rating_f(lrp, l, n.distance)) for n in nodes for l in self._mdb.connected_lines(
-            n, frc_max=frc_max, beardir=beardir))
-        if self.find_lines_directly:
-            candidates = chain(candidates, self.find_candidate_lines_directly(
-                lrp, frc_max=frc_max, alreadyfound=bool(nodes), beardir=beardir))
+        candidates = ((l, rating_f(lrp, l, n.distance)) for n, lines in izip(nodes, connected) for l in lines)
+        if direct is not None:
+            candidates = chain(candidates, direct)
             candidates = (max(vals, key=rating_key) for k, vals in groupby(
                 sorted(candidates, key=group_key), key=group_key))
         if not with_details:
             candidates = ifilter(lambda (l, r): r >= min_acc, candidates)
         lines = sorted(candidates, key=rating_key, reverse=True)
-        if not with_details and not lines:
-            raise DecoderNoCandidateLines("No candidate lines found....")
 
         if with_details:
             lines = [(l, r, self.rating_details(lrp, l)) for l, r, in lines]
 
         return lines
 
+    def find_candidate_lines_many(self, lrps):
+        """ Find the candidate lines of several location reference points.
+            The map database is queried with batch requests: one for the
+            candidate nodes of all the LRPs, one for the lines connected to
+            all these nodes, and one for the lines found directly.
+
+            Subclasses overriding :py:meth:`find_candidate_lines`,
+            :py:meth:`find_candidate_nodes` or
+            :py:meth:`find_candidate_lines_directly` keep working:
+            :py:meth:`find_candidate_lines` is then called for each LRP.
+
+            :param lrps: an iterable holding tuples of (lrp, beardir)
+            :returns: a list holding the candidate lines of each LRP, as
+                      returned by :py:meth:`find_candidate_lines`
+            :raises DecoderNoCandidateLines: if an LRP has no candidate line
+        """
+        cls = type(self)
+        if any(getattr(cls, name).im_func is not getattr(ClassicDecoder, name).im_func
+               for name in ('find_candidate_lines', 'find_candidate_nodes', 'find_candidate_lines_directly')):
+            return [self.find_candidate_lines(lrp, beardir) for lrp, beardir in lrps]
+        lrps = list(lrps)
+        results = [None] * len(lrps)
+        cache = self.candidate_cache
+        missing = []
+        for i, (lrp, beardir) in enumerate(lrps):
+            key = None
+            if cache is not None:
+                key = cache.key(lrp, beardir)
+                results[i] = cache.get(key)
+            if results[i] is None:
+                missing.append((i, key))
+        if missing:
+            found = self._find_candidate_lines_many([lrps[i] for i, _ in missing])
+            for (i, key), lines in izip(missing, found):
+                if cache is not None:
+                    cache.put(key, lines)
+                results[i] = lines
+        if not all(results):
+            raise DecoderNoCandidateLines("No candidate lines found....")
+        return results
+
+    def _find_candidate_lines_many(self, lrps):
+        mdb = self._mdb
+        max_node_dist = self._max_node_dist
+        frc_maxs = [lrp.frc + self._frc_var for lrp, _ in lrps]
+
+        nodes = [list(n) for n in mdb.find_closeby_nodes_many([lrp.coords for lrp, _ in lrps], max_node_dist)]
+        connected = iter(mdb.connected_lines_many([(n, frc_max, beardir)
+                                                   for (_, beardir), frc_max, lrp_nodes in izip(lrps, frc_maxs, nodes)
+                                                   for n in lrp_nodes]))
+        if self.find_lines_directly:
+            direct = mdb.find_closeby_lines_many([(lrp.coords, frc_max, beardir)
+                                                  for (lrp, beardir), frc_max in izip(lrps, frc_maxs)], max_node_dist)
+        else:
+            direct = [None] * len(lrps)
+
+        results = []
+        for (lrp, _), lrp_nodes, lines in izip(lrps, nodes, direct):
+            if lines is not None:
+                lines = self._rate_lines_directly(lrp, lines, alreadyfound=bool(lrp_nodes))
+            results.append(self._select_candidates(lrp, lrp_nodes, islice(connected, len(lrp_nodes)), lines))
+        return results
+
     def find_candidate_lines_directly(self, lrp, frc_max, alreadyfound=False, beardir=WITH_LINE_DIRECTION):
         """ Find candidate lines directly if no node or line has been detected so
             far. This method tries to find all lines which are around the LRP
@@ -421,9 +597,11 @@ class ClassicDecoder(DecoderBase, RatingCalculator):
             :param lrp: the location reference point (having no candidate lines so far)
             :param alreadyfound: the already found lines
         """
-        rating_f = self.rating
-
         lines = self._mdb.find_closeby_lines(lrp.coords, self._max_node_dist, frc_max=frc_max, beardir=beardir)
+        return self._rate_lines_directly(lrp, lines, alreadyfound)
+
+    def _rate_lines_directly(self, lrp, lines, alreadyfound):
+        rating_f = self.rating
         for line, dist in lines:
             rating = rating_f(lrp, line, dist)
             if alreadyfound:
@@ -468,6 +646,8 @@ class ClassicDecoder(DecoderBase, RatingCalculator):
             islastrp = lrpnext is lastlrp
             pairs = sorted(calculate_pairs(lines, nextlines, lastline,
                            islastrp, islinelocation), key=lambda (p, r): r, reverse=True)
+            # routes from each start line, when searched at once
+            searched = {}
             # check candidate pairs
             for (l1, l2), _ in pairs[:nr_retry]:
                 if self.verbose:
@@ -482,7 +662,10 @@ class ClassicDecoder(DecoderBase, RatingCalculator):
                     break  # search finished
                 try:
                     # calculate route between start and end and a maximum distance
-                    route = self._calculate_route(l1, l2, lrp, islastrp)
+                    if self._one_to_many:
+                        route = self._searched_route(searched, pairs[:nr_retry], l1, l2, lrp, islastrp)
+                    else:
+                        route = self._calculate_route(l1, l2, lrp, islastrp)
                     # Handle change in start index
                     if lastline is not None and lastline.id != l1.id:
                         self._handle_start_change(routes, l1, lrp, prevlrp)
@@ -507,6 +690,20 @@ class ClassicDecoder(DecoderBase, RatingCalculator):
 
         return routes
 
+    def _searched_route(self, searched, pairs, l1, l2, lrp, islastrp):
+        """ Route between two lines, from a single search from l1 to all
+            the candidate pairs starting with l1
+        """
+        routes = searched.get(l1.id)
+        if routes is None:
+            targets = [p2 for (p1, p2), _ in pairs if p1.id == l1.id and p2.id != l1.id]
+            routes = searched[l1.id] = self._calculate_routes(l1, targets, lrp, islastrp)
+        try:
+            route, length = routes[l2.id]
+        except KeyError:
+            raise RouteNotFoundException("openlr: no route from {} to {}".format(l1.id, l2.id))
+        return self._checked_route(l1, l2, lrp, islastrp, route, length)
+
     def _handle_start_change(self, routes, lend, lrp, prevlrp):
         """ Recompute previous route using new end line
         """
@@ -516,36 +713,67 @@ class ClassicDecoder(DecoderBase, RatingCalculator):
         route = self._calculate_route(lstart, lend, prevlrp, islastrp=False)
         routes = routes[:-1] + (route, )
 
+    def _max_route_distance(self, l1, l2, lrp):
+        """ Maximum length of the route between two candidate lines
+        """
+        # Calculates the maximum allowed distance between two location reference
+        # points taking into account that at least one LRP might be projected onto
+        # a line and the maximum distance must be adjusted as the route calculation
+        # can only stop at distances between real nodes.
+        maxdist = lrp.dnp + self._dnp_variance
+        # check if LRPs were projected on line (i.e obtained directly)
+        # if yes, add line length to maxDistance (complete length as route
+        # search stops at nodes)
+        if l1.projected_len is not None:
+            maxdist += l1.len
+        if l2.projected_len is not None:
+            maxdist += l2.len
+        return maxdist
+
+    def _checked_route(self, l1, l2, lrp, islastrp, route, length):
+        """ Adjust and check the length of a route found by the map database
+        """
+        if l2.projected_len is not None:
+            if islastrp:
+                length -= l2.len
+            length += l2.projected_len
+        # check the minimum distance criteria
+        if max(0, lrp.dnp - self._dnp_variance) > length:
+            raise InvalidRouteLength("openlr: route: {} to {}, calculated length:{}, lrp:{}".format(
+                l1.id, l2.id, length, lrp))
+
+        return route, length
+
     def _calculate_route(self, l1, l2, lrp, islastrp):
-            """ Calculate shortest-path between two lines
-            """
-            # determine the minimum frc for the path to be calculated
-            lfrc = lrp.lfrcnp + self._frc_var
-            # Calculates the maximum allowed distance between two location reference
-            # points taking into account that at least one LRP might be projected onto
-            # a line and the maximum distance must be adjusted as the route calculation
-            # can only stop at distances between real nodes.
-            maxdist = lrp.dnp + self._dnp_variance
-            # check if LRPs were projected on line (i.e obtained directly)
-            # if yes, add line length to maxDistance (complete length as route
-            # search stops at nodes)
-            if l1.projected_len is not None:
-                maxdist += l1.len
-            if l2.projected_len is not None:
-                maxdist += l2.len
-            # calculate route between start and end and a maximum distance
+        """ Calculate shortest-path between two lines
+        """
+        # determine the minimum frc for the path to be calculated
+        lfrc = lrp.lfrcnp + self._frc_var
+        maxdist = self._max_route_distance(l1, l2, lrp)
+        # calculate route between start and end and a maximum distance
+        if self.route_cache is not None:
+            route, length = self.route_cache.calculate_route(self._mdb, l1, l2, maxdist, lfrc, islastrp)
+        else:
             route, length = self._mdb.calculate_route(l1, l2, maxdist, lfrc, islastrp)
-            # adjust and check the route length
-            if l2.projected_len is not None:
-                if islastrp:
-                    length -= l2.len
-                length += l2.projected_len
-            # check the minimum distance criteria
-            if max(0, lrp.dnp - self._dnp_variance) > length:
-                raise InvalidRouteLength("openlr: route: {} to {}, calculated length:{}, lrp:{}".format(
-                    l1.id, l2.id, length, lrp))
-
-            return route, length
+        return self._checked_route(l1, l2, lrp, islastrp, route, length)
+
+    def _calculate_routes(self, l1, targets, lrp, islastrp):
+        """ Calculate shortest-paths from one line to several lines with a
+            single search
+
+            :returns: a dict holding the (route, length) found for each target line id,
+                      before adjustment
+        """
+        lfrc = lrp.lfrcnp + self._frc_var
+        maxdists = dict((l2.id, self._max_route_distance(l1, l2, lrp)) for l2 in targets)
+        maxdist = max(maxdists.itervalues())
+        if self.route_cache is not None:
+            routes = self.route_cache.calculate_routes(self._mdb, l1, targets, maxdist, lfrc, islastrp)
+        else:
+            routes = self._mdb.calculate_routes(l1, targets, maxdist, lfrc, islastrp)
+        # The search bound is the largest one: check the bound of each target
+        return dict((lid, (route, length)) for lid, (route, length) in routes.iteritems()
+                    if length <= maxdists.get(lid, maxdist))
 
     def calculate_offsets(self, location, routes):
         # Compute offsets
@@ -611,13 +839,11 @@ class ClassicDecoder(DecoderBase, RatingCalculator):
         """
         # assert location.type == LocationType.LINE_LOCATION
 
-        def candidates():
-            yield location.flrp, self.find_candidate_lines(location.flrp)
-            for lrp in location.points:
-                yield lrp, self.find_candidate_lines(lrp)
-            yield location.llrp, self.find_candidate_lines(location.llrp, AGAINST_LINE_DIRECTION)
+        lrps = [location.flrp] + list(location.points) + [location.llrp]
+        beardirs = [WITH_LINE_DIRECTION] * (len(lrps) - 1) + [AGAINST_LINE_DIRECTION]
+        candidates = zip(lrps, self.find_candidate_lines_many(zip(lrps, beardirs)))
 
-        routes = self.resolve_route(location, candidates())
+        routes = self.resolve_route(location, candidates)
         poff, noff = self.calculate_offsets(location, routes)
 
         route_length = sum(length for _, length in routes)
@@ -663,8 +889,9 @@ class ClassicDecoder(DecoderBase, RatingCalculator):
         """
         # assert location.type in (LocationType.POINT_LOCATION_TYPES, LocationType.POI_WITH_ACCESS_POINT)
 
-        routes = self.resolve_route(location, ((location.flrp, self.find_candidate_lines(location.flrp)),
-                                   (location.llrp, self.find_candidate_lines(location.llrp, AGAINST_LINE_DIRECTION))))
+        lrps = (location.flrp, location.llrp)
+        routes = self.resolve_route(location, zip(lrps, self.find_candidate_lines_many(
+            zip(lrps, (WITH_LINE_DIRECTION, AGAINST_LINE_DIRECTION)))))
 
         head, head_len = routes[0]
         lstart, lend = head[0], head[-1]
@@ -678,7 +905,11 @@ class ClassicDecoder(DecoderBase, RatingCalculator):
         if lend.projected_len is not None:
             prunedlen += lend.len - lend.projected_len
 
-        poff = round(location.poffs*(head_len-prunedlen)/100.0)+poff
+        if location.version == BINARY_VERSION_2:
+            # Offset in meters (XML locations)
+            poff += location.poffs
+        else:
+            poff = round(location.poffs*(head_len-prunedlen)/100.0)+poff
         if poff > head_len:
             poff = head_len
 
@@ -687,7 +918,27 @@ class ClassicDecoder(DecoderBase, RatingCalculator):
 
         return self._calculated_path(pruned, poff)
 
+    def check_location(self, location):
+        """ Check a location before decoding: the distance between LRPs
+            may exceed the distance to next point by dnp_variance
+
+            :raises DecoderInvalidLocation: if the location is not valid
+        """
+        error = location_error(location, self._dnp_variance)
+        if error is not None:
+            raise DecoderInvalidLocation(error)
+
+    def check_caches(self):
+        """ Empty the caches if the version of the map database changed """
+        version = getattr(self._mdb, 'version', None)
+        for cache in (self.candidate_cache, self.route_cache):
+            if cache is not None:
+                cache.check_version(version)
+
     def decode(self, location):
+        self.check_caches()
+        if self.validate:
+            self.check_location(location)
         if location.type == LocationType.LINE_LOCATION:
             return self.decode_line(location)
         else:
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+''' Binary encoder of location references
+
+    .. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+    Encode the locations returned by :py:func:`pylr.parser.parse_binary`
+    back to the binary physical format (version 2 or 3), with the field
+    layouts of :py:mod:`pylr.binary`.
+
+    Relative coordinates are computed from the coordinates the parser will
+    decode for the previous point, so encoding a parsed location gives back
+    the same location. The encoder is meant for round-trip checks and for
+    generating benchmark corpora (see :py:func:`iter_corpus`).
+'''
+
+import random
+from binascii import b2a_base64
+from itertools import izip
+from struct import Struct
+
+from .constants import (LocationType,
+                        BINARY_VERSION_2,
+                        BINARY_VERSION_3,
+                        BIT24FACTOR,
+                        DECA_MICRO_DEG_FACTOR,
+                        LENGTH_INTERVAL,
+                        RELATIVE_OFFSET_LENGTH,
+                        AREA_CODE_CIRCLE,
+                        AREA_CODE_RECTANGLE,
+                        AREA_CODE_POLYGON,
+                        AREA_CODE_CLOSEDLINE,
+                        MIN_BYTES_LINE_LOCATION,
+                        MIN_BYTES_CLOSED_LINE_LOCATION,
+                        MIN_BYTES_POLYGON,
+                        LRP_SIZE,
+                        RELATIVE_COORD_SIZE,
+                        GEOCOORD_SIZE,
+                        POINT_ALONG_LINE_SIZE,
+                        POINT_WITH_ACCESS_SIZE,
+                        RECTANGLE_SIZE,
+                        LARGE_RECTANGLE_SIZE,
+                        GRID_SIZE,
+                        LARGE_GRID_SIZE,
+                        CIRCLE_BASE_SIZE)
+from .utils import signum
+from .values import coordinates_values, DISTANCE_ESTIMATES
+from .binary import Coords, LocationReferencePoint, read_plan
+from .parser import (LineLocation,
+                     PointAlongLineLocation,
+                     GeoCoordinateLocation,
+                     PoiWithAccessPointLocation,
+                     CircleLocation,
+                     RectangleLocation,
+                     GridLocation,
+                     ClosedLineLocation,
+                     PolygonLocation,
+                     BBox,
+                     LENGTH_PREFIX_FMT)
+
+
+class EncoderError(Exception):
+    pass
+
+
+# ----------------
+# Fields encoding
+# ----------------
+
+def _header(version, arf, pf, af):
+    return ((arf >> 1) << 6) | (pf << 5) | ((arf & 1) << 4) | (af << 3) | version
+
+
+def _abs_value(deg):
+    """ Inverse of :py:func:`pylr.values._get32BitRepresentation`.
+        The small margin absorbs the rounding errors of decoded values.
+    """
+    v = int(deg * BIT24FACTOR + signum(deg) * (0.5 + 1e-9))
+    if not -(1 << 23) <= v < (1 << 23):
+        raise EncoderError("Coordinate out of range: {}".format(deg))
+    return v
+
+
+def _absolute_coordinates(coords):
+    """ Encode absolute coordinates
+
+        :returns: Fields laid out as ABS_COORDS_FMT, decoded coordinates
+        :rtype: list, Coords
+    """
+    lon, lat = _abs_value(coords.lon), _abs_value(coords.lat)
+    return [lon >> 8, lon & 0xff, lat >> 8, lat & 0xff], Coords(*coordinates_values(lon, lat))
+
+
+def _relative_coordinates(coords, rel):
+    """ Encode coordinates relative to the decoded coordinates 'rel'
+
+        :returns: Fields laid out as REL_COORDS_FMT, decoded coordinates
+        :rtype: list, Coords
+    """
+    dlon = int(round((coords.lon - rel.lon) * DECA_MICRO_DEG_FACTOR))
+    dlat = int(round((coords.lat - rel.lat) * DECA_MICRO_DEG_FACTOR))
+    if not (-0x8000 <= dlon < 0x8000 and -0x8000 <= dlat < 0x8000):
+        raise EncoderError("Relative coordinates out of range: {} from {}".format(coords, rel))
+    return [dlon, dlat], Coords(rel.lon + dlon / DECA_MICRO_DEG_FACTOR, rel.lat + dlat / DECA_MICRO_DEG_FACTOR)
+
+
+def _interval(value, length):
+    return min(max(int(value / length), 0), 255)
+
+
+def _attr1(lrp):
+    return (lrp.orient << 6) | (lrp.frc << 3) | lrp.fow
+
+
+def _lrp_attrs(lrp):
+    """ :returns: attr1, attr2, dnp interval """
+    return [_attr1(lrp), (lrp.lfrcnp << 5) | lrp.bear, _interval(lrp.dnp, LENGTH_INTERVAL)]
+
+
+def _lrps(first, points):
+    """ Encode the first and intermediate LRPs
+
+        :returns: Fields laid out as FIRST_LRP_FMT + LRP_FMT * len(points),
+                  decoded coordinates of the last one
+        :rtype: list, Coords
+    """
+    fields, rel = _absolute_coordinates(first.coords)
+    fields += _lrp_attrs(first)
+    for lrp in points:
+        coords, rel = _relative_coordinates(lrp.coords, rel)
+        fields += coords + _lrp_attrs(lrp)
+    return fields, rel
+
+
+def _last_lrp(lrp, rel, pofff, nofff):
+    """ :returns: Fields laid out as LAST_LRP_FMT """
+    fields, _ = _relative_coordinates(lrp.coords, rel)
+    return fields + [_attr1(lrp), (pofff << 6) | (nofff << 5) | lrp.bear]
+
+
+def _offset(offs, version):
+    """ Inverse of :py:func:`pylr.binary._offset_value`
+
+        :returns: Offset fields (empty if no offset)
+    """
+    if not offs:
+        return []
+    if version == BINARY_VERSION_2:
+        return [_interval(offs, LENGTH_INTERVAL)]
+    return [_interval(offs, RELATIVE_OFFSET_LENGTH)]
+
+
+def _bbox(bbox):
+    """ :returns: Fields, True if the upper right corner has absolute coordinates """
+    fields, rel = _absolute_coordinates(Coords(bbox.minx, bbox.miny))
+    try:
+        corner, _ = _relative_coordinates(Coords(bbox.maxx, bbox.maxy), rel)
+        return fields + corner, False
+    except EncoderError:
+        corner, _ = _absolute_coordinates(Coords(bbox.maxx, bbox.maxy))
+        return fields + corner, True
+
+
+# ----------------
+# Location encoders
+# ----------------
+
+def _encode_line(loc):
+    poffs, noffs = _offset(loc.poffs, loc.version), _offset(loc.noffs, loc.version)
+    fields, rel = _lrps(loc.flrp, loc.points)
+    fields += _last_lrp(loc.llrp, rel, int(bool(poffs)), int(bool(noffs))) + poffs + noffs
+    size = MIN_BYTES_LINE_LOCATION + LRP_SIZE * len(loc.points) + len(poffs) + len(noffs)
+    return _header(loc.version, 0, 0, 1), size, fields
+
+
+def _encode_point_along_line(loc):
+    poffs = _offset(loc.poffs, loc.version)
+    fields, rel = _lrps(loc.flrp, ())
+    fields += _last_lrp(loc.llrp, rel, int(bool(poffs)), 0) + poffs
+    return _header(loc.version, 0, 1, 1), POINT_ALONG_LINE_SIZE + len(poffs), fields
+
+
+def _encode_geo_coordinates(loc):
+    fields, _ = _absolute_coordinates(loc.coords)
+    return _header(loc.version, 0, 1, 0), GEOCOORD_SIZE, fields
+
+
+def _encode_poi_with_access_point(loc):
+    poffs = _offset(loc.poffs, loc.version)
+    fields, flrp = _lrps(loc.flrp, ())
+    fields += _last_lrp(loc.llrp, flrp, int(bool(poffs)), 0) + poffs
+    fields += _relative_coordinates(loc.coords, flrp)[0]
+    return _header(loc.version, 0, 1, 1), POINT_WITH_ACCESS_SIZE + len(poffs), fields
+
+
+def _encode_circle(loc):
+    fields, _ = _absolute_coordinates(loc.coords)
+    radius = loc.radius
+    if not 0 <= radius < (1 << 32):
+        raise EncoderError("Radius out of range: {}".format(radius))
+    radius_size = 1 if radius < 0x100 else 2 if radius < 0x10000 else 3 if radius < 0x1000000 else 4
+    fields += [radius >> 8, radius & 0xff] if radius_size == 3 else [radius]
+    return _header(loc.version, AREA_CODE_CIRCLE, 0, 0), CIRCLE_BASE_SIZE + radius_size, fields
+
+
+def _encode_rectangle(loc):
+    fields, large = _bbox(loc.bbox)
+    return (_header(loc.version, AREA_CODE_RECTANGLE, 0, 0),
+            LARGE_RECTANGLE_SIZE if large else RECTANGLE_SIZE, fields)
+
+
+def _encode_grid(loc):
+    fields, large = _bbox(loc.bbox)
+    return (_header(loc.version, AREA_CODE_RECTANGLE, 0, 0),
+            LARGE_GRID_SIZE if large else GRID_SIZE, fields + [loc.cols, loc.rows])
+
+
+def _encode_closed_line(loc):
+    fields, _ = _lrps(loc.flrp, loc.points)
+    fields += [(loc.frc << 3) | loc.fow, loc.bear]
+    return (_header(loc.version, AREA_CODE_CLOSEDLINE, 0, 1),
+            MIN_BYTES_CLOSED_LINE_LOCATION + LRP_SIZE * len(loc.points), fields)
+
+
+def _encode_polygon(loc):
+    if len(loc.points) < 3:
+        raise EncoderError("A polygon needs at least 3 corners")
+    fields, rel = _absolute_coordinates(loc.points[0])
+    for coords in loc.points[1:]:
+        rel_fields, rel = _relative_coordinates(coords, rel)
+        fields += rel_fields
+    return (_header(loc.version, AREA_CODE_POLYGON, 0, 0),
+            MIN_BYTES_POLYGON + RELATIVE_COORD_SIZE * (len(loc.points) - 3), fields)
+
+
+_ENCODERS = {LocationType.LINE_LOCATION: _encode_line,
+             LocationType.POINT_ALONG_LINE: _encode_point_along_line,
+             LocationType.GEO_COORDINATES: _encode_geo_coordinates,
+             LocationType.POI_WITH_ACCESS_POINT: _encode_poi_with_access_point,
+             LocationType.CIRCLE: _encode_circle,
+             LocationType.RECTANGLE: _encode_rectangle,
+             LocationType.GRID: _encode_grid,
+             LocationType.CLOSED_LINE: _encode_closed_line,
+             LocationType.POLYGON: _encode_polygon}
+
+
+def encode_binary(location, base64=False):
+    """ Encode a location to the binary format.
+
+        :param location: Object describing the location, as returned by
+                         :py:func:`pylr.parser.parse_binary`
+        :param bool base64: True to encode the result in base 64
+        :returns: Binary location reference
+        :rtype: string
+        :raises EncoderError: if the location cannot be encoded
+    """
+    version = location.version
+    if version not in (BINARY_VERSION_2, BINARY_VERSION_3):
+        raise EncoderError("Invalid binary version {}".format(version))
+    if version == BINARY_VERSION_2 and location.type != LocationType.LINE_LOCATION:
+        raise EncoderError("Binary version 2 only supports line locations")
+    try:
+        encoder = _ENCODERS[location.type]
+    except KeyError:
+        raise EncoderError("Invalid location type {}".format(location.type))
+
+    header, size, fields = encoder(location)
+    try:
+        data = read_plan(location.type, size).pack(header, *fields)
+    except Exception as e:
+        raise EncoderError("Cannot encode location: {}".format(e))
+    if base64:
+        return b2a_base64(data).rstrip('\n')
+    return data
+
+
+# ----------------
+# Benchmark corpora
+# ----------------
+
+# Maximum relative coordinate, in degrees, used by random locations
+_MAX_REL = 0x7fff / DECA_MICRO_DEG_FACTOR / 2
+
+
+def _random_coords(rnd, rel=None):
+    if rel is None:
+        return Coords(rnd.uniform(-179, 179), rnd.uniform(-89, 89))
+    return Coords(rel.lon + rnd.uniform(-_MAX_REL, _MAX_REL),
+                  max(-90, min(90, rel.lat + rnd.uniform(-_MAX_REL, _MAX_REL))))
+
+
+def _random_lrp(rnd, coords, orient=0, last=False):
+    if last:
+        return LocationReferencePoint(coords, rnd.randrange(32), orient, rnd.randrange(8), rnd.randrange(8),
+                                      None, None)
+    return LocationReferencePoint(coords, rnd.randrange(32), orient, rnd.randrange(8), rnd.randrange(8),
+                                  rnd.randrange(8), DISTANCE_ESTIMATES[rnd.randrange(256)])
+
+
+def _random_lrps(rnd, count):
+    lrps = [_random_lrp(rnd, _random_coords(rnd))]
+    for _ in xrange(count - 1):
+        lrps.append(_random_lrp(rnd, _random_coords(rnd, lrps[-1].coords)))
+    return lrps
+
+
+def _random_offset(rnd, version):
+    if rnd.random() < 0.5:
+        return 0
+    return rnd.uniform(0, 100) if version == BINARY_VERSION_3 else rnd.uniform(0, 15000)
+
+
+def _random_bbox(rnd):
+    """ Random bounding box, small (relative upper right corner) or large """
+    ll = _random_coords(rnd)
+    ur = _random_coords(rnd, ll if rnd.random() < 0.5 else None)
+    return BBox(ll.lon, ll.lat, max(ll.lon, ur.lon), max(ll.lat, ur.lat))
+
+
+def random_location(loc_type, rnd=random, version=BINARY_VERSION_3, max_points=8, num_points=None):
+    """ Generate a random location
+
+        :param int loc_type: Location type
+        :param rnd: Random generator (e.g. random.Random(seed))
+        :param int version: Binary version
+        :param int max_points: Maximum number of intermediate LRPs (or additional polygon corners)
+        :param int num_points: Number of intermediate LRPs (or polygon corners, at least 3),
+                               instead of a random number up to max_points
+        :returns: Object describing the location
+    """
+    def extra(required=0):
+        """ Number of points in addition to the required ones """
+        return rnd.randint(0, max_points) if num_points is None else num_points - required
+
+    t = LocationType
+    if loc_type == t.LINE_LOCATION:
+        lrps = _random_lrps(rnd, 1 + extra())
+        llrp = _random_lrp(rnd, _random_coords(rnd, lrps[-1].coords), last=True)
+        return LineLocation(version, loc_type, lrps[0], llrp, lrps[1:],
+                            _random_offset(rnd, version), _random_offset(rnd, version))
+    if loc_type in (t.POINT_ALONG_LINE, t.POI_WITH_ACCESS_POINT):
+        flrp = _random_lrp(rnd, _random_coords(rnd), rnd.randrange(4))
+        llrp = _random_lrp(rnd, _random_coords(rnd, flrp.coords), rnd.randrange(4), last=True)
+        poffs = _random_offset(rnd, version)
+        if loc_type == t.POINT_ALONG_LINE:
+            return PointAlongLineLocation(version, loc_type, flrp, llrp, poffs)
+        return PoiWithAccessPointLocation(version, loc_type, flrp, llrp, poffs,
+                                          _random_coords(rnd, flrp.coords))
+    if loc_type == t.GEO_COORDINATES:
+        return GeoCoordinateLocation(version, loc_type, _random_coords(rnd))
+    if loc_type == t.CIRCLE:
+        return CircleLocation(version, loc_type, _random_coords(rnd), rnd.choice((0xff, 0xffff, 0xffffff)) &
+                              rnd.getrandbits(24))
+    if loc_type == t.RECTANGLE:
+        return RectangleLocation(version, loc_type, _random_bbox(rnd))
+    if loc_type == t.GRID:
+        return GridLocation(version, loc_type, _random_bbox(rnd), rnd.randint(1, 100), rnd.randint(1, 100))
+    if loc_type == t.CLOSED_LINE:
+        lrps = _random_lrps(rnd, 1 + extra())
+        return ClosedLineLocation(version, loc_type, lrps[0], lrps[1:],
+                                  rnd.randrange(8), rnd.randrange(8), rnd.randrange(32))
+    if loc_type == t.POLYGON:
+        points = [_random_coords(rnd)]
+        for _ in xrange(2 + extra(3)):
+            points.append(_random_coords(rnd, points[-1]))
+        return PolygonLocation(version, loc_type, points)
+    raise EncoderError("Invalid location type {}".format(loc_type))
+
+
+''' Location types supported by the encoder '''
+ENCODED_TYPES = frozenset(_ENCODERS)
+
+
+def iter_corpus(loc_type, count, seed=None, version=BINARY_VERSION_3, base64=False, max_points=8, num_points=None):
+    """ Generate a corpus of valid random location references
+
+        :param int loc_type: Location type
+        :param int count: Number of location references
+        :param seed: Seed of the random generator, for reproducible corpora
+        :param int version: Binary version (2 is only valid for line locations)
+        :param bool base64: True to encode the references in base 64
+        :param int max_points: Maximum number of intermediate LRPs (or additional polygon corners)
+        :param int num_points: Number of intermediate LRPs (or polygon corners), see
+                               :py:func:`random_location`
+        :returns: Generator of binary location references
+    """
+    rnd = random.Random(seed)
+    for _ in xrange(count):
+        yield encode_binary(random_location(loc_type, rnd, version, max_points, num_points), base64)
+
+
+def write_corpus(f, loc_types, count, seed=None, version=BINARY_VERSION_3, prefix=LENGTH_PREFIX_FMT):
+    """ Write a corpus of random location references to a file, as length
+        prefixed records that can be read back with
+        :py:func:`pylr.parser.iter_length_prefixed`.
+
+        :param f: File object, opened in binary mode
+        :param loc_types: Location types, used in turn
+        :param int count: Number of location references of each type
+        :param seed: Seed of the random generator
+        :param int version: Binary version
+        :param string prefix: struct format of the length prefix
+        :returns: Number of records written
+    """
+    prefix = Struct(prefix)
+    corpora = [iter_corpus(t, count, (seed, t) if seed is not None else None, version) for t in loc_types]
+    written = 0
+    for records in izip(*corpora):
+        for data in records:
+            f.write(prefix.pack(len(data)))
+            f.write(data)
+        written += len(records)
+    return written
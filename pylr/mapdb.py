@@ -0,0 +1,419 @@
+# -*- coding: utf-8 -*-
+''' In-memory map database
+
+    .. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+    A reference implementation of :py:class:`pylr.decoder.MapDatabase`,
+    holding a road network in flat numpy arrays:
+
+    * nodes: ``node_lon``, ``node_lat``. The id of a node is its index.
+    * lines: ``line_start``, ``line_end`` (node ids), ``line_frc``,
+      ``line_fow``, ``line_len`` (in meters), and the bearing sectors at
+      both ends, ``line_bear_out`` (leaving the start node) and
+      ``line_bear_in`` (entering the end node, measured from the end node).
+      The id of a line is its index.
+    * line shapes: the shape points of line i, start and end nodes
+      included, are the rows ``shape_offsets[i]`` to ``shape_offsets[i+1]``
+      of ``shape_lon`` and ``shape_lat``.
+
+    The lines leaving and entering each node are stored as CSR (compressed
+    sparse row) adjacency arrays, and nodes and line segments are indexed
+    by a uniform grid, also stored in CSR arrays. The memory used is linear
+    in the size of the network (see :py:attr:`MemoryMapDatabase.nbytes`),
+    and lookups only read the grid cells around the searched coordinates.
+
+    Distances use the equirectangular approximation of
+    :py:func:`pylr.spatial.distances`. Routes are shortest paths, found
+    with a Dijkstra search bounded by the maximum distance; one search
+    settles all the target lines of
+    :py:meth:`MemoryMapDatabase.calculate_routes`.
+
+    This module requires numpy.
+'''
+
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from heapq import heappush, heappop
+from itertools import izip
+from math import atan2, cos, degrees, floor, radians
+import numpy as np
+
+from .constants import AGAINST_LINE_DIRECTION, BEARING_SECTOR, BEARING_SECTORS
+from .decoder import MapDatabase, RouteNotFoundException
+from .spatial import METERS_PER_DEGREE, radius_extent, distances
+
+
+''' Default size of the grid cells (in degrees) '''
+DEFAULT_CELL_SIZE = 0.002
+
+''' Distance from the line ends at which bearings are measured (in meters) '''
+BEARING_DISTANCE = 20.0
+
+Node = namedtuple('Node', MapDatabase.Node._fields + ('id',))
+""" Node found by :py:meth:`MemoryMapDatabase.find_closeby_nodes`
+
+    .. attribute:: id
+
+        id of the node
+"""
+
+Line = MapDatabase.Line
+
+
+def _cells(v, cell_size):
+    return np.floor(v / cell_size).astype(np.int64)
+
+
+def _cell_keys(cx, cy):
+    return cx * (1 << 32) + cy
+
+
+def _bearing_sector(dx, dy):
+    """ Bearing sector of a direction given in meters (east, north) """
+    return int((degrees(atan2(dx, dy)) % 360.0) // BEARING_SECTOR) % BEARING_SECTORS
+
+
+def _bearing_sectors(lon1, lat1, lon2, lat2):
+    """ Bearing sectors of the directions from points 1 to points 2 """
+    dx = (lon2 - lon1) * np.cos(np.radians((lat1 + lat2) / 2.0))
+    dy = lat2 - lat1
+    angles = np.degrees(np.arctan2(dx, dy)) % 360.0
+    return (angles // BEARING_SECTOR).astype(np.int8) % BEARING_SECTORS
+
+
+class _GridIndex(object):
+    """ Uniform grid of items given by their bounding boxes.
+
+        The items of the cell ``cells[i]`` are ``items[offsets[i]:offsets[i+1]]``.
+        Items are stored in all the cells their bounding box intersects.
+        Cells are sorted by column then by row: the cells of a column
+        intersecting a bounding box are contiguous, and so are their items.
+    """
+
+    def __init__(self, minx, miny, maxx, maxy, cell_size):
+        x0, y0 = _cells(minx, cell_size), _cells(miny, cell_size)
+        width, height = _cells(maxx, cell_size) - x0 + 1, _cells(maxy, cell_size) - y0 + 1
+        counts = width * height
+        items = np.repeat(np.arange(len(counts), dtype=np.int64), counts)
+        # Index of each cell in the bounding box of its item
+        k = np.arange(len(items)) - np.repeat(np.cumsum(counts) - counts, counts)
+        width = np.repeat(width, counts)
+        keys = _cell_keys(np.repeat(x0, counts) + k % width, np.repeat(y0, counts) + k // width)
+        order = np.argsort(keys, kind='mergesort')
+        keys = keys[order]
+        cells, starts = np.unique(keys, return_index=True)
+        self.cell_size = cell_size
+        self.items = items[order].astype(np.int32)
+        # Searched with bisect: array items are python integers
+        self.cells = array('l', cells.astype(np.int_).tobytes())
+        self.offsets = array('l', np.append(starts, len(keys)).astype(np.int_).tobytes())
+
+    def query(self, minx, miny, maxx, maxy):
+        """ Items of the cells intersecting a bounding box
+
+            :returns: Item indices, an item may be repeated
+            :rtype: numpy.ndarray
+        """
+        c = self.cell_size
+        y0, y1 = int(floor(miny / c)), int(floor(maxy / c))
+        cells, offsets, items = self.cells, self.offsets, self.items
+        found = []
+        for x in xrange(int(floor(minx / c)), int(floor(maxx / c)) + 1):
+            lo = bisect_left(cells, _cell_keys(x, y0))
+            hi = bisect_right(cells, _cell_keys(x, y1), lo)
+            if lo < hi:
+                found.append(items[offsets[lo]:offsets[hi]])
+        if len(found) == 1:
+            return found[0]
+        return np.concatenate(found) if found else items[:0]
+
+    @property
+    def nbytes(self):
+        return self.items.nbytes + self.cells.itemsize * (len(self.cells) + len(self.offsets))
+
+
+class MemoryMapDatabase(MapDatabase):
+    """ Map database holding a road network in memory.
+
+        Lines are directed: a two way road is made of two lines. Lines
+        without shape go straight from their start node to their end node.
+
+        :param node_lon: Longitudes of the nodes (in degrees)
+        :param node_lat: Latitudes of the nodes (in degrees)
+        :param line_start: Start node of each line
+        :param line_end: End node of each line
+        :param line_frc: Functional road class of each line
+        :param line_fow: Form of way of each line
+        :param shape_offsets: First shape point of each line, followed by the
+                              number of shape points
+        :param shape_lon: Longitudes of the shape points (start and end nodes included)
+        :param shape_lat: Latitudes of the shape points (start and end nodes included)
+        :param float cell_size: Size of the grid cells (in degrees)
+        :param version: Version of the map data
+        :raises ValueError: if the arrays are not consistent
+    """
+
+    def __init__(self, node_lon, node_lat, line_start, line_end, line_frc, line_fow,
+                 shape_offsets=None, shape_lon=None, shape_lat=None,
+                 cell_size=DEFAULT_CELL_SIZE, version=None):
+        self.version = version
+        self.cell_size = cell_size
+        self.node_lon = np.asarray(node_lon, dtype=np.float64)
+        self.node_lat = np.asarray(node_lat, dtype=np.float64)
+        self.line_start = np.asarray(line_start, dtype=np.int32)
+        self.line_end = np.asarray(line_end, dtype=np.int32)
+        self.line_frc = np.asarray(line_frc, dtype=np.int8)
+        self.line_fow = np.asarray(line_fow, dtype=np.int8)
+        num_nodes, num_lines = len(self.node_lon), len(self.line_start)
+        if len(self.node_lat) != num_nodes:
+            raise ValueError("Invalid node arrays")
+        if not len(self.line_end) == len(self.line_frc) == len(self.line_fow) == num_lines:
+            raise ValueError("Invalid line arrays")
+        if num_lines and not (0 <= min(self.line_start.min(), self.line_end.min()) and
+                              max(self.line_start.max(), self.line_end.max()) < num_nodes):
+            raise ValueError("Invalid node id in lines")
+
+        if shape_offsets is None:
+            # Straight lines
+            self.shape_offsets = np.arange(0, 2 * num_lines + 1, 2, dtype=np.int64)
+            self.shape_lon = np.column_stack((self.node_lon[self.line_start],
+                                              self.node_lon[self.line_end])).ravel()
+            self.shape_lat = np.column_stack((self.node_lat[self.line_start],
+                                              self.node_lat[self.line_end])).ravel()
+        else:
+            self.shape_offsets = np.asarray(shape_offsets, dtype=np.int64)
+            self.shape_lon = np.asarray(shape_lon, dtype=np.float64)
+            self.shape_lat = np.asarray(shape_lat, dtype=np.float64)
+            if (len(self.shape_offsets) != num_lines + 1 or len(self.shape_lon) != len(self.shape_lat) or
+                    self.shape_offsets[-1] != len(self.shape_lon) or np.any(np.diff(self.shape_offsets) < 2)):
+                raise ValueError("Invalid shape arrays")
+
+        self._init_lengths()
+        self._init_bearings()
+        self._init_adjacency()
+        self._init_grids()
+
+    @classmethod
+    def from_lines(cls, nodes, lines, **kwargs):
+        """ Build a map database from sequences of nodes and lines
+
+            :param nodes: sequence of (lon, lat) coordinates
+            :param lines: sequence of (start, end, frc, fow) tuples, optionally
+                          followed by the sequence of the (lon, lat) intermediate
+                          shape points of the line
+            :param kwargs: other arguments of :py:class:`MemoryMapDatabase`
+        """
+        nodes = np.asarray(nodes, dtype=np.float64).reshape(-1, 2)
+        lines = list(lines)
+        start, end, frc, fow = (np.array([line[i] for line in lines], dtype=np.int64) for i in xrange(4))
+        shape_offsets, shape_lon, shape_lat = [0], [], []
+        for line in lines:
+            points = [nodes[line[0]]] + [p for p in (line[4] if len(line) > 4 else ())] + [nodes[line[1]]]
+            shape_lon.extend(p[0] for p in points)
+            shape_lat.extend(p[1] for p in points)
+            shape_offsets.append(len(shape_lon))
+        return cls(nodes[:, 0], nodes[:, 1], start, end, frc, fow, shape_offsets, shape_lon, shape_lat, **kwargs)
+
+    def _init_lengths(self):
+        offsets, lon, lat = self.shape_offsets, self.shape_lon, self.shape_lat
+        # Line of each shape point
+        self._shape_line = np.repeat(np.arange(len(self.line_start), dtype=np.int32), np.diff(offsets))
+        # Length of the segment starting at each shape point (0 for the last point of a line)
+        seglen = np.zeros(len(lon))
+        if len(lon):
+            seglen[:-1] = distances(lon[:-1], lat[:-1], lon[1:], lat[1:])
+            seglen[offsets[1:] - 1] = 0.0
+        self._segment_len = seglen
+        # Distance from the start of the shape points, along all lines
+        self._cumulated_len = np.concatenate(([0.0], np.cumsum(seglen)[:-1])) if len(lon) else seglen
+        self.line_len = self._cumulated_len[offsets[1:] - 1] - self._cumulated_len[offsets[:-1]]
+
+    def _point_at(self, position, first, last):
+        """ Coordinates of the points at the given positions along lines,
+            found between the shape points first and last of each line
+        """
+        cumulated = self._cumulated_len
+        k = np.clip(np.searchsorted(cumulated, position, side='right'), first + 1, last)
+        seglen = cumulated[k] - cumulated[k - 1]
+        t = np.where(seglen > 0, (position - cumulated[k - 1]) / np.where(seglen > 0, seglen, 1.0), 0.0)
+        lon, lat = self.shape_lon, self.shape_lat
+        return lon[k - 1] + t * (lon[k] - lon[k - 1]), lat[k - 1] + t * (lat[k] - lat[k - 1])
+
+    def _init_bearings(self):
+        first, last = self.shape_offsets[:-1], self.shape_offsets[1:] - 1
+        start = self._cumulated_len[first]
+        distance = np.minimum(BEARING_DISTANCE, self.line_len)
+        lon, lat = self._point_at(start + distance, first, last)
+        self.line_bear_out = _bearing_sectors(self.shape_lon[first], self.shape_lat[first], lon, lat)
+        lon, lat = self._point_at(start + self.line_len - distance, first, last)
+        self.line_bear_in = _bearing_sectors(self.shape_lon[last], self.shape_lat[last], lon, lat)
+
+    def _init_adjacency(self):
+        num_nodes = len(self.node_lon)
+        for name, nodes in (('out', self.line_start), ('in', self.line_end)):
+            offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(nodes, minlength=num_nodes), out=offsets[1:])
+            setattr(self, '_{}_offsets'.format(name), offsets)
+            setattr(self, '_{}_lines'.format(name), np.argsort(nodes, kind='mergesort').astype(np.int32))
+
+    def _init_grids(self):
+        cell_size = self.cell_size
+        self._node_grid = _GridIndex(self.node_lon, self.node_lat, self.node_lon, self.node_lat, cell_size)
+        # Segments are identified by their first shape point
+        segments = np.flatnonzero(self._segment_len > 0)
+        lon, lat = self.shape_lon, self.shape_lat
+        # Long segments are indexed as pieces no longer than a cell, each
+        # stored in at most 4 cells: the index size is linear in the length
+        # of the segments instead of in the area of their bounding boxes
+        dlon, dlat = lon[segments + 1] - lon[segments], lat[segments + 1] - lat[segments]
+        pieces = np.maximum(np.ceil(np.maximum(abs(dlon), abs(dlat)) / cell_size), 1).astype(np.int64)
+        first = np.repeat(np.cumsum(pieces) - pieces, pieces)
+        t0 = (np.arange(len(first)) - first) / np.repeat(pieces, pieces).astype(np.float64)
+        t1 = t0 + 1.0 / np.repeat(pieces, pieces)
+        self._segments = segments = np.repeat(segments, pieces)
+        dlon, dlat = np.repeat(dlon, pieces), np.repeat(dlat, pieces)
+        lon0, lon1 = lon[segments] + t0 * dlon, lon[segments] + t1 * dlon
+        lat0, lat1 = lat[segments] + t0 * dlat, lat[segments] + t1 * dlat
+        self._segment_grid = _GridIndex(np.minimum(lon0, lon1), np.minimum(lat0, lat1),
+                                        np.maximum(lon0, lon1), np.maximum(lat0, lat1), cell_size)
+
+    @property
+    def nbytes(self):
+        """ Memory used by the arrays of the database (in bytes) """
+        arrays = [v for v in vars(self).itervalues() if isinstance(v, np.ndarray)]
+        return sum(a.nbytes for a in arrays) + self._node_grid.nbytes + self._segment_grid.nbytes
+
+    def _lines(self, ids, bears, projected_lens=None):
+        """ Line objects """
+        if projected_lens is None:
+            projected_lens = [None] * len(ids)
+        return [Line(*values) for values in izip(ids.tolist(), bears.tolist(), self.line_frc[ids].tolist(),
+                                                 self.line_fow[ids].tolist(), self.line_len[ids].tolist(),
+                                                 projected_lens)]
+
+    def connected_lines(self, node, frc_max, beardir):
+        n = node.id
+        if beardir == AGAINST_LINE_DIRECTION:
+            offsets, lines, bears = self._in_offsets, self._in_lines, self.line_bear_in
+        else:
+            offsets, lines, bears = self._out_offsets, self._out_lines, self.line_bear_out
+        lines = lines[offsets[n]:offsets[n + 1]]
+        lines = lines[self.line_frc[lines] <= frc_max]
+        return self._lines(lines, bears[lines])
+
+    def find_closeby_nodes(self, coords, max_node_dist):
+        lon, lat = coords
+        dlon, dlat = radius_extent(lat, max_node_dist)
+        nodes = self._node_grid.query(lon - dlon, lat - dlat, lon + dlon, lat + dlat)
+        dist = distances(self.node_lon[nodes], self.node_lat[nodes], lon, lat)
+        found = dist <= max_node_dist
+        return [Node(distance=d, id=n) for n, d in izip(nodes[found].tolist(), dist[found].tolist())]
+
+    def find_closeby_lines(self, coords, max_node_dist, frc_max, beardir):
+        """ Look for the lines at less than max_node_dist from the given
+            coordinates. Coordinates are projected on each line: the
+            bearing of a line is the one of the segment holding the
+            projection.
+
+            return a list of (Line, distance)
+        """
+        lon, lat = coords
+        dlon, dlat = radius_extent(lat, max_node_dist)
+        # Segments stored in several cells, or split in several pieces, are
+        # repeated: only the closest segment of each line is kept below
+        segments = self._segments[self._segment_grid.query(lon - dlon, lat - dlat, lon + dlon, lat + dlat)]
+        segments = segments[self.line_frc[self._shape_line[segments]] <= frc_max]
+        # Project on segments, in meters around the coordinates
+        kx, ky = METERS_PER_DEGREE * cos(radians(lat)), METERS_PER_DEGREE
+        shape_lon, shape_lat = self.shape_lon, self.shape_lat
+        ax, ay = (shape_lon[segments] - lon) * kx, (shape_lat[segments] - lat) * ky
+        vx, vy = (shape_lon[segments + 1] - lon) * kx - ax, (shape_lat[segments + 1] - lat) * ky - ay
+        t = np.clip(-(ax * vx + ay * vy) / (vx * vx + vy * vy), 0.0, 1.0)
+        dist = np.hypot(ax + t * vx, ay + t * vy)
+        found = np.flatnonzero(dist <= max_node_dist)
+        # Closest segment of each line
+        closest = {}
+        for i, line, d in izip(found.tolist(), self._shape_line[segments[found]].tolist(),
+                               dist[found].tolist()):
+            if d < closest.get(line, (None, d + 1))[1]:
+                closest[line] = i, d
+
+        result = []
+        cumulated, shape_offsets = self._cumulated_len, self.shape_offsets
+        for line, (i, d) in closest.iteritems():
+            k = segments.item(i)
+            projected_len = (cumulated.item(k) - cumulated.item(shape_offsets.item(line)) +
+                             t.item(i) * self._segment_len.item(k))
+            bear = _bearing_sector(vx.item(i), vy.item(i))
+            if beardir == AGAINST_LINE_DIRECTION:
+                bear = (bear + BEARING_SECTORS // 2) % BEARING_SECTORS
+            result.append((Line(line, bear, self.line_frc.item(line), self.line_fow.item(line),
+                                self.line_len.item(line), projected_len), d))
+        return result
+
+    def calculate_route(self, l1, l2, maxdist, lfrc, islastrp):
+        """ Calculate the shortest path between two lines
+
+            The route starts with l1, and ends with l2 if islastrp is True,
+            before l2 otherwise. Its length is the sum of the lengths of its
+            lines.
+        """
+        try:
+            return self.calculate_routes(l1, (l2,), maxdist, lfrc, islastrp)[l2.id]
+        except KeyError:
+            raise RouteNotFoundException("No route from {} to {} within {}".format(l1.id, l2.id, maxdist))
+
+    def calculate_routes(self, l1, targets, maxdist, lfrc, islastrp):
+        """ Calculate the shortest paths from one line to several lines, with a
+            single search. Routes are the ones of :py:meth:`calculate_route`.
+        """
+        line_start, line_end, line_len, line_frc = self.line_start, self.line_end, self.line_len, self.line_frc
+        out_offsets, out_lines = self._out_offsets, self._out_lines
+
+        target_nodes = {}
+        for l2 in targets:
+            target_nodes.setdefault(line_start.item(l2.id), []).append(l2)
+        remaining = len(target_nodes)
+
+        start = line_end.item(l1.id)
+        length = line_len.item(l1.id)
+        reached, previous, settled = {start: length}, {start: None}, set()
+        heap = [(length, start)] if length <= maxdist else []
+        while heap and remaining:
+            d, n = heappop(heap)
+            if n in settled:
+                continue
+            settled.add(n)
+            if n in target_nodes:
+                remaining -= 1
+            for line in out_lines[out_offsets.item(n):out_offsets.item(n + 1)].tolist():
+                if line_frc.item(line) > lfrc:
+                    continue
+                m = line_end.item(line)
+                dm = d + line_len.item(line)
+                if dm <= maxdist and dm < reached.get(m, dm + 1):
+                    reached[m] = dm
+                    previous[m] = line
+                    heappush(heap, (dm, m))
+
+        routes = {}
+        for n, lines in target_nodes.iteritems():
+            if n not in settled:
+                continue
+            path = []
+            m = n
+            while previous[m] is not None:
+                path.append(previous[m])
+                m = line_start.item(previous[m])
+            path.reverse()
+            path = np.array(path, dtype=np.int32)
+            route = [l1] + self._lines(path, self.line_bear_out[path])
+            for l2 in lines:
+                if islastrp:
+                    length = reached[n] + l2.len
+                    if length <= maxdist:
+                        routes[l2.id] = route + [l2], length
+                else:
+                    routes[l2.id] = list(route), reached[n]
+        return routes
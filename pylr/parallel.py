@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+''' Parallel parsing of location references
+
+    .. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+    Location references are sent in chunks to worker processes, parsed with
+    :py:func:`pylr.parser.parse_binary_many`, and returned in input order.
+
+    Workers do not send back pickled namedtuples: parsed locations are packed
+    with :py:func:`pylr.parser.pack_locations`, and errors are serialized with
+    marshal, with their position in the chunk.
+'''
+
+import marshal
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool, cpu_count
+
+from .parser import (BinaryParseError,
+                     BinaryVersionError,
+                     InvalidDataSizeError,
+                     ON_ERROR_YIELD,
+                     ON_ERROR_SKIP,
+                     ON_ERROR_RAISE,
+                     parse_binary_many,
+                     pack_locations,
+                     unpack_locations)
+
+
+''' Default number of location references sent to a worker at once '''
+DEFAULT_CHUNKSIZE = 1000
+
+MARSHAL_VERSION = 2
+
+_ERRORS = dict((e.__name__, e) for e in (BinaryParseError, BinaryVersionError, InvalidDataSizeError))
+
+
+def _parse_chunk(args):
+    """ Parse a chunk of location references in a worker process
+
+        :returns: Packed locations, and errors with the number of locations before them,
+                  serialized with marshal
+        :rtype: str
+    """
+    chunk, base64 = args
+    locations = []
+    errors = []
+
+    def error(data, e):
+        errors.append((len(locations), type(e).__name__, str(e), str(data)))
+
+    for location in parse_binary_many(chunk, base64, error):
+        locations.append(location)
+    return marshal.dumps((pack_locations(locations), errors), MARSHAL_VERSION)
+
+
+def _chunks(iterable, chunksize):
+    chunk = []
+    for data in iterable:
+        chunk.append(data)
+        if len(chunk) == chunksize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class ParsePool(object):
+    """ Pool of processes parsing location references.
+
+        :param int processes: Number of worker processes (default: number of cpus)
+        :param int chunksize: Number of location references sent to a worker at once
+    """
+
+    def __init__(self, processes=None, chunksize=DEFAULT_CHUNKSIZE):
+        if chunksize < 1:
+            raise ValueError("Invalid chunk size {}".format(chunksize))
+        self.processes = processes or cpu_count()
+        self.chunksize = chunksize
+        self._pool = Pool(self.processes)
+
+    def imap(self, iterable, base64=True, on_error=ON_ERROR_YIELD):
+        """ Parse location references in worker processes.
+
+            The number of chunks waiting for results is bounded, so the
+            input is consumed as results are returned.
+
+            :param iterable: strings (encoded or not) describing the locations
+            :param bool base64: True if encoded in base 64
+            :param on_error: error policy, as in :py:func:`pylr.parser.parse_binary_many`
+            :returns: Generator of objects describing the parsed locations, in input order
+        """
+        if on_error not in (ON_ERROR_YIELD, ON_ERROR_SKIP, ON_ERROR_RAISE) and not callable(on_error):
+            raise ValueError("Invalid error policy {}".format(on_error))
+        return self._imap(iterable, base64, on_error)
+
+    def _imap(self, iterable, base64, on_error):
+        pending = deque()
+        max_pending = 2 * self.processes
+        for chunk in _chunks(iterable, self.chunksize):
+            pending.append(self._pool.apply_async(_parse_chunk, ((chunk, base64),)))
+            if len(pending) >= max_pending:
+                for location in self._results(pending.popleft().get(), on_error):
+                    yield location
+        while pending:
+            for location in self._results(pending.popleft().get(), on_error):
+                yield location
+
+    @staticmethod
+    def _results(serialized, on_error):
+        packed, errors = marshal.loads(serialized)
+        locations = unpack_locations(packed)
+        count = 0
+        for position, name, message, data in errors:
+            for location in islice(locations, position - count):
+                yield location
+            count = position
+            error = _ERRORS.get(name, BinaryParseError)(message)
+            if on_error == ON_ERROR_YIELD:
+                yield error
+            elif on_error == ON_ERROR_RAISE:
+                raise error
+            elif on_error != ON_ERROR_SKIP:
+                on_error(data, error)
+        for location in locations:
+            yield location
+
+    def close(self):
+        """ Stop the worker processes once pending chunks are parsed """
+        self._pool.close()
+        self._pool.join()
+
+    def terminate(self):
+        """ Stop the worker processes immediately """
+        self._pool.terminate()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.terminate()
+
+
+def parse_parallel(iterable, base64=True, on_error=ON_ERROR_YIELD, processes=None,
+                   chunksize=DEFAULT_CHUNKSIZE):
+    """ Parse location references with a temporary :py:class:`ParsePool`.
+
+        :param iterable: strings (encoded or not) describing the locations
+        :param bool base64: True if encoded in base 64
+        :param on_error: error policy, as in :py:func:`pylr.parser.parse_binary_many`
+        :param int processes: Number of worker processes (default: number of cpus)
+        :param int chunksize: Number of location references sent to a worker at once
+        :returns: Generator of objects describing the parsed locations, in input order
+    """
+    with ParsePool(processes, chunksize) as pool:
+        for location in pool.imap(iterable, base64, on_error):
+            yield location
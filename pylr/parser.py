@@ -5,9 +5,13 @@
 
 '''
 
-from collections import namedtuple
-from bitstring import BitStream
+from collections import namedtuple, Sequence
+from binascii import hexlify, a2b_base64, b2a_base64, Error as BinasciiError
+from itertools import islice, izip
+from string import ascii_letters, digits
+from struct import Struct, error as StructError
 from .utils import lazyproperty
+from .spatial import tile_key, radius_extent
 from .constants import (LATEST_BINARY_VERSION,
                         BINARY_VERSION_2,
                         MIN_BYTES_LINE_LOCATION,
@@ -30,6 +34,7 @@ from .constants import (LATEST_BINARY_VERSION,
                         LARGE_GRID_SIZE,
                         LRP_SIZE,
                         CIRCLE_BASE_SIZE,
+                        BITS_PER_BYTE,
                         LocationType)
 
 
@@ -79,18 +84,25 @@ class _RawBinaryData(object):
     MAX_VERSION = LATEST_BINARY_VERSION
 
     
-    def __init__(self, data, base64=False):
+    def __init__(self, data, base64=False, offset=0, size=None):
         """ Constructor.
         
-            :param string data: Binaray data
+            :param string data: Binaray data, or any object supporting the buffer protocol
             :param bool base64: True if data is coded in base64
+            :param int offset: Start of the location reference in data
+            :param int size: Size of the location reference (default: up to the end of data)
         """
+        if offset or size is not None:
+            data = buffer_view(data, offset, size)
         if base64:
-            data = data.decode("base64")
+            data = a2b_base64(data)
         
         #: raw data size
         self._sz = len(data)
         
+        # bitstring is only needed by this backend
+        from bitstring import BitStream
+
         #: bit stream used to read data
         self._bs = BitStream(bytes=data)
 
@@ -101,7 +113,10 @@ class _RawBinaryData(object):
             :returns: Tuple of bit fields
             :rtype: tuple
         """
-        return tuple(self._bs.read(v) for v in bits)
+        bs = self._bs
+        if bs.pos + sum(_bit_field(v)[1] for v in bits) > bs.len:
+            raise InvalidDataSizeError("not enough bytes in data")
+        return tuple(bs.read(v) for v in bits)
     
     def get_position(self):
         """ Returns position in the bit stream.
@@ -154,89 +169,428 @@ class _RawBinaryData(object):
             :returns: Location type
             :rtype: LocationType
         """
-        header = self.header
+        loc_type, error = _check_location_type(self.header, self._sz)
+        if error is not None:
+            raise error
+        return loc_type
 
-        # Check version
-        if not self.MIN_VERSION <= header.ver <= self.MAX_VERSION:
-            raise BinaryVersionError("Invalid binary version {}".format(header.ver))
 
-        is_point = (header.pf == IS_POINT)
-        has_attributes = (header.af == HAS_ATTRIBUTES)
-        area_code = header.arf
-        is_area = ((area_code == 0 and not is_point and not has_attributes) or area_code > 0)
+_HEADER_STRUCT = Struct('>B')
 
-        total_bytes = self._sz
+# Minimum size of any location reference
+_MIN_BYTES = min(MIN_BYTES_LINE_LOCATION,
+                 MIN_BYTES_POINT_LOCATION,
+                 MIN_BYTES_CLOSED_LINE_LOCATION)
 
-        loc_type = LocationType.UNKNOWN
 
-        if not is_point and not is_area and has_attributes:
-            loc_type = LocationType.LINE_LOCATION
-        elif is_point and not is_area:
-            if not has_attributes:
-                if total_bytes == GEOCOORD_SIZE:
-                    loc_type = LocationType.GEO_COORDINATES
-                else:
-                    raise InvalidDataSizeError("Invalid byte size")
-            else:
-                if total_bytes == POINT_ALONG_LINE_SIZE or total_bytes == (POINT_ALONG_LINE_SIZE + POINT_OFFSET_SIZE):
-                    loc_type = LocationType.POINT_ALONG_LINE
-                elif total_bytes == POINT_WITH_ACCESS_SIZE or total_bytes == (POINT_WITH_ACCESS_SIZE + POINT_OFFSET_SIZE):
-                    loc_type = LocationType.POI_WITH_ACCESS_POINT
-                else:
-                    raise InvalidDataSizeError("Invalid byte size")
-        elif is_area and not is_point and has_attributes:
-            if total_bytes >= MIN_BYTES_CLOSED_LINE_LOCATION:
-                loc_type = LocationType.CLOSED_LINE
-            else:
-                raise InvalidDataSizeError("Invalid byte size")
+def _decode_header(byte):
+    """ Decode the header fields from the first byte of a location reference
+
+        :param int byte: First byte of the location reference
+        :returns: Header data
+        :rtype: _BinaryHeader
+    """
+    arf1, pf, arf0, af, ver = (byte >> 6) & 1, (byte >> 5) & 1, (byte >> 4) & 1, (byte >> 3) & 1, byte & 0x7
+    return _BinaryHeader(2 * arf1 + arf0, af, pf, ver)
+
+
+# All the possible headers
+_HEADERS = tuple(_decode_header(b) for b in range(256))
+
+
+class _FastBinaryData(_RawBinaryData):
+    """ Hold a location reference description as a byte buffer.
+
+        Whole locations are read at once with the precompiled struct layouts
+        of :py:func:`pylr.binary.read_plan`. Bit fields read with :py:meth:`getbits`
+        are extracted from an integer holding the whole buffer.
+    """
+
+    def __init__(self, data, base64=False, offset=0, size=None):
+        """ Constructor.
+
+            Data is not copied: location references can be read in place
+            from a bytearray, a memoryview or a mmap.
+        
+            :param string data: Binaray data, or any object supporting the buffer protocol
+            :param bool base64: True if data is coded in base64
+            :param int offset: Start of the location reference in data
+            :param int size: Size of the location reference (default: up to the end of data)
+        """
+        if base64:
+            if offset or size is not None:
+                data = buffer_view(data, offset, size)
+            self._reset(a2b_base64(data))
         else:
-            if area_code == AREA_CODE_CIRCLE:
-                loc_type = LocationType.CIRCLE
-            elif area_code == AREA_CODE_RECTANGLE:
-                # includes case AREA_CODE_GRID
-                if total_bytes == RECTANGLE_SIZE or total_bytes == LARGE_RECTANGLE_SIZE:
-                    loc_type = LocationType.RECTANGLE
-                elif total_bytes == GRID_SIZE or total_bytes == LARGE_GRID_SIZE:
-                    loc_type = LocationType.GRID
-                else:
-                    raise InvalidDataSizeError("Invalid byte size")
-            elif area_code == AREA_CODE_POLYGON:
-                if not has_attributes and total_bytes >= MIN_BYTES_POLYGON:
-                    loc_type = LocationType.POLYGON
-                else:
-                    raise InvalidDataSizeError("Invalid byte size")
-            else:
-                raise BinaryParseError('Invalid header')
+            self._reset(data, offset, size)
+
+    def _reset(self, data, offset=0, size=None):
+        """ Make this object hold another location reference,
+            so one instance can be reused for a whole sequence of locations.
+
+            :param string data: Binaray data, or any object supporting the buffer protocol
+            :param int offset: Start of the location reference in data
+            :param int size: Size of the location reference (default: up to the end of data)
+        """
+        # Forget the lazy properties of the previous data
+        self.__dict__.clear()
+
+        if size is None:
+            size = len(data) - offset
+        elif offset + size > len(data):
+            raise InvalidDataSizeError("not enough bytes in data")
+
+        #: raw data
+        self._data = data
+
+        #: start of the location reference in the raw data
+        self._offset = offset
+
+        #: raw data size
+        self._sz = size
+
+        #: bit position used by getbits
+        self._pos = 0
+
+    def _validate(self):
+        """ Check the header and the size of the data, without raising errors.
+            On success, header and location type are set.
+
+            :returns: The error found, None if the data is valid
+            :rtype: BinaryParseError
+        """
+        if self._sz < _MIN_BYTES:
+            return InvalidDataSizeError("not enough bytes in data")
+        header = _HEADERS[_HEADER_STRUCT.unpack_from(self._data, self._offset)[0]]
+        loc_type, error = _check_location_type(header, self._sz)
+        if error is not None:
+            return error
+        plan = read_plan(loc_type, self._sz)
+        if plan is None or plan.size != self._sz:
+            return InvalidDataSizeError("Invalid byte size")
+        self.header, self.location_type, self._pos = header, loc_type, BITS_PER_BYTE
+        return None
+
+    @lazyproperty
+    def _value(self):
+        """ The whole buffer as a single integer
+        """
+        return int(hexlify(buffer_view(self._data, self._offset, self._sz)), 16) if self._sz else 0
+
+    def getbits(self, *bits):
+        """ Read the given numbers of bits.
+        
+            :param tuple bits: Tuple of number of bits to read
+            :returns: Tuple of bit fields
+            :rtype: tuple
+        """
+        value, total, pos = self._value, self._sz * BITS_PER_BYTE, self._pos
+        fields = []
+        for v in bits:
+            signed, n = _bit_field(v)
+            pos += n
+            if pos > total:
+                raise InvalidDataSizeError("not enough bytes in data")
+            field = (value >> (total - pos)) & ((1 << n) - 1)
+            if signed and field >> (n - 1):
+                field -= 1 << n
+            fields.append(field)
+        self._pos = pos
+        return tuple(fields)
+
+    def get_position(self):
+        """ Returns position in the bit stream.
+        
+            :returns: Position in the bit stream
+            :rtype: int
+        """
+        return self._pos
+
+    def unpack(self):
+        """ Read the whole location reference with its read plan
+
+            :returns: Tuple of unpacked fields, the first one being the header
+            :rtype: tuple
+        """
+        plan = read_plan(self.location_type, self._sz)
+        if plan is None or plan.size != self._sz:
+            raise InvalidDataSizeError("Invalid byte size")
+        return plan.unpack_from(self._data, self._offset)
+
+    @lazyproperty
+    def header(self):
+        """ Parse header (once) location type
+        
+            :returns: Header data
+            :rtype: _BinaryHeader
+        """
+        # Validate data size
+        if self._sz < _MIN_BYTES:
+            raise InvalidDataSizeError("not enough bytes in data")
+
+        self._pos = BITS_PER_BYTE
+        return _HEADERS[_HEADER_STRUCT.unpack_from(self._data, self._offset)[0]]
+
+
+_BIT_FIELDS = {}
+
+
+def _bit_field(bits):
+    """ Parse a bit field description such as 'uint:3' or 'int:24' (once)
+
+        :param string bits: Bit field description
+        :returns: True if the field is signed, number of bits
+        :rtype: bool, int
+    """
+    try:
+        return _BIT_FIELDS[bits]
+    except KeyError:
+        kind, n = bits.split(':')
+        if kind not in ('int', 'uint'):
+            raise ValueError("Unsupported bit field {}".format(bits))
+        field = _BIT_FIELDS[bits] = (kind == 'int', int(n))
+        return field
+
+
+def _check_location_type(header, total_bytes):
+    """ Compute the location type from the header and the data size
+
+        Errors are returned instead of being raised, so callers
+        may handle invalid data without the cost of exceptions.
+
+        :param _BinaryHeader header: Header data
+        :param int total_bytes: Size of the data
+        :returns: Location type, error (None if the data is valid)
+        :rtype: LocationType, BinaryParseError
+    """
+    # Check version
+    if not _RawBinaryData.MIN_VERSION <= header.ver <= _RawBinaryData.MAX_VERSION:
+        return LocationType.UNKNOWN, BinaryVersionError("Invalid binary version {}".format(header.ver))
+
+    is_point = (header.pf == IS_POINT)
+    has_attributes = (header.af == HAS_ATTRIBUTES)
+    area_code = header.arf
+    is_area = ((area_code == 0 and not is_point and not has_attributes) or area_code > 0)
+
+    if not is_point and not is_area and has_attributes:
+        return LocationType.LINE_LOCATION, None
+    elif is_point and not is_area:
+        if not has_attributes:
+            if total_bytes == GEOCOORD_SIZE:
+                return LocationType.GEO_COORDINATES, None
+        else:
+            if total_bytes == POINT_ALONG_LINE_SIZE or total_bytes == (POINT_ALONG_LINE_SIZE + POINT_OFFSET_SIZE):
+                return LocationType.POINT_ALONG_LINE, None
+            elif total_bytes == POINT_WITH_ACCESS_SIZE or total_bytes == (POINT_WITH_ACCESS_SIZE + POINT_OFFSET_SIZE):
+                return LocationType.POI_WITH_ACCESS_POINT, None
+    elif is_area and not is_point and has_attributes:
+        if total_bytes >= MIN_BYTES_CLOSED_LINE_LOCATION:
+            return LocationType.CLOSED_LINE, None
+    else:
+        if area_code == AREA_CODE_CIRCLE:
+            return LocationType.CIRCLE, None
+        elif area_code == AREA_CODE_RECTANGLE:
+            # includes case AREA_CODE_GRID
+            if total_bytes == RECTANGLE_SIZE or total_bytes == LARGE_RECTANGLE_SIZE:
+                return LocationType.RECTANGLE, None
+            elif total_bytes == GRID_SIZE or total_bytes == LARGE_GRID_SIZE:
+                return LocationType.GRID, None
+        elif area_code == AREA_CODE_POLYGON:
+            if not has_attributes and total_bytes >= MIN_BYTES_POLYGON:
+                return LocationType.POLYGON, None
+        else:
+            return LocationType.UNKNOWN, BinaryParseError('Invalid header')
+
+    return LocationType.UNKNOWN, InvalidDataSizeError("Invalid byte size")
+
+
+# Parser backends
 
+# Reference backend, reading fields from a bitstring.BitStream
+BITSTRING_BACKEND = 'bitstring'
+
+# Fast backend, reading whole locations with precompiled struct layouts
+FAST_BACKEND = 'fast'
+
+DEFAULT_BACKEND = FAST_BACKEND
+
+_BACKENDS = {BITSTRING_BACKEND: _RawBinaryData,
+             FAST_BACKEND: _FastBinaryData}
+
+
+def _base64_header(data):
+    """ Get the first byte and the decoded size of base64 encoded data,
+        decoding only the first base64 quantum.
+
+        :param string data: base64 encoded data
+        :returns: First byte, decoded size, error (None if data is valid)
+        :rtype: int, int, BinaryParseError
+    """
+    n = len(data)
+    if n % 4 or n < 4:
+        return None, None, BinaryParseError("Invalid base64 data length")
+    pad = 2 if data[-2:] == '==' else 1 if data[-1:] == '=' else 0
+    try:
+        first = a2b_base64(data[:4])
+    except BinasciiError as e:
+        return None, None, BinaryParseError("Invalid base64 data: {}".format(e))
+    if not first:
+        return None, None, BinaryParseError("Invalid base64 data")
+    return _HEADER_STRUCT.unpack_from(first)[0], n // 4 * 3 - pad, None
+
+
+# The base64 alphabet, without the padding character
+_BASE64_CHARS = ascii_letters + digits + '+/'
+
+# Number of payloads decoded at once by parse_binary_many
+BASE64_BATCH_SIZE = 256
+
+
+def _base64_padding(data):
+    """ Check that data is strictly base64 encoded: length multiple of 4,
+        base64 characters only, and at most two padding characters at the end.
+
+        :param string data: base64 encoded data
+        :returns: Number of padding characters, error (None if data is valid)
+        :rtype: int, BinaryParseError
+    """
+    n = len(data)
+    if n % 4 or not n:
+        return None, BinaryParseError("Invalid base64 data length")
+    rest = data.translate(None, _BASE64_CHARS)
+    if rest and (len(rest) > 2 or rest.strip('=') or not data.endswith(rest)):
+        return None, BinaryParseError("Invalid base64 data")
+    return len(rest), None
+
+
+def decode_base64_many(payloads):
+    """ Decode base64 encoded payloads with a single call to binascii.
+
+        Payloads are checked without being decoded (see _base64_padding),
+        and valid ones are decoded at once into one buffer; their padding is
+        replaced by zero bits and the corresponding bytes are left out.
+        Payloads failing the check are accepted if binascii.a2b_base64
+        decodes them, as in :py:func:`parse_binary`.
+
+        :param payloads: Sequence of base64 encoded strings
+        :returns: Decoded data, and for each payload, either its (offset, size)
+                  in the decoded data or the error found
+        :rtype: string, list
+    """
+    chunks, spans, pos = [], [], 0
+    for data in payloads:
+        if not isinstance(data, str):
+            try:
+                data = data.encode('ascii') if isinstance(data, unicode) else buffer_view(data).tobytes()
+            except (UnicodeError, AttributeError, TypeError):
+                spans.append(BinaryParseError("Invalid base64 data"))
+                continue
+        pad, error = _base64_padding(data)
+        if error is not None:
+            # Same rules as parse_binary: a2b_base64 skips the characters
+            # out of the base64 alphabet (e.g. line breaks)
+            try:
+                data = b2a_base64(a2b_base64(data)).rstrip('\n')
+            except BinasciiError:
+                spans.append(error)
+                continue
+            pad, error = _base64_padding(data)
+            if error is not None:
+                spans.append(error)
+                continue
+        if pad:
+            data = data[:-pad] + 'A' * pad
+        sz = len(data) // 4 * 3
+        chunks.append(data)
+        spans.append((pos, sz - pad))
+        pos += sz
+    return a2b_base64(''.join(chunks)), spans
+
+
+def peek_location_type(data, base64=False, strict=True):
+    """ Get the location type of a location reference, without parsing it.
+
+        Only the first byte and the size of the data are used, with the same
+        rules as the parsers (version and size validation). Base64 encoded data
+        is not decoded, except for its first four characters.
+
+        :param data: string (encoded or not) describing the location
+        :param bool base64: True if encoded in base 64
+        :param bool strict: If False, return LocationType.UNKNOWN for invalid
+                            data instead of raising an error
+        :returns: Location type
+        :rtype: LocationType
+    """
+    if base64:
+        byte, sz, error = _base64_header(data)
+    else:
+        sz, error = len(data), None
+        if sz >= _MIN_BYTES:
+            byte = _HEADER_STRUCT.unpack_from(data)[0]
+    if error is None:
+        if sz < _MIN_BYTES:
+            error = InvalidDataSizeError("not enough bytes in data")
+        else:
+            loc_type, error = _check_location_type(_HEADERS[byte], sz)
+    if error is None:
         return loc_type
+    if strict:
+        raise error
+    return LocationType.UNKNOWN
 
 
-def init_binary_parsing(data, base64=False):
+def init_binary_parsing(data, base64=False, backend=DEFAULT_BACKEND, offset=0, size=None):
     """ Create an instance of _RawBinaryData
         The returned object can be passed to 'parse_binary'
         
-        :param string data: string describing the location
+        :param string data: string describing the location, or any object supporting the buffer protocol
         :param bool base64: True if encoded in base 64
+        :param string backend: Parser backend (FAST_BACKEND or BITSTRING_BACKEND)
+        :param int offset: Start of the location reference in data
+        :param int size: Size of the location reference (default: up to the end of data)
         :returns: Parsable data structure
         :rtype: _RawBinaryData
     """
-    return _RawBinaryData(data, base64)
+    try:
+        cls = _BACKENDS[backend]
+    except KeyError:
+        raise ValueError("Unknown parser backend {}".format(backend))
+    return cls(data, base64, offset, size)
 
 
-def parse_binary(data, base64=False):
+def parse_binary(data, base64=False, backend=DEFAULT_BACKEND, offset=0, size=None, lazy=False, spatial=False):
     """ Parse binary data.
         Input is original data or an object returned by init_binary_parsing(...)
         
-        :param data: string (encoded or not) describing the location
+        :param data: string (encoded or not) describing the location, or any
+                     object supporting the buffer protocol (bytearray, memoryview, mmap)
         :param bool base64: True if encoded in base 64
+        :param string backend: Parser backend (FAST_BACKEND or BITSTRING_BACKEND)
+        :param int offset: Start of the location reference in data
+        :param int size: Size of the location reference (default: up to the end of data)
+        :param bool lazy: If True, the intermediate points of line locations are
+                          decoded on first access (fast backend only, see LazyPoints)
+        :param bool spatial: If True, the location has 'bounds', 'centroid' and 'tile'
+                             attributes (see spatial_location)
         :returns: Object describing the parsed location, or an error object
     """
     if not isinstance(data, _RawBinaryData):
-        data = _RawBinaryData(data, base64)
+        data = init_binary_parsing(data, base64, backend, offset, size)
 
     # Get header
     loc_type = data.location_type
-    
+
+    if spatial and not isinstance(data, _FastBinaryData):
+        location = parse_binary(data)
+        return location if isinstance(location, BinaryParseError) else spatial_location(location)
+
+    if isinstance(data, _FastBinaryData):
+        parsers = _SPATIAL_PARSERS if spatial else _LAZY_PARSERS if lazy else _FAST_PARSERS
+        try:
+            return parsers[loc_type](data)
+        except KeyError:
+            return BinaryParseError("Invalid location type")
+
     if loc_type == LocationType.LINE_LOCATION:
         return parse_line(data)
     elif loc_type == LocationType.POINT_ALONG_LINE:
@@ -258,13 +612,157 @@ def parse_binary(data, base64=False):
     else:
         return BinaryParseError("Invalid location type")
 
+def buffer_view(data, offset=0, size=None):
+    """ Return a view on a part of data, without copying it.
+
+        :param data: Any object supporting the buffer protocol
+        :param int offset: Start of the view
+        :param int size: Size of the view (default: up to the end of data)
+        :returns: A memoryview (or a buffer, for objects like mmap that do not
+                  support memoryview in Python 2)
+    """
+    end = len(data) if size is None else offset + size
+    try:
+        return memoryview(data)[offset:end]
+    except TypeError:
+        return buffer(data, offset, end - offset)
+
+
+# The default format of length prefixes: unsigned short, big endian
+LENGTH_PREFIX_FMT = '>H'
+
+
+def iter_length_prefixed(data, offset=0, end=None, prefix=LENGTH_PREFIX_FMT):
+    """ Iterate over length prefixed records, such as location references
+        packed in a file. Records are returned as views, without copying
+        data, and can be passed to 'parse_binary' or 'parse_binary_many'.
+
+        :param data: Any object supporting the buffer protocol (e.g. a mmap)
+        :param int offset: Position of the first record
+        :param int end: End of the records (default: end of data)
+        :param string prefix: struct format of the length prefix
+        :returns: Generator of views on the records
+    """
+    prefix = Struct(prefix)
+    if end is None:
+        end = len(data)
+    while offset < end:
+        size, = prefix.unpack_from(data, offset)
+        offset += prefix.size
+        if offset + size > end:
+            raise InvalidDataSizeError("truncated record at offset {}".format(offset))
+        yield buffer_view(data, offset, size)
+        offset += size
+
+
+# Error policies of parse_binary_many
+
+# Yield the error object in place of the location
+ON_ERROR_YIELD = 'yield'
+
+# Skip invalid locations
+ON_ERROR_SKIP = 'skip'
+
+# Raise the error, stopping the iteration
+ON_ERROR_RAISE = 'raise'
+
+
+def parse_binary_many(iterable, base64=True, on_error=ON_ERROR_YIELD, lazy=False, spatial=False,
+                      intern_table=None):
+    """ Parse a sequence of location references.
+
+        Locations are parsed with the fast backend: one parsing object and the
+        read plans are reused for the whole sequence. Base64 encoded data is
+        strictly checked and decoded by batches (see decode_base64_many), and
+        parsed in place from the decoded batch. Invalid data is detected
+        without raising exceptions, and reported according to 'on_error':
+
+        * ON_ERROR_YIELD: the error object is yielded in place of the location
+        * ON_ERROR_SKIP: the location is skipped
+        * ON_ERROR_RAISE: the error is raised
+        * a callable: it is called with the (decoded) data and the error object,
+          and the location is skipped
+
+        :param iterable: strings (encoded or not) describing the locations, or
+                         views on buffers as returned by 'iter_length_prefixed'
+        :param bool base64: True if encoded in base 64
+        :param on_error: error policy
+        :param bool lazy: If True, the intermediate points of line locations are
+                          decoded on first access (see LazyPoints)
+        :param bool spatial: If True, locations have 'bounds', 'centroid' and 'tile'
+                             attributes (see spatial_location); 'lazy' is then ignored
+        :param intern_table: InternTable sharing equal LRPs and coordinates between
+                             locations (True for a new table); 'lazy' is then ignored
+        :returns: Generator of objects describing the parsed locations
+    """
+    if on_error not in (ON_ERROR_YIELD, ON_ERROR_SKIP, ON_ERROR_RAISE) and not callable(on_error):
+        raise ValueError("Invalid error policy {}".format(on_error))
+    parsers = _SPATIAL_PARSERS if spatial else _LAZY_PARSERS if lazy else _FAST_PARSERS
+    if intern_table is True:
+        intern_table = InternTable()
+    if isinstance(intern_table, InternTable):
+        if parsers is _LAZY_PARSERS:
+            parsers = _FAST_PARSERS
+        parsers = dict((t, _interning_parser(p, intern_table)) for t, p in parsers.items())
+    return _parse_binary_many(iterable, base64, on_error, parsers)
+
+
+def _decoded_payloads(iterable, base64):
+    """ Decode base64 payloads by batches of BASE64_BATCH_SIZE
+
+        :returns: Generator of (data, offset, size, error)
+    """
+    if not base64:
+        for data in iterable:
+            yield data, 0, None, None
+        return
+    iterable = iter(iterable)
+    while True:
+        batch = list(islice(iterable, BASE64_BATCH_SIZE))
+        if not batch:
+            return
+        decoded, spans = decode_base64_many(batch)
+        for data, span in izip(batch, spans):
+            if isinstance(span, BinaryParseError):
+                yield data, 0, None, span
+            else:
+                yield decoded, span[0], span[1], None
+
+
+def _parse_binary_many(iterable, base64, on_error, parsers):
+    rb = _FastBinaryData('')
+
+    for data, offset, size, error in _decoded_payloads(iterable, base64):
+        if error is None:
+            rb._reset(data, offset, size)
+            error = rb._validate()
+        if error is None:
+            try:
+                location = parsers[rb.location_type](rb)
+            except BinaryParseError as e:
+                error = e
+            else:
+                yield location
+                continue
+
+        if on_error == ON_ERROR_YIELD:
+            yield error
+        elif on_error == ON_ERROR_RAISE:
+            raise error
+        elif on_error != ON_ERROR_SKIP:
+            if size is not None:
+                data = data[offset:offset + size]
+            on_error(data, error)
+
 # ----------------
 # Location parsers
 # ----------------
 
 HEAD_FIELDS = ('version', 'type')
 
-from .binary import (_parse_first_lrp,
+from .binary import (Coords,
+                     LocationReferencePoint,
+                     _parse_first_lrp,
                      _parse_intermediate_lrp,
                      _parse_last_line_lrp,
                      _parse_last_closed_line_attrs,
@@ -272,7 +770,21 @@ from .binary import (_parse_first_lrp,
                      _parse_relative_coordinates,
                      _parse_absolute_coordinates,
                      _parse_radius,
-                     _parse_grid_dimensions)
+                     _parse_grid_dimensions,
+                     read_plan,
+                     _unpack_first_lrp,
+                     _unpack_intermediate_lrp,
+                     _unpack_last_line_lrp,
+                     _sum_relative_coordinates,
+                     _unpack_last_closed_line_attrs,
+                     _unpack_absolute_coordinates,
+                     _unpack_relative_coordinates,
+                     _offset_value,
+                     FIRST_LRP_FIELDS,
+                     LRP_FIELDS,
+                     LAST_LRP_FIELDS,
+                     ABS_COORDS_FIELDS,
+                     REL_COORDS_FIELDS)
 
 
 # LINE_LOCATION
@@ -504,3 +1016,823 @@ def parse_polygon(rb):
         rel = ilrp
 
     return PolygonLocation(rb.version, rb.location_type, points)
+
+
+# ----------------
+# Fast location parsers
+# ----------------
+#
+# Used by the fast backend: the location reference is unpacked at once
+# with its read plan, then decoded from the flat tuple of fields.
+# Results are the same as the ones of the bitstring backend.
+
+def _unpack_offsets(v, i, version, *flags):
+    """ Decode the trailing offsets selected by the given flags
+
+        :param tuple v: Unpacked fields
+        :param int i: Index of the first offset field
+        :param int version: Binary version
+        :param flags: Offset flags
+        :returns: Offsets values, 0 for unset flags
+        :rtype: list
+    """
+    if len(v) - i < sum(flags):
+        raise InvalidDataSizeError("not enough bytes for offsets")
+    offsets = []
+    for flag in flags:
+        if flag:
+            offsets.append(_offset_value(v[i], version))
+            i += 1
+        else:
+            offsets.append(0)
+    return offsets
+
+
+def _unpack_line(rb):
+    """ Fast version of :py:func:`parse_line` """
+    v = rb.unpack()
+    num_intermediates = (rb.num_bytes - MIN_BYTES_LINE_LOCATION) // LRP_SIZE
+
+    flrp = rel = _unpack_first_lrp(v, 1)
+    i = 1 + FIRST_LRP_FIELDS
+
+    points = []
+    for _ in xrange(num_intermediates):
+        rel = _unpack_intermediate_lrp(v, i, rel)
+        points.append(rel)
+        i += LRP_FIELDS
+
+    llrp, pofff, nofff = _unpack_last_line_lrp(v, i, rel.coords)
+    poffs, noffs = _unpack_offsets(v, i + LAST_LRP_FIELDS, rb.version, pofff, nofff)
+
+    return LineLocation(rb.version, LocationType.LINE_LOCATION, flrp, llrp, points, poffs, noffs)
+
+
+class LazyPoints(Sequence):
+    """ Intermediate location reference points of a line location,
+        decoded on first access.
+
+        The length is known without decoding. Once decoded, the points
+        are kept and the sequence behaves as a list of LocationReferencePoint.
+        Comparison with any other sequence is made point by point.
+    """
+
+    __slots__ = ('_v', '_start', '_count', '_flrp', '_points')
+
+    def __init__(self, v, start, count, flrp):
+        """ Constructor.
+
+            :param tuple v: Unpacked fields of the location reference
+            :param int start: Index of the first intermediate LRP fields
+            :param int count: Number of intermediate LRPs
+            :param LocationReferencePoint flrp: First LRP of the location
+        """
+        self._v = v
+        self._start = start
+        self._count = count
+        self._flrp = flrp
+        self._points = None
+
+    @property
+    def decoded(self):
+        """ True if the points have been decoded """
+        return self._points is not None
+
+    def _decode(self):
+        points = self._points
+        if points is None:
+            v, rel, points = self._v, self._flrp, []
+            for i in xrange(self._start, self._start + self._count * LRP_FIELDS, LRP_FIELDS):
+                rel = _unpack_intermediate_lrp(v, i, rel)
+                points.append(rel)
+            self._points = points
+            # Release fields and reference point
+            self._v = self._flrp = None
+        return points
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, index):
+        return self._decode()[index]
+
+    def __iter__(self):
+        return iter(self._decode())
+
+    def __eq__(self, other):
+        if not isinstance(other, Sequence):
+            return NotImplemented
+        return len(other) == self._count and list(self) == list(other)
+
+    def __ne__(self, other):
+        eq = self.__eq__(other)
+        return eq if eq is NotImplemented else not eq
+
+    __hash__ = None
+
+    def __repr__(self):
+        if self._points is None:
+            return "LazyPoints(<{} points>)".format(self._count)
+        return repr(self._points)
+
+    def __reduce__(self):
+        # Pickled as a plain list
+        return list, (self._decode(),)
+
+
+def _unpack_lazy_line(rb):
+    """ Lazy version of :py:func:`parse_line`:
+        the intermediate points are returned as LazyPoints.
+    """
+    v = rb.unpack()
+    num_intermediates = (rb.num_bytes - MIN_BYTES_LINE_LOCATION) // LRP_SIZE
+
+    flrp = _unpack_first_lrp(v, 1)
+    i = 1 + FIRST_LRP_FIELDS
+    points = LazyPoints(v, i, num_intermediates, flrp)
+
+    rel = _sum_relative_coordinates(v, i, num_intermediates, flrp.coords)
+    i += num_intermediates * LRP_FIELDS
+
+    llrp, pofff, nofff = _unpack_last_line_lrp(v, i, rel)
+    poffs, noffs = _unpack_offsets(v, i + LAST_LRP_FIELDS, rb.version, pofff, nofff)
+
+    return LineLocation(rb.version, LocationType.LINE_LOCATION, flrp, llrp, points, poffs, noffs)
+
+
+def _unpack_point_along_line(rb):
+    """ Fast version of :py:func:`parse_point_along_line` """
+    v = rb.unpack()
+    flrp = _unpack_first_lrp(v, 1)
+    i = 1 + FIRST_LRP_FIELDS
+    llrp, pofff, _ = _unpack_last_line_lrp(v, i, flrp.coords)
+    poffs, = _unpack_offsets(v, i + LAST_LRP_FIELDS, rb.version, pofff)
+
+    return PointAlongLineLocation(rb.version, LocationType.POINT_ALONG_LINE, flrp, llrp, poffs)
+
+
+def _unpack_geo_coordinates(rb):
+    """ Fast version of :py:func:`parse_geo_coordinates` """
+    v = rb.unpack()
+    return GeoCoordinateLocation(rb.version, LocationType.GEO_COORDINATES,
+                                 _unpack_absolute_coordinates(v, 1))
+
+
+def _unpack_poi_with_access_point(rb):
+    """ Fast version of :py:func:`parse_poi_with_access_point` """
+    v = rb.unpack()
+    flrp = _unpack_first_lrp(v, 1)
+    i = 1 + FIRST_LRP_FIELDS
+    llrp, pofff, _ = _unpack_last_line_lrp(v, i, flrp.coords)
+    i += LAST_LRP_FIELDS
+    # The POI coordinates follow the optional offset
+    end = len(v) - REL_COORDS_FIELDS
+    poffs, = _unpack_offsets(v[:end], i, rb.version, pofff)
+    coords = _unpack_relative_coordinates(v, end, flrp.coords)
+
+    return PoiWithAccessPointLocation(rb.version, LocationType.POI_WITH_ACCESS_POINT, flrp, llrp,
+                                      poffs, coords)
+
+
+def _unpack_circle(rb):
+    """ Fast version of :py:func:`parse_circle` """
+    v = rb.unpack()
+    coords = _unpack_absolute_coordinates(v, 1)
+    radius = v[1 + ABS_COORDS_FIELDS]
+    if len(v) > 2 + ABS_COORDS_FIELDS:
+        # 24 bits radius
+        radius = (radius << 8) | v[2 + ABS_COORDS_FIELDS]
+
+    return CircleLocation(rb.version, LocationType.CIRCLE, coords, radius)
+
+
+def _unpack_bbox(rb, v):
+    """ Decode the bounding box of rectangle and grid locations
+
+        :returns: Bounding box, index of the next field
+        :rtype: BBox, int
+    """
+    bl = _unpack_absolute_coordinates(v, 1)
+    i = 1 + ABS_COORDS_FIELDS
+    if rb.num_bytes in (LARGE_RECTANGLE_SIZE, LARGE_GRID_SIZE):
+        tr = _unpack_absolute_coordinates(v, i)
+        i += ABS_COORDS_FIELDS
+    else:
+        tr = _unpack_relative_coordinates(v, i, bl)
+        i += REL_COORDS_FIELDS
+    return BBox(bl.lon, bl.lat, tr.lon, tr.lat), i
+
+
+def _unpack_rectangle(rb):
+    """ Fast version of :py:func:`parse_rectangle` """
+    bbox, _ = _unpack_bbox(rb, rb.unpack())
+    return RectangleLocation(rb.version, LocationType.RECTANGLE, bbox)
+
+
+def _unpack_grid(rb):
+    """ Fast version of :py:func:`parse_grid` """
+    v = rb.unpack()
+    bbox, i = _unpack_bbox(rb, v)
+    return GridLocation(rb.version, LocationType.GRID, bbox, v[i], v[i+1])
+
+
+def _unpack_closed_line(rb):
+    """ Fast version of :py:func:`parse_closed_line` """
+    v = rb.unpack()
+    num_intermediates = (rb.num_bytes - MIN_BYTES_CLOSED_LINE_LOCATION) // LRP_SIZE
+
+    flrp = rel = _unpack_first_lrp(v, 1)
+    i = 1 + FIRST_LRP_FIELDS
+
+    points = []
+    for _ in xrange(num_intermediates):
+        rel = _unpack_intermediate_lrp(v, i, rel)
+        points.append(rel)
+        i += LRP_FIELDS
+
+    frc, fow, bear = _unpack_last_closed_line_attrs(v, i)
+
+    return ClosedLineLocation(rb.version, LocationType.CLOSED_LINE, flrp, points, frc, fow, bear)
+
+
+def _unpack_polygon(rb):
+    """ Fast version of :py:func:`parse_polygon` """
+    v = rb.unpack()
+
+    rel = _unpack_absolute_coordinates(v, 1)
+    points = [rel]
+    for i in xrange(1 + ABS_COORDS_FIELDS, len(v), REL_COORDS_FIELDS):
+        rel = _unpack_relative_coordinates(v, i, rel)
+        points.append(rel)
+
+    return PolygonLocation(rb.version, LocationType.POLYGON, points)
+
+
+_FAST_PARSERS = {LocationType.LINE_LOCATION: _unpack_line,
+                 LocationType.POINT_ALONG_LINE: _unpack_point_along_line,
+                 LocationType.GEO_COORDINATES: _unpack_geo_coordinates,
+                 LocationType.POI_WITH_ACCESS_POINT: _unpack_poi_with_access_point,
+                 LocationType.RECTANGLE: _unpack_rectangle,
+                 LocationType.CLOSED_LINE: _unpack_closed_line,
+                 LocationType.CIRCLE: _unpack_circle,
+                 LocationType.GRID: _unpack_grid,
+                 LocationType.POLYGON: _unpack_polygon}
+
+_LAZY_PARSERS = dict(_FAST_PARSERS)
+_LAZY_PARSERS[LocationType.LINE_LOCATION] = _unpack_lazy_line
+
+
+# ----------------
+# Spatial metadata
+# ----------------
+
+class _SpatialLocation(object):
+    """ Spatial attributes of a parsed location:
+
+        * bounds (BBox): bounding box of the location
+        * centroid (Coords): mean of the points of the location
+          (center of circles, rectangles and grids)
+        * tile (int): tile key of the centroid (see :py:func:`pylr.spatial.tile_key`),
+          computed on first access
+    """
+
+    __slots__ = ()
+
+    def _set_spatial(self, minx, miny, maxx, maxy, lon, lat):
+        self.bounds = BBox(minx, miny, maxx, maxy)
+        self.centroid = Coords(lon, lat)
+
+    @lazyproperty
+    def tile(self):
+        """ Tile key of the centroid, computed on first access """
+        return tile_key(*self.centroid)
+
+    def __getstate__(self):
+        # Keep spatial attributes when pickling
+        return self.__dict__
+
+
+def _spatial_type(cls):
+    """ Subclass of a location type with spatial attributes;
+        instances are equal to the locations of the original type.
+    """
+    return type('Spatial' + cls.__name__, (_SpatialLocation, cls), {'__doc__': _SpatialLocation.__doc__})
+
+
+SpatialLineLocation = _spatial_type(LineLocation)
+SpatialPointAlongLineLocation = _spatial_type(PointAlongLineLocation)
+SpatialGeoCoordinateLocation = _spatial_type(GeoCoordinateLocation)
+SpatialPoiWithAccessPointLocation = _spatial_type(PoiWithAccessPointLocation)
+SpatialCircleLocation = _spatial_type(CircleLocation)
+SpatialRectangleLocation = _spatial_type(RectangleLocation)
+SpatialGridLocation = _spatial_type(GridLocation)
+SpatialClosedLineLocation = _spatial_type(ClosedLineLocation)
+SpatialPolygonLocation = _spatial_type(PolygonLocation)
+
+_SPATIAL_TYPES = {LocationType.LINE_LOCATION: SpatialLineLocation,
+                  LocationType.POINT_ALONG_LINE: SpatialPointAlongLineLocation,
+                  LocationType.GEO_COORDINATES: SpatialGeoCoordinateLocation,
+                  LocationType.POI_WITH_ACCESS_POINT: SpatialPoiWithAccessPointLocation,
+                  LocationType.CIRCLE: SpatialCircleLocation,
+                  LocationType.RECTANGLE: SpatialRectangleLocation,
+                  LocationType.GRID: SpatialGridLocation,
+                  LocationType.CLOSED_LINE: SpatialClosedLineLocation,
+                  LocationType.POLYGON: SpatialPolygonLocation}
+
+_new = tuple.__new__
+
+
+def _location_points(location):
+    """ Coordinates of the points of a location (not applicable to
+        circles, rectangles and grids)
+    """
+    t = location.type
+    if t == LocationType.GEO_COORDINATES:
+        return [location.coords]
+    if t == LocationType.POLYGON:
+        return location.points
+    points = [location.flrp.coords]
+    if t in (LocationType.LINE_LOCATION, LocationType.CLOSED_LINE):
+        points.extend(p.coords for p in location.points)
+    if t != LocationType.CLOSED_LINE:
+        points.append(location.llrp.coords)
+    if t == LocationType.POI_WITH_ACCESS_POINT:
+        points.append(location.coords)
+    return points
+
+
+def spatial_location(location):
+    """ Add spatial attributes to a parsed location
+
+        :param location: Object describing the location
+        :returns: The same location, with 'bounds', 'centroid' and 'tile' attributes
+    """
+    result = _new(_SPATIAL_TYPES[location.type], location)
+    t = location.type
+    if t == LocationType.CIRCLE:
+        lon, lat = location.coords
+        dlon, dlat = radius_extent(lat, location.radius)
+        result._set_spatial(lon - dlon, lat - dlat, lon + dlon, lat + dlat, lon, lat)
+    elif t in (LocationType.RECTANGLE, LocationType.GRID):
+        minx, miny, maxx, maxy = location.bbox
+        if t == LocationType.GRID:
+            # The bounding box is the lower left cell of the grid
+            maxx = minx + (maxx - minx) * location.cols
+            maxy = miny + (maxy - miny) * location.rows
+        result._set_spatial(minx, miny, maxx, maxy, (minx + maxx) / 2, (miny + maxy) / 2)
+    else:
+        points = _location_points(location)
+        lons = [c.lon for c in points]
+        lats = [c.lat for c in points]
+        result._set_spatial(min(lons), min(lats), max(lons), max(lats),
+                            sum(lons) / len(lons), sum(lats) / len(lats))
+    return result
+
+
+def _unpack_spatial_lrps(v, flrp, count):
+    """ Decode intermediate LRPs (laid out as LRP_FMT) and compute
+        their extent in the same pass.
+
+        :returns: LRPs, min lon, min lat, max lon, max lat, sum of lon, sum of lat
+    """
+    minx = maxx = sumx = flrp.coords.lon
+    miny = maxy = sumy = flrp.coords.lat
+    rel, points = flrp, []
+    i = 1 + FIRST_LRP_FIELDS
+    for _ in xrange(count):
+        rel = _unpack_intermediate_lrp(v, i, rel)
+        points.append(rel)
+        lon, lat = rel.coords
+        if lon < minx:
+            minx = lon
+        elif lon > maxx:
+            maxx = lon
+        if lat < miny:
+            miny = lat
+        elif lat > maxy:
+            maxy = lat
+        sumx += lon
+        sumy += lat
+        i += LRP_FIELDS
+    return points, minx, miny, maxx, maxy, sumx, sumy
+
+
+def _unpack_spatial_line(rb):
+    """ Version of :py:func:`_unpack_line` computing spatial attributes """
+    v = rb.unpack()
+    num_intermediates = (rb.num_bytes - MIN_BYTES_LINE_LOCATION) // LRP_SIZE
+
+    flrp = _unpack_first_lrp(v, 1)
+    points, minx, miny, maxx, maxy, sumx, sumy = _unpack_spatial_lrps(v, flrp, num_intermediates)
+    rel = points[-1] if points else flrp
+    i = 1 + FIRST_LRP_FIELDS + num_intermediates * LRP_FIELDS
+
+    llrp, pofff, nofff = _unpack_last_line_lrp(v, i, rel.coords)
+    poffs, noffs = _unpack_offsets(v, i + LAST_LRP_FIELDS, rb.version, pofff, nofff)
+
+    location = _new(SpatialLineLocation, (rb.version, LocationType.LINE_LOCATION, flrp, llrp, points, poffs, noffs))
+    lon, lat = llrp.coords
+    count = num_intermediates + 2
+    location._set_spatial(min(minx, lon), min(miny, lat), max(maxx, lon), max(maxy, lat),
+                          (sumx + lon) / count, (sumy + lat) / count)
+    return location
+
+
+def _unpack_spatial_closed_line(rb):
+    """ Version of :py:func:`_unpack_closed_line` computing spatial attributes """
+    v = rb.unpack()
+    num_intermediates = (rb.num_bytes - MIN_BYTES_CLOSED_LINE_LOCATION) // LRP_SIZE
+
+    flrp = _unpack_first_lrp(v, 1)
+    points, minx, miny, maxx, maxy, sumx, sumy = _unpack_spatial_lrps(v, flrp, num_intermediates)
+    frc, fow, bear = _unpack_last_closed_line_attrs(v, 1 + FIRST_LRP_FIELDS + num_intermediates * LRP_FIELDS)
+
+    location = _new(SpatialClosedLineLocation, (rb.version, LocationType.CLOSED_LINE, flrp, points, frc, fow, bear))
+    count = num_intermediates + 1
+    location._set_spatial(minx, miny, maxx, maxy, sumx / count, sumy / count)
+    return location
+
+
+def _unpack_spatial_polygon(rb):
+    """ Version of :py:func:`_unpack_polygon` computing spatial attributes """
+    v = rb.unpack()
+
+    rel = _unpack_absolute_coordinates(v, 1)
+    minx = maxx = sumx = rel.lon
+    miny = maxy = sumy = rel.lat
+    points = [rel]
+    for i in xrange(1 + ABS_COORDS_FIELDS, len(v), REL_COORDS_FIELDS):
+        rel = _unpack_relative_coordinates(v, i, rel)
+        points.append(rel)
+        lon, lat = rel
+        if lon < minx:
+            minx = lon
+        elif lon > maxx:
+            maxx = lon
+        if lat < miny:
+            miny = lat
+        elif lat > maxy:
+            maxy = lat
+        sumx += lon
+        sumy += lat
+
+    location = _new(SpatialPolygonLocation, (rb.version, LocationType.POLYGON, points))
+    location._set_spatial(minx, miny, maxx, maxy, sumx / len(points), sumy / len(points))
+    return location
+
+
+def _spatial_parser(parser):
+    return lambda rb: spatial_location(parser(rb))
+
+
+_SPATIAL_PARSERS = dict((t, _spatial_parser(p)) for t, p in _FAST_PARSERS.items())
+_SPATIAL_PARSERS[LocationType.LINE_LOCATION] = _unpack_spatial_line
+_SPATIAL_PARSERS[LocationType.CLOSED_LINE] = _unpack_spatial_closed_line
+_SPATIAL_PARSERS[LocationType.POLYGON] = _unpack_spatial_polygon
+
+
+# ----------------
+# Interning
+# ----------------
+
+''' Default maximum number of interned objects '''
+DEFAULT_INTERN_SIZE = 100000
+
+
+class InternTable(object):
+    """ Table of shared LRPs and coordinates.
+
+        Locations passed through the table get, for equal LRPs and
+        coordinates, the same immutable objects: repeated junctions are
+        stored once, and may be compared by identity.
+
+        The table is emptied when it holds more than maxsize objects:
+        objects interned later are then distinct from the previous ones.
+
+        :param int maxsize: Maximum number of interned objects
+    """
+
+    def __init__(self, maxsize=DEFAULT_INTERN_SIZE):
+        self.maxsize = maxsize
+        self._objects = {}
+
+    def _add(self, obj):
+        objects = self._objects
+        if len(objects) >= self.maxsize:
+            objects.clear()
+        objects[obj] = obj
+        return obj
+
+    def coords(self, coords):
+        """ Interned coordinates """
+        try:
+            return self._objects[coords]
+        except KeyError:
+            return self._add(coords)
+
+    def lrp(self, lrp):
+        """ Interned location reference point, with interned coordinates """
+        try:
+            return self._objects[lrp]
+        except KeyError:
+            coords = self.coords(lrp.coords)
+            if coords is not lrp.coords:
+                lrp = _new(LocationReferencePoint, (coords,) + lrp[1:])
+            return self._add(lrp)
+
+    def location(self, location):
+        """ Location with interned LRPs and coordinates
+
+            :param location: Object describing the location
+            :returns: Equal location
+        """
+        try:
+            intern_location = _INTERNERS[location.type]
+        except KeyError:
+            return location
+        interned = intern_location(self, location)
+        if isinstance(location, _SpatialLocation):
+            interned.__dict__.update(location.__dict__)
+        return interned
+
+    def __len__(self):
+        return len(self._objects)
+
+    def clear(self):
+        self._objects.clear()
+
+
+def _intern_line(table, loc):
+    lrp = table.lrp
+    return _new(type(loc), (loc.version, loc.type, lrp(loc.flrp), lrp(loc.llrp), [lrp(p) for p in loc.points],
+                            loc.poffs, loc.noffs))
+
+
+def _intern_point_along_line(table, loc):
+    return _new(type(loc), (loc.version, loc.type, table.lrp(loc.flrp), table.lrp(loc.llrp), loc.poffs))
+
+
+def _intern_poi_with_access_point(table, loc):
+    return _new(type(loc), (loc.version, loc.type, table.lrp(loc.flrp), table.lrp(loc.llrp), loc.poffs,
+                            table.coords(loc.coords)))
+
+
+def _intern_coords(table, loc):
+    # Geo coordinates and circle
+    return _new(type(loc), (loc.version, loc.type, table.coords(loc.coords)) + loc[3:])
+
+
+def _intern_closed_line(table, loc):
+    lrp = table.lrp
+    return _new(type(loc), (loc.version, loc.type, lrp(loc.flrp), [lrp(p) for p in loc.points]) + loc[4:])
+
+
+def _intern_polygon(table, loc):
+    coords = table.coords
+    return _new(type(loc), (loc.version, loc.type, [coords(c) for c in loc.points]))
+
+
+_INTERNERS = {LocationType.LINE_LOCATION: _intern_line,
+              LocationType.POINT_ALONG_LINE: _intern_point_along_line,
+              LocationType.POI_WITH_ACCESS_POINT: _intern_poi_with_access_point,
+              LocationType.GEO_COORDINATES: _intern_coords,
+              LocationType.CIRCLE: _intern_coords,
+              LocationType.CLOSED_LINE: _intern_closed_line,
+              LocationType.POLYGON: _intern_polygon}
+
+
+def _interning_parser(parser, table):
+    return lambda rb: table.location(parser(rb))
+
+
+# ----------------
+# Packed records
+# ----------------
+
+# Parsed locations packed as fixed width little endian records, for moving
+# them between processes: a header (version, type, number of points)
+# followed by a body whose layout depends on the type and on the number of
+# points only. LRPs are stored as (lon, lat, bear, orient, frc, fow, lfrcnp, dnp),
+# last LRPs without lfrcnp and dnp. Spatial attributes are not stored.
+
+_PACKED_HEADER = Struct('<BBI')
+
+_PACKED_LRP = 'ddBBBBBd'
+_PACKED_LAST_LRP = 'ddBBBB'
+
+
+def _packed_layout(location_type, count):
+    """ Struct layout of the body of a packed location """
+    if location_type == LocationType.LINE_LOCATION:
+        return _PACKED_LRP * (count + 1) + _PACKED_LAST_LRP + 'dd'
+    if location_type == LocationType.POINT_ALONG_LINE:
+        return _PACKED_LRP + _PACKED_LAST_LRP + 'd'
+    if location_type == LocationType.POI_WITH_ACCESS_POINT:
+        return _PACKED_LRP + _PACKED_LAST_LRP + 'ddd'
+    if location_type == LocationType.GEO_COORDINATES:
+        return 'dd'
+    if location_type == LocationType.CIRCLE:
+        return 'ddI'
+    if location_type == LocationType.RECTANGLE:
+        return 'dddd'
+    if location_type == LocationType.GRID:
+        return 'ddddHH'
+    if location_type == LocationType.CLOSED_LINE:
+        return _PACKED_LRP * (count + 1) + 'BBB'
+    if location_type == LocationType.POLYGON:
+        return 'dd' * count
+    raise ValueError("Cannot pack location type {}".format(location_type))
+
+
+# Layouts of locations with more points are compiled for each use
+_MAX_CACHED_LAYOUT_POINTS = 64
+
+
+class _PackedLayouts(dict):
+    """ Compiled layouts by (location type, number of points) """
+
+    def __missing__(self, key):
+        layout = Struct('<' + _packed_layout(*key))
+        if key[1] <= _MAX_CACHED_LAYOUT_POINTS:
+            self[key] = layout
+        return layout
+
+    def size(self, location_type, count):
+        """ Size of a body, computed without compiling its layout """
+        size = self[location_type, 0].size
+        return size + count * (self[location_type, 1].size - size)
+
+
+_PACKED_LAYOUTS = _PackedLayouts()
+
+
+def _flat_lrps(lrps):
+    values = []
+    for lrp in lrps:
+        values.extend(lrp.coords)
+        values.extend(lrp[1:])
+    return values
+
+
+def _flat_last_lrp(lrp):
+    return lrp.coords + lrp[1:5]
+
+
+def _pack_line(loc):
+    return len(loc.points), (_flat_lrps([loc.flrp] + list(loc.points)) + list(_flat_last_lrp(loc.llrp)) +
+                             [loc.poffs, loc.noffs])
+
+
+def _pack_point_along_line(loc):
+    return 0, _flat_lrps([loc.flrp]) + list(_flat_last_lrp(loc.llrp)) + [loc.poffs]
+
+
+def _pack_poi_with_access_point(loc):
+    return 0, _flat_lrps([loc.flrp]) + list(_flat_last_lrp(loc.llrp)) + [loc.poffs] + list(loc.coords)
+
+
+def _pack_coords(loc):
+    # Geo coordinates and circle
+    return 0, loc.coords + loc[3:]
+
+
+def _pack_bbox(loc):
+    # Rectangle and grid
+    return 0, loc.bbox + loc[3:]
+
+
+def _pack_closed_line(loc):
+    return len(loc.points), _flat_lrps([loc.flrp] + list(loc.points)) + [loc.frc, loc.fow, loc.bear]
+
+
+def _pack_polygon(loc):
+    values = []
+    for c in loc.points:
+        values.extend(c)
+    return len(loc.points), values
+
+
+_PACKERS = {LocationType.LINE_LOCATION: _pack_line,
+            LocationType.POINT_ALONG_LINE: _pack_point_along_line,
+            LocationType.POI_WITH_ACCESS_POINT: _pack_poi_with_access_point,
+            LocationType.GEO_COORDINATES: _pack_coords,
+            LocationType.CIRCLE: _pack_coords,
+            LocationType.RECTANGLE: _pack_bbox,
+            LocationType.GRID: _pack_bbox,
+            LocationType.CLOSED_LINE: _pack_closed_line,
+            LocationType.POLYGON: _pack_polygon}
+
+
+def _packed_lrps(v, stop):
+    """ LRPs stored in v[:stop] """
+    return [_new(LocationReferencePoint, (_new(Coords, v[k:k+2]),) + v[k+2:k+8]) for k in xrange(0, stop, 8)]
+
+
+def _packed_last_lrp(v, k):
+    return _new(LocationReferencePoint, (_new(Coords, v[k:k+2]),) + v[k+2:k+6] + (None, None))
+
+
+# Absent offsets are parsed as 0, present ones as floats
+def _unpack_packed_line(version, count, v):
+    k = 8 * (count + 1)
+    lrps = _packed_lrps(v, k)
+    return _new(LineLocation, (version, LocationType.LINE_LOCATION, lrps[0], _packed_last_lrp(v, k), lrps[1:],
+                               v[k+6] or 0, v[k+7] or 0))
+
+
+def _unpack_packed_point_along_line(version, count, v):
+    return _new(PointAlongLineLocation, (version, LocationType.POINT_ALONG_LINE, _packed_lrps(v, 8)[0],
+                                         _packed_last_lrp(v, 8), v[14] or 0))
+
+
+def _unpack_packed_poi_with_access_point(version, count, v):
+    return _new(PoiWithAccessPointLocation, (version, LocationType.POI_WITH_ACCESS_POINT, _packed_lrps(v, 8)[0],
+                                             _packed_last_lrp(v, 8), v[14] or 0, _new(Coords, v[15:17])))
+
+
+def _unpack_packed_geo_coordinates(version, count, v):
+    return _new(GeoCoordinateLocation, (version, LocationType.GEO_COORDINATES, _new(Coords, v)))
+
+
+def _unpack_packed_circle(version, count, v):
+    return _new(CircleLocation, (version, LocationType.CIRCLE, _new(Coords, v[:2]), v[2]))
+
+
+def _unpack_packed_rectangle(version, count, v):
+    return _new(RectangleLocation, (version, LocationType.RECTANGLE, _new(BBox, v)))
+
+
+def _unpack_packed_grid(version, count, v):
+    return _new(GridLocation, (version, LocationType.GRID, _new(BBox, v[:4])) + v[4:])
+
+
+def _unpack_packed_closed_line(version, count, v):
+    k = 8 * (count + 1)
+    lrps = _packed_lrps(v, k)
+    return _new(ClosedLineLocation, (version, LocationType.CLOSED_LINE, lrps[0], lrps[1:]) + v[k:])
+
+
+def _unpack_packed_polygon(version, count, v):
+    return _new(PolygonLocation, (version, LocationType.POLYGON,
+                                  [_new(Coords, v[k:k+2]) for k in xrange(0, 2 * count, 2)]))
+
+
+_UNPACKERS = {LocationType.LINE_LOCATION: _unpack_packed_line,
+              LocationType.POINT_ALONG_LINE: _unpack_packed_point_along_line,
+              LocationType.POI_WITH_ACCESS_POINT: _unpack_packed_poi_with_access_point,
+              LocationType.GEO_COORDINATES: _unpack_packed_geo_coordinates,
+              LocationType.CIRCLE: _unpack_packed_circle,
+              LocationType.RECTANGLE: _unpack_packed_rectangle,
+              LocationType.GRID: _unpack_packed_grid,
+              LocationType.CLOSED_LINE: _unpack_packed_closed_line,
+              LocationType.POLYGON: _unpack_packed_polygon}
+
+
+def pack_locations(locations):
+    """ Pack parsed locations into fixed width binary records.
+
+        Much smaller and faster than pickle: meant for sending parsed
+        locations to another process. Spatial attributes are not packed.
+
+        :param locations: iterable of objects describing the locations
+        :returns: Packed locations
+        :rtype: str
+        :raises ValueError: if a location type cannot be packed
+    """
+    header = _PACKED_HEADER.pack
+    layouts = _PACKED_LAYOUTS
+    records = []
+    for location in locations:
+        try:
+            count, values = _PACKERS[location.type](location)
+        except KeyError:
+            raise ValueError("Cannot pack location type {}".format(location.type))
+        records.append(header(location.version, location.type, count))
+        records.append(layouts[location.type, count].pack(*values))
+    return ''.join(records)
+
+
+def unpack_locations(data):
+    """ Unpack locations packed by :py:func:`pack_locations`
+
+        :param data: Packed locations, as a string or any object supporting
+                     the buffer protocol
+        :returns: Generator of objects describing the locations
+        :raises ValueError: if data is truncated or invalid
+    """
+    header = _PACKED_HEADER.unpack_from
+    header_size = _PACKED_HEADER.size
+    layouts = _PACKED_LAYOUTS
+    offset, end = 0, len(data)
+    while offset < end:
+        try:
+            version, location_type, count = header(data, offset)
+        except StructError as e:
+            raise ValueError("Truncated packed locations: {}".format(e))
+        # Check the number of points before compiling a layout for it
+        if offset + header_size + layouts.size(location_type, count) > end:
+            raise ValueError("Truncated packed locations: {} points at offset {}".format(count, offset))
+        layout = layouts[location_type, count]
+        values = layout.unpack_from(data, offset + header_size)
+        yield _UNPACKERS[location_type](version, count, values)
+        offset += header_size + layout.size
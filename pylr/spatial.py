@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+''' Spatial helpers for parsed locations
+
+    .. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+    Tile keys order locations along a Z-order (Morton) curve over a regular
+    longitude/latitude grid: sorting locations by tile key groups nearby
+    locations together.
+'''
+
+from math import cos, radians
+
+
+''' Default level of tile keys: the grid has 2**TILE_LEVEL columns and rows '''
+TILE_LEVEL = 16
+
+''' Approximate length of a degree of latitude, in meters '''
+METERS_PER_DEGREE = 111320.0
+
+
+def _spread(v):
+    """ Insert a zero bit between the bits of an 8 bits value """
+    r = 0
+    for b in xrange(8):
+        r |= ((v >> b) & 1) << (2 * b)
+    return r
+
+
+_SPREAD = tuple(_spread(v) for v in xrange(256))
+
+
+def tile_key(lon, lat, level=TILE_LEVEL):
+    """ Compute the tile key of a point: the Z-order interleaving of the
+        column and row of the tile holding the point.
+
+        :param float lon: Longitude (in degrees)
+        :param float lat: Latitude (in degrees)
+        :param int level: Tile level
+        :returns: Tile key
+        :rtype: int
+    """
+    n = 1 << level
+    x = min(max(int((lon + 180.0) * n / 360.0), 0), n - 1)
+    y = min(max(int((lat + 90.0) * n / 180.0), 0), n - 1)
+    key, shift = 0, 0
+    while x or y:
+        key |= (_SPREAD[x & 0xff] | (_SPREAD[y & 0xff] << 1)) << shift
+        x >>= 8
+        y >>= 8
+        shift += 16
+    return key
+
+
+def radius_extent(lat, radius):
+    """ Half width and half height, in degrees, of the box holding a circle
+
+        :param float lat: Latitude of the center (in degrees)
+        :param int radius: Radius (in meters)
+        :returns: Longitude extent, latitude extent
+        :rtype: float, float
+    """
+    dlat = radius / METERS_PER_DEGREE
+    c = cos(radians(lat))
+    return (dlat / c if c > 1e-9 else 180.0), dlat
+
+
+def bbox_intersects(a, b):
+    """ Check if two bounding boxes intersect
+
+        :param BBox a: First bounding box
+        :param BBox b: Second bounding box
+        :rtype: bool
+    """
+    return a.minx <= b.maxx and b.minx <= a.maxx and a.miny <= b.maxy and b.miny <= a.maxy
+
+
+def distance(a, b):
+    """ Approximate distance between two points (equirectangular projection)
+
+        :param Coords a: First point
+        :param Coords b: Second point
+        :returns: Distance in meters
+        :rtype: float
+    """
+    dlon = abs(a.lon - b.lon)
+    if dlon > 180.0:
+        dlon = 360.0 - dlon
+    dx = dlon * cos(radians((a.lat + b.lat) / 2.0))
+    dy = a.lat - b.lat
+    return METERS_PER_DEGREE * (dx * dx + dy * dy) ** 0.5
+
+
+def distances(lon1, lat1, lon2, lat2):
+    """ Approximate distances between points (equirectangular projection):
+        vectorized :py:func:`distance`. Requires numpy.
+
+        :param lon1: Longitudes of the first points (numpy array or float)
+        :param lat1: Latitudes of the first points
+        :param lon2: Longitudes of the second points
+        :param lat2: Latitudes of the second points
+        :returns: Distances in meters
+        :rtype: numpy.ndarray
+    """
+    # Imported here: parsing locations does not need numpy
+    import numpy as np
+    dlon = np.abs(lon1 - lon2)
+    dlon = np.where(dlon > 180.0, 360.0 - dlon, dlon)
+    dx = dlon * np.cos(np.radians((lat1 + lat2) / 2.0))
+    dy = lat1 - lat2
+    return METERS_PER_DEGREE * np.sqrt(dx * dx + dy * dy)
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Benchmarks. Each benchmark module defines a 'run()' function returning
+a list of results (dictionaries).
+
+Run with: python -m pylr.tests.benchmarks [module ...]
+"""
+
+import sys
+import json
+from importlib import import_module
+from array import array
+
+BENCHMARK_MODULES = [
+    'pylr.tests.benchmarks.bench_memory',
+    'pylr.tests.benchmarks.bench_parallel',
+    'pylr.tests.benchmarks.bench_xml',
+    'pylr.tests.benchmarks.bench_columnar',
+    'pylr.tests.benchmarks.bench_import',
+    'pylr.tests.benchmarks.bench_parser',
+    'pylr.tests.benchmarks.bench_mapdb',
+]
+
+
+def deep_sizeof(obj, seen=None):
+    """ Size of an object and of all the objects it references.
+        Shared small integers, None and booleans are not counted.
+
+        :param obj: Object to measure
+        :returns: Size in bytes
+        :rtype: int
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen or obj is None or isinstance(obj, (bool, type)):
+        return 0
+    if isinstance(obj, (int, long)) and -5 <= obj <= 256:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (basestring, array, float, int, long)):
+        return size
+    if isinstance(obj, dict):
+        children = [v for kv in obj.items() for v in kv]
+    elif isinstance(obj, (tuple, list, set, frozenset)):
+        children = list(obj)
+    else:
+        children = []
+        for cls in type(obj).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                if hasattr(obj, name):
+                    children.append(getattr(obj, name))
+        if hasattr(obj, '__dict__'):
+            children.append(obj.__dict__)
+    return size + sum(deep_sizeof(c, seen) for c in children)
+
+
+def run_benchmarks(modules=None, out=sys.stdout):
+    """ Run benchmark modules and write results as JSON
+
+        :param modules: Names of the modules to run (default: all)
+        :param out: Output file
+    """
+    results = {}
+    for name in modules or BENCHMARK_MODULES:
+        if '.' not in name:
+            name = __name__ + '.' + name
+        results[name] = import_module(name).run()
+    json.dump(results, out, indent=2, sort_keys=True)
+    out.write('\n')
+    return results
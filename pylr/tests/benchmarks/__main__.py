@@ -0,0 +1,10 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+"""
+
+import sys
+
+if __name__ == '__main__':
+    from . import run_benchmarks
+    run_benchmarks(sys.argv[1:])
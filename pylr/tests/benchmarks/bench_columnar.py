@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Reading parsed locations back from columnar files, compared to parsing
+the location references again.
+"""
+
+import time
+import shutil
+import tempfile
+
+from pylr import parse_binary_many
+from pylr.columnar import to_columns, from_columns, save_npy, load_columns
+from pylr.tests.data import LOCATIONS
+
+NUM_LOCATIONS = 100000
+
+
+def run():
+    payloads = [d for d, _ in LOCATIONS]
+    payloads = (payloads * (NUM_LOCATIONS // len(payloads) + 1))[:NUM_LOCATIONS]
+
+    start = time.time()
+    locations = list(parse_binary_many(payloads))
+    parse_time = time.time() - start
+
+    start = time.time()
+    columns = to_columns(locations)
+    convert_time = time.time() - start
+
+    directory = tempfile.mkdtemp()
+    try:
+        save_npy(directory, columns)
+        start = time.time()
+        loaded = load_columns(directory)
+        load_time = time.time() - start
+        # Vectorized query on the memory-mapped columns
+        start = time.time()
+        count = int((loaded['lrp_frc'] <= 2).sum())
+        query_time = time.time() - start
+        start = time.time()
+        assert from_columns(loaded) == locations
+        rebuild_time = time.time() - start
+    finally:
+        shutil.rmtree(directory)
+
+    return [{'locations': len(locations),
+             'parse_seconds': round(parse_time, 3),
+             'to_columns_seconds': round(convert_time, 3),
+             'load_mmap_seconds': round(load_time, 4),
+             'query_seconds': round(query_time, 4),
+             'query_result': count,
+             'from_columns_seconds': round(rebuild_time, 3)}]
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Startup time: imports are timed in a fresh interpreter, with a breakdown
+by module similar to 'python -X importtime' (not available in Python 2).
+"""
+
+import os
+import sys
+import json
+import subprocess
+
+import pylr
+
+# Run in the child interpreter: time the statement, and each import with
+# an __import__ hook (cumulative and self time, in microseconds)
+_PROFILE_SCRIPT = r'''
+import __builtin__, sys, json, time
+_import = __builtin__.__import__
+_stack = []
+_imports = []
+
+def _timed_import(name, *args, **kwargs):
+    before = len(sys.modules)
+    start = time.time()
+    _stack.append(0.0)
+    try:
+        return _import(name, *args, **kwargs)
+    finally:
+        children = _stack.pop()
+        elapsed = time.time() - start
+        if _stack:
+            _stack[-1] += elapsed
+        if len(sys.modules) > before:
+            _imports.append((name, int(elapsed * 1e6), int((elapsed - children) * 1e6)))
+
+statement, breakdown = sys.argv[1], sys.argv[2] == '1'
+before = set(m for m in sys.modules if sys.modules[m] is not None)
+if breakdown:
+    __builtin__.__import__ = _timed_import
+start = time.time()
+exec compile(statement, '<statement>', 'exec')
+elapsed = time.time() - start
+__builtin__.__import__ = _import
+json.dump({'seconds': elapsed,
+           'imports': _imports,
+           'modules': sorted(m for m in sys.modules if sys.modules[m] is not None and m not in before)},
+          sys.stdout)
+'''
+
+_STATEMENTS = ('import pylr',
+               'from pylr import parse_binary',
+               'from pylr import parse_binary; parse_binary("CwOyQCDbSxJPBwAA/osSXxM=", base64=True)',
+               'from pylr import parse_binary, Decoder',
+               'from pylr import parse_binary, BITSTRING_BACKEND; '
+               'parse_binary("CwOyQCDbSxJPBwAA/osSXxM=", base64=True, backend=BITSTRING_BACKEND)')
+
+NUM_RUNS = 5
+
+
+def import_profile(statement, breakdown=False):
+    """ Run a statement in a fresh interpreter
+
+        :param str statement: Python statement
+        :param bool breakdown: True to time each import of the statement
+        :returns: dict with the elapsed 'seconds', the loaded 'modules' and,
+                  with breakdown, the 'imports' as (name, cumulative us, self us)
+        :rtype: dict
+    """
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(pylr.__file__)))
+    env['PYTHONPATH'] = os.pathsep.join([root] + [p for p in [env.get('PYTHONPATH')] if p])
+    out = subprocess.check_output([sys.executable, '-c', _PROFILE_SCRIPT, statement, '1' if breakdown else '0'], env=env)
+    return json.loads(out)
+
+
+def run():
+    results = []
+    for statement in _STATEMENTS:
+        times = [import_profile(statement)['seconds'] for _ in xrange(NUM_RUNS)]
+        profile = import_profile(statement, breakdown=True)
+        results.append({'statement': statement,
+                        'milliseconds': round(1000 * sorted(times)[NUM_RUNS // 2], 2),
+                        'modules': len(profile['modules']),
+                        # Self time of the slowest imports
+                        'slowest_imports_us': dict((name, us) for name, _, us in
+                                                   sorted(profile['imports'], key=lambda i: -i[2])[:5])})
+    return results
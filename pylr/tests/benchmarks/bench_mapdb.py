@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Lookups in the in-memory map database, on a square grid of two way roads.
+"""
+
+import time
+import random
+import numpy as np
+
+from pylr import WITH_LINE_DIRECTION
+from pylr.mapdb import MemoryMapDatabase
+
+SIZES = (100, 500)
+STEP = 0.001
+NUM_LOOKUPS = 2000
+
+
+def grid_database(size):
+    i, j = np.meshgrid(np.arange(size), np.arange(size))
+    node_lon, node_lat = (5.0 + STEP * i).ravel(), (50.0 + STEP * j).ravel()
+    nodes = (j * size + i).ravel()
+    rows, cols = nodes[(i < size - 1).ravel()], nodes[(j < size - 1).ravel()]
+    start = np.concatenate((rows, rows + 1, cols, cols + size))
+    end = np.concatenate((rows + 1, rows, cols + size, cols))
+    frc = np.concatenate((np.full(2 * len(rows), 2), np.full(2 * len(cols), 5)))
+    return MemoryMapDatabase(node_lon, node_lat, start, end, frc, np.full(len(start), 3))
+
+
+def _timed(func, args):
+    start = time.time()
+    for a in args:
+        func(*a)
+    return round((time.time() - start) * 1e6 / len(args), 1)
+
+
+def run():
+    results = []
+    rnd = random.Random(0)
+    for size in SIZES:
+        start = time.time()
+        db = grid_database(size)
+        build_time = time.time() - start
+        extent = STEP * (size - 1)
+        coords = [(5.0 + rnd.random() * extent, 50.0 + rnd.random() * extent) for _ in xrange(NUM_LOOKUPS)]
+        nodes = [db.find_closeby_nodes(c, 100)[0] for c in coords[:100]]
+        lines = [db.find_closeby_lines(c, 100, 7, WITH_LINE_DIRECTION)[0][0] for c in coords[:200]]
+        results.append({'nodes': len(db.node_lon),
+                        'lines': len(db.line_start),
+                        'build_seconds': round(build_time, 2),
+                        'bytes_per_line': round(float(db.nbytes) / len(db.line_start), 1),
+                        'closeby_nodes_us': _timed(db.find_closeby_nodes, [(c, 100) for c in coords]),
+                        'closeby_lines_us': _timed(db.find_closeby_lines,
+                                                   [(c, 100, 7, WITH_LINE_DIRECTION) for c in coords]),
+                        'connected_lines_us': _timed(db.connected_lines,
+                                                     [(n, 7, WITH_LINE_DIRECTION) for n in nodes] * 20),
+                        'route_1km_us': _timed(db.calculate_routes,
+                                               [(l1, lines[100:], 1000, 7, False) for l1 in lines[:100]])})
+    return results
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Memory used by a parsed location, for each location representation, and by
+a batch of locations, with and without interning.
+"""
+
+from pylr import parse_binary, parse_binary_many, LocationType
+from pylr.compact import parse_compact
+from pylr.tests.data import LOCATIONS
+from . import deep_sizeof
+
+
+def _samples():
+    """ One sample of each kind: line without and with intermediate points,
+        point along line.
+    """
+    lines = sorted((len(d), d) for d, v in LOCATIONS if v.type == LocationType.LINE_LOCATION)
+    point = next(d for d, v in LOCATIONS if v.type == LocationType.POINT_ALONG_LINE)
+    return (('line', lines[0][1]),
+            ('line_{}_points'.format(len(parse_binary(lines[-1][1], base64=True).points)), lines[-1][1]),
+            ('point_along_line', point))
+
+
+REPRESENTATIONS = (('raw', lambda d: d.decode('base64')),
+                   ('namedtuple', lambda d: parse_binary(d, base64=True)),
+                   ('lazy', lambda d: parse_binary(d, base64=True, lazy=True)),
+                   ('compact', lambda d: parse_compact(d, base64=True)))
+
+
+''' Number of times each location of the batch is repeated '''
+BATCH_REPEAT = 10
+
+
+def run():
+    results = []
+    batch = [d for d, _ in LOCATIONS] * BATCH_REPEAT
+    for name, intern_table in (('batch', None), ('batch_interned', True)):
+        locations = list(parse_binary_many(batch, intern_table=intern_table))
+        results.append({'sample': 'fixtures_x{}'.format(BATCH_REPEAT),
+                        'representation': name,
+                        'bytes_per_location': deep_sizeof(locations) // len(locations)})
+    for sample, data in _samples():
+        for name, parse in REPRESENTATIONS:
+            results.append({'sample': sample,
+                            'representation': name,
+                            'bytes_per_location': deep_sizeof(parse(data))})
+    return results
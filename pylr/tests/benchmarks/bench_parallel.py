@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Throughput of the parse pool for an increasing number of workers, and of
+the serialization of parsed locations.
+"""
+
+import time
+import cPickle
+from multiprocessing import cpu_count
+
+from pylr import parse_binary_many
+from pylr.parallel import ParsePool
+from pylr.parser import pack_locations, unpack_locations
+from pylr.tests.data import LOCATIONS
+
+NUM_LOCATIONS = 100000
+
+
+def _payloads():
+    data = [d for d, _ in LOCATIONS]
+    return (data * (NUM_LOCATIONS // len(data) + 1))[:NUM_LOCATIONS]
+
+
+def _throughput(parse, payloads):
+    start = time.time()
+    count = sum(1 for _ in parse(payloads))
+    return count / (time.time() - start)
+
+
+def _serialization(name, dumps, loads, locations):
+    start = time.time()
+    data = dumps(locations)
+    middle = time.time()
+    loads(data)
+    end = time.time()
+    return {'serialization': name,
+            'bytes_per_location': len(data) / float(len(locations)),
+            'dumps_locations_per_second': round(len(locations) / (middle - start)),
+            'loads_locations_per_second': round(len(locations) / (end - middle))}
+
+
+def run():
+    payloads = _payloads()
+    locations = list(parse_binary_many(payloads[:10000]))
+    results = [{'workers': 0,
+                'locations_per_second': round(_throughput(parse_binary_many, payloads))},
+               _serialization('pickle', lambda l: cPickle.dumps(l, 2), cPickle.loads, locations),
+               _serialization('packed', pack_locations, lambda d: list(unpack_locations(d)), locations)]
+    for workers in sorted(set((1, 2, 4, cpu_count()))):
+        with ParsePool(workers) as pool:
+            results.append({'workers': workers,
+                            'cpus': cpu_count(),
+                            'locations_per_second': round(_throughput(pool.imap, payloads))})
+    return results
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Parser throughput, for each location type, binary version, payload size
+and parser backend.
+
+Corpora are random location references (see :py:mod:`pylr.encoder`):
+line, closed line and polygon locations are generated with a fixed number
+of points, other locations are grouped by payload size (with or without
+offset, small or large rectangle, radius size...).
+
+Allocations are measured as what a parsed location retains: the number of
+objects tracked by the garbage collector, and their deep size. Python 2
+has no allocation tracer, so short-lived objects are not counted.
+"""
+
+import gc
+import time
+from collections import defaultdict
+
+from pylr import (parse_binary,
+                  parse_binary_many,
+                  LocationType,
+                  BITSTRING_BACKEND,
+                  FAST_BACKEND)
+from pylr.constants import BINARY_VERSION_2, BINARY_VERSION_3
+from pylr.encoder import iter_corpus
+from . import deep_sizeof
+
+''' Number of distinct location references of each corpus '''
+CORPUS_SIZE = 500
+
+''' Minimum duration of each throughput measurement (in seconds) '''
+MIN_SECONDS = 0.2
+
+''' Numbers of intermediate LRPs of line and closed line locations '''
+LINE_POINTS = (0, 1, 2, 5, 10, 20, 50)
+
+''' Numbers of corners of polygon locations '''
+POLYGON_CORNERS = (3, 5, 10, 20, 50)
+
+_VARIABLE_SIZES = {LocationType.LINE_LOCATION: LINE_POINTS,
+                   LocationType.CLOSED_LINE: LINE_POINTS,
+                   LocationType.POLYGON: POLYGON_CORNERS}
+
+''' Version 2 is only valid for line locations '''
+_VERSIONS = {LocationType.LINE_LOCATION: (BINARY_VERSION_2, BINARY_VERSION_3)}
+
+BACKENDS = (('bitstring', lambda payloads: [parse_binary(d, backend=BITSTRING_BACKEND) for d in payloads]),
+            ('fast', lambda payloads: [parse_binary(d, backend=FAST_BACKEND) for d in payloads]),
+            ('fast_many', lambda payloads: list(parse_binary_many(payloads, base64=False))))
+
+
+def corpora():
+    """ Corpora of location references
+
+        :returns: list of (type name, version, number of points or None, payloads)
+    """
+    names = dict((v, k) for k, v in vars(LocationType).items() if not k.startswith('_'))
+    result = []
+    for loc_type in sorted(names):
+        if loc_type == LocationType.UNKNOWN:
+            continue
+        for version in _VERSIONS.get(loc_type, (BINARY_VERSION_3,)):
+            seed = (loc_type, version)
+            if loc_type in _VARIABLE_SIZES:
+                for n in _VARIABLE_SIZES[loc_type]:
+                    payloads = list(iter_corpus(loc_type, CORPUS_SIZE, seed, version, num_points=n))
+                    result.append((names[loc_type], version, n, payloads))
+            else:
+                sizes = defaultdict(list)
+                for data in iter_corpus(loc_type, CORPUS_SIZE, seed, version):
+                    sizes[len(data)].append(data)
+                for _, payloads in sorted(sizes.items()):
+                    result.append((names[loc_type], version, None, payloads))
+    return result
+
+
+def _throughput(parse, payloads):
+    count = 0
+    start = time.time()
+    while True:
+        parse(payloads)
+        count += len(payloads)
+        elapsed = time.time() - start
+        if elapsed >= MIN_SECONDS:
+            return count / elapsed
+
+
+def _retained(parse, payloads):
+    """ Objects and bytes retained by each parsed location """
+    gc.collect()
+    before = len(gc.get_objects())
+    locations = parse(payloads)
+    objects = len(gc.get_objects()) - before - 1
+    size = deep_sizeof(locations) - deep_sizeof([])
+    # Do not count the list itself
+    return float(objects) / len(payloads), float(size - 8 * len(locations)) / len(payloads)
+
+
+def run():
+    results = []
+    for name, version, points, payloads in corpora():
+        objects, size = _retained(BACKENDS[1][1], payloads)
+        for backend, parse in BACKENDS:
+            results.append({'type': name,
+                            'version': version,
+                            'points': points,
+                            'bytes': round(float(sum(len(d) for d in payloads)) / len(payloads), 1),
+                            'backend': backend,
+                            'locations_per_second': round(_throughput(parse, payloads)),
+                            'objects_per_location': round(objects, 1),
+                            'bytes_per_location': round(size)})
+    return results
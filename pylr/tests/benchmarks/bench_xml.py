@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Throughput of the XML parser, compared to the binary parser, and memory
+growth while streaming a large XML document.
+"""
+
+import os
+import time
+import resource
+import tempfile
+
+from pylr import parse_binary_many
+from pylr.xmlparser import iter_xml_locations
+from pylr.tests.data import LOCATIONS
+from pylr.xmlparser import OPENLR_NAMESPACE
+from pylr.tests.xml_data import location_xml
+
+NUM_LOCATIONS = 20000
+
+
+def _throughput(parse, source):
+    start = time.time()
+    count = sum(1 for _ in parse(source))
+    return count, count / (time.time() - start)
+
+
+def _write_document(f, count):
+    """ Write a document of 'count' locations, one at a time """
+    elements = [location_xml(v)[0] for _, v in LOCATIONS]
+    f.write('<OpenLRDump xmlns="{}">'.format(OPENLR_NAMESPACE))
+    for i in xrange(count):
+        f.write('<OpenLR><LocationID>{}</LocationID>{}</OpenLR>'.format(i, elements[i % len(elements)]))
+    f.write('</OpenLRDump>')
+
+
+def run():
+    payloads = [d for d, _ in LOCATIONS]
+    payloads = (payloads * (NUM_LOCATIONS // len(payloads) + 1))[:NUM_LOCATIONS]
+
+    fd, path = tempfile.mkstemp(suffix='.xml')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            _write_document(f, NUM_LOCATIONS)
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        count, xml_rate = _throughput(iter_xml_locations, path)
+        rss_growth = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss
+        size = os.path.getsize(path)
+    finally:
+        os.remove(path)
+
+    _, binary_rate = _throughput(parse_binary_many, payloads)
+    return [{'format': 'xml',
+             'locations': count,
+             'document_bytes': size,
+             'max_rss_growth_kb': rss_growth,
+             'locations_per_second': round(xml_rate)},
+            {'format': 'binary',
+             'locations': len(payloads),
+             'locations_per_second': round(binary_rate)}]
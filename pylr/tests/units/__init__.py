@@ -10,6 +10,17 @@ import nose
 TEST_MODULES = [
     'pylr.tests.units.test_binary_parser',
     'pylr.tests.units.test_decoder',
+    'pylr.tests.units.test_bulk_parser',
+    'pylr.tests.units.test_compact',
+    'pylr.tests.units.test_parallel',
+    'pylr.tests.units.test_xml_parser',
+    'pylr.tests.units.test_encoder',
+    'pylr.tests.units.test_cache',
+    'pylr.tests.units.test_spatial',
+    'pylr.tests.units.test_columnar',
+    'pylr.tests.units.test_validation',
+    'pylr.tests.units.test_imports',
+    'pylr.tests.units.test_mapdb',
 ]
 
 
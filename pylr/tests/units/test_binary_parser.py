@@ -8,10 +8,44 @@ Test the parsing of locations references coded in OpenLR.
 
 from __future__ import print_function
 import sys
+import mmap
+import pickle
+from struct import pack
+from binascii import Error as BinasciiError
 
 try:
     from unittest import TestCase
-    from pylr import init_binary_parsing, parse_binary
+    from pylr import (init_binary_parsing,
+                      parse_binary,
+                      BITSTRING_BACKEND,
+                      FAST_BACKEND,
+                      parse_binary_many,
+                      peek_location_type,
+                      decode_base64_many,
+                      iter_length_prefixed,
+                      LazyPoints,
+                      InternTable,
+                      pack_locations,
+                      unpack_locations,
+                      ON_ERROR_SKIP,
+                      ON_ERROR_RAISE,
+                      BinaryParseError,
+                      BinaryVersionError,
+                      InvalidDataSizeError)
+    from pylr.parser import (parse_line,
+                             parse_point_along_line,
+                             parse_geo_coordinates,
+                             parse_poi_with_access_point,
+                             parse_circle,
+                             parse_rectangle,
+                             parse_grid,
+                             parse_closed_line,
+                             parse_polygon,
+                             _PACKED_HEADER,
+                             _PACKED_LAYOUTS)
+    from pylr.constants import LocationType, BIT24FACTOR_REVERSED
+    from pylr.utils import signum
+    from pylr import values
     from pylr.tests.data import LOCATIONS
 except:
     import traceback
@@ -74,4 +108,235 @@ class TestOpenLRBinary(TestCase):
             p = parse_binary(d, base64=True)
             # print( "( '{}', {})".format(d, p), file=sys.stderr)
             self.assertEquals(p, v)
-    
+
+    def test_backends_give_same_results(self):
+        """ OpenLR parse binary locations with both parser backends"""
+        for d, v in LOCATIONS:
+            self.assertEquals(parse_binary(d, base64=True, backend=FAST_BACKEND),
+                              parse_binary(d, base64=True, backend=BITSTRING_BACKEND))
+
+    def test_fast_backend_getbits(self):
+        """ OpenLR parse binary locations field by field with the fast backend"""
+        parsers = {LocationType.LINE_LOCATION: parse_line,
+                   LocationType.POINT_ALONG_LINE: parse_point_along_line,
+                   LocationType.GEO_COORDINATES: parse_geo_coordinates,
+                   LocationType.POI_WITH_ACCESS_POINT: parse_poi_with_access_point,
+                   LocationType.CIRCLE: parse_circle,
+                   LocationType.RECTANGLE: parse_rectangle,
+                   LocationType.GRID: parse_grid,
+                   LocationType.CLOSED_LINE: parse_closed_line,
+                   LocationType.POLYGON: parse_polygon}
+        for d, v in LOCATIONS:
+            p = init_binary_parsing(d, base64=True, backend=FAST_BACKEND)
+            self.assertEquals(parsers[p.location_type](p), v)
+
+    def test_truncated_data(self):
+        """ OpenLR parse binary locations with missing offset bytes"""
+        # Positive offset flag set but no offset: line, point along line and
+        # POI with access point (the POI coordinates follow the offset)
+        poi = 'KwOg5iUNnCOTAv+D/5QjQ1j/gP/r'.decode('base64')
+        for data in ('CwOyQCDbSxJPBwAA/osSXxM='.decode('base64')[:-1],
+                     'K/6P+CKSvxJWCf0S/20SReM='.decode('base64')[:-1],
+                     poi[:16] + poi[17:]):
+            for backend in (FAST_BACKEND, BITSTRING_BACKEND):
+                self.assertRaises(InvalidDataSizeError, parse_binary, data, backend=backend)
+
+    def test_trailing_bytes(self):
+        """ OpenLR parse closed line and polygon locations with trailing bytes"""
+        for data, value in LOCATIONS:
+            if value.type in (LocationType.CLOSED_LINE, LocationType.POLYGON):
+                for extra in ('\x01', '\x01\x02\x03'):
+                    for backend in (FAST_BACKEND, BITSTRING_BACKEND):
+                        self.assertEquals(parse_binary(data.decode('base64') + extra, backend=backend),
+                                          value)
+
+    def test_parse_many(self):
+        """ OpenLR parse a sequence of binary locations"""
+        data = [d for d, _ in LOCATIONS]
+        expected = [v for _, v in LOCATIONS]
+        self.assertEquals(list(parse_binary_many(data)), expected)
+        self.assertEquals(list(parse_binary_many([d.decode('base64') for d in data], base64=False)),
+                          expected)
+
+    def test_parse_many_errors(self):
+        """ OpenLR parse a sequence of binary locations with invalid data"""
+        # valid, truncated, invalid version, not base64
+        data = [LOCATIONS[0][0], 'CwGvtCRKDBt1', 'DAGvtCRKDBt1AP/i//YbBQ==', '#']
+
+        result = list(parse_binary_many(data))
+        self.assertEquals(len(result), 4)
+        self.assertEquals(result[0], LOCATIONS[0][1])
+        self.assertIsInstance(result[1], InvalidDataSizeError)
+        self.assertIsInstance(result[2], BinaryVersionError)
+        self.assertIsInstance(result[3], BinaryParseError)
+
+        self.assertEquals(list(parse_binary_many(data, on_error=ON_ERROR_SKIP)), [LOCATIONS[0][1]])
+
+        errors = []
+        result = list(parse_binary_many(data, on_error=lambda d, e: errors.append(e)))
+        self.assertEquals(result, [LOCATIONS[0][1]])
+        self.assertEquals(len(errors), 3)
+
+        self.assertRaises(InvalidDataSizeError, list, parse_binary_many(data, on_error=ON_ERROR_RAISE))
+        self.assertRaises(ValueError, parse_binary_many, data, on_error='ignore')
+
+    def test_parse_many_missing_offset(self):
+        """ OpenLR parse a sequence of binary locations with a missing POI offset"""
+        poi = 'KwOg5iUNnCOTAv+D/5QjQ1j/gP/r'.decode('base64')
+        data = [LOCATIONS[0][0], (poi[:16] + poi[17:]).encode('base64'), LOCATIONS[1][0]]
+
+        result = list(parse_binary_many(data))
+        self.assertEquals(len(result), 3)
+        self.assertEquals(result[0], LOCATIONS[0][1])
+        self.assertIsInstance(result[1], InvalidDataSizeError)
+        self.assertEquals(result[2], LOCATIONS[1][1])
+
+    def test_peek_location_type(self):
+        """ OpenLR location type from the header only"""
+        for d, v in LOCATIONS:
+            self.assertEqual(peek_location_type(d, base64=True), v.type)
+            self.assertEqual(peek_location_type(d.decode('base64')), v.type)
+            self.assertEqual(peek_location_type(bytearray(d.decode('base64'))), v.type)
+
+    def test_peek_invalid_location_type(self):
+        """ OpenLR location type of invalid data"""
+        # truncated, invalid version, not base64
+        for d, error in (('CwGvtA==', InvalidDataSizeError),
+                         ('DAGvtCRKDBt1AP/i//YbBQ==', BinaryVersionError),
+                         ('CwGvtCRKDBt1AP/i//YbBQ=', BinaryParseError)):
+            self.assertRaises(error, peek_location_type, d, base64=True)
+            self.assertEqual(peek_location_type(d, base64=True, strict=False), LocationType.UNKNOWN)
+        # Point along line with a wrong size
+        d = 'K/6P+CKSvxJWCf0S/20SReM='.decode('base64') + 'XX'
+        self.assertRaises(InvalidDataSizeError, peek_location_type, d)
+        self.assertRaises(InvalidDataSizeError, init_binary_parsing(d).__getattribute__, 'location_type')
+
+    def test_parse_buffers(self):
+        """ OpenLR parse binary locations from buffers, without copy"""
+        for d, v in LOCATIONS:
+            raw = d.decode('base64')
+            data = bytearray('XX' + raw + 'YY')
+            for backend in (FAST_BACKEND, BITSTRING_BACKEND):
+                self.assertEquals(parse_binary(bytearray(raw), backend=backend), v)
+                self.assertEquals(parse_binary(data, offset=2, size=len(raw), backend=backend), v)
+                self.assertEquals(parse_binary(memoryview(data)[2:-2], backend=backend), v)
+
+    def test_parse_length_prefixed(self):
+        """ OpenLR parse length prefixed binary locations from a mmap"""
+        packed = ''.join(pack('>H', len(raw)) + raw for raw in (d.decode('base64') for d, _ in LOCATIONS))
+        m = mmap.mmap(-1, len(packed))
+        try:
+            m.write(packed)
+            records = list(iter_length_prefixed(m))
+            self.assertEquals(list(parse_binary_many(records, base64=False)),
+                              [v for _, v in LOCATIONS])
+            self.assertRaises(InvalidDataSizeError, list, iter_length_prefixed(m, end=len(packed) - 1))
+        finally:
+            m.close()
+
+    def test_lazy_line_location(self):
+        """ OpenLR parse line locations with lazy intermediate points"""
+        for d, v in LOCATIONS:
+            p = parse_binary(d, base64=True, lazy=True)
+            self.assertEquals(p, v)
+            if v.type != LocationType.LINE_LOCATION:
+                continue
+            p = parse_binary(d, base64=True, lazy=True)
+            self.assertIsInstance(p.points, LazyPoints)
+            self.assertEquals(len(p.points), len(v.points))
+            self.assertEquals((p.flrp, p.llrp, p.poffs, p.noffs), (v.flrp, v.llrp, v.poffs, v.noffs))
+            self.assertFalse(p.points.decoded)
+            self.assertEquals(list(p.points), v.points)
+            self.assertTrue(p.points.decoded)
+            self.assertEquals(pickle.loads(pickle.dumps(p)), v)
+
+        self.assertEquals(list(parse_binary_many([d for d, _ in LOCATIONS], lazy=True)),
+                          [v for _, v in LOCATIONS])
+
+    def test_values_lookup_tables(self):
+        """ Lookup tables give the same values as the estimate functions"""
+        self.assertEquals(values.DISTANCE_ESTIMATES, tuple(map(values.distance_estimate, range(256))))
+        self.assertEquals(values.RELATIVE_DISTANCES, tuple(map(values.relative_distance, range(256))))
+        for v in (-(1 << 23), -12345, -1, 0, 1, 12345, (1 << 23) - 1):
+            self.assertEquals(values._get32BitRepresentation(v), (v - signum(v)*0.5) * BIT24FACTOR_REVERSED)
+
+    def test_decode_base64_many(self):
+        """ Decode base64 payloads at once"""
+        payloads = [d for d, _ in LOCATIONS]
+        invalid = ['CwGv', 'CwGvtA=', 'CwG*tA==', 'C=GvtA==', 'CwGvt===', u'CwGvtA\xe9=']
+        decoded, spans = decode_base64_many(payloads + invalid)
+        for d, span in zip(payloads, spans):
+            self.assertEquals(decoded[span[0]:span[0]+span[1]], d.decode('base64'))
+        self.assertEquals(spans[len(payloads)], (len(decoded) - 3, 3))
+        for error in spans[len(payloads)+1:]:
+            self.assertIsInstance(error, BinaryParseError)
+        result = list(parse_binary_many(invalid[1:] + payloads))
+        self.assertEquals(result[len(invalid)-1:], [v for _, v in LOCATIONS])
+
+        # Same rules as parse_binary: line breaks and spaces are skipped
+        wrapped = [' {}\n{}\n'.format(d[:8], d[8:]) for d in payloads]
+        expected = [parse_binary(d, base64=True) for d in wrapped]
+        self.assertEquals(expected, [v for _, v in LOCATIONS])
+        self.assertEquals(list(parse_binary_many(wrapped)), expected)
+        for data in invalid[1:5]:
+            self.assertRaises((BinasciiError, BinaryParseError), parse_binary, data, base64=True)
+
+    def test_intern_table(self):
+        """ Equal LRPs and coordinates are shared between locations"""
+        payloads = [d for d, _ in LOCATIONS]
+        expected = [v for _, v in LOCATIONS]
+        table = InternTable()
+        result = list(parse_binary_many(payloads * 2, intern_table=table))
+        self.assertEquals(result, expected * 2)
+        for first, second in zip(result, result[len(payloads):]):
+            for attr in ('flrp', 'llrp', 'coords'):
+                if hasattr(first, attr):
+                    self.assertIs(getattr(first, attr), getattr(second, attr))
+            if hasattr(first, 'points'):
+                for p, q in zip(first.points, second.points):
+                    self.assertIs(p, q)
+        for loc in result:
+            if hasattr(loc, 'flrp'):
+                self.assertIs(loc.flrp, table.lrp(loc.flrp))
+                self.assertIs(loc.flrp.coords, table.coords(loc.flrp.coords))
+
+        self.assertEquals(list(parse_binary_many(payloads, lazy=True, intern_table=True)), expected)
+        spatial = list(parse_binary_many(payloads, spatial=True, intern_table=table))
+        self.assertEquals(spatial, expected)
+        self.assertEquals([v.bounds for v in spatial],
+                          [v.bounds for v in parse_binary_many(payloads, spatial=True)])
+
+        table = InternTable(maxsize=4)
+        self.assertEquals(list(parse_binary_many(payloads, intern_table=table)), expected)
+        self.assertTrue(len(table) <= 4)
+        table.clear()
+        self.assertEquals(len(table), 0)
+
+    def test_pack_locations(self):
+        """ Packed locations are unpacked to the same values"""
+        payloads = [d for d, _ in LOCATIONS]
+        for backend in (FAST_BACKEND, BITSTRING_BACKEND):
+            locations = [parse_binary(d, base64=True, backend=backend) for d in payloads]
+            packed = pack_locations(locations)
+            result = list(unpack_locations(packed))
+            self.assertEquals(result, locations)
+            # Same field types
+            self.assertEquals(map(repr, result), map(repr, locations))
+            self.assertEquals(list(unpack_locations(bytearray(packed))), locations)
+
+        spatial = list(parse_binary_many(payloads, spatial=True))
+        self.assertEquals(list(unpack_locations(pack_locations(spatial))), spatial)
+        lazy = list(parse_binary_many(payloads, lazy=True))
+        self.assertEquals(list(unpack_locations(pack_locations(lazy))), locations)
+        self.assertEquals(list(unpack_locations(pack_locations([]))), [])
+
+        packed = pack_locations(locations)
+        with self.assertRaises(ValueError):
+            list(unpack_locations(packed[:-1]))
+        # Corrupt number of points
+        layouts = len(_PACKED_LAYOUTS)
+        with self.assertRaises(ValueError):
+            list(unpack_locations(_PACKED_HEADER.pack(3, LocationType.POLYGON, 0xffffffff) + packed))
+        self.assertEquals(len(_PACKED_LAYOUTS), layouts)
+        with self.assertRaises(ValueError):
+            pack_locations([LOCATIONS[0][1]._replace(type=0)])
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Test the columnar parsing of fixed size locations references.
+"""
+
+try:
+    from unittest import TestCase, skipIf
+    from pylr import parse_binary, LocationType
+    from pylr.tests.data import LOCATIONS
+    try:
+        import numpy
+        from pylr.bulk import parse_bulk, parse_matrix, FIXED_SIZE_TYPES
+    except ImportError:
+        numpy = None
+except:
+    import traceback
+    traceback.print_exc()
+    raise
+
+
+LRP_FIELDS = ('bear', 'orient', 'frc', 'fow', 'lfrcnp', 'dnp')
+LAST_LRP_FIELDS = ('bear', 'orient', 'frc', 'fow')
+
+
+@skipIf(numpy is None, "numpy is not installed")
+class TestBulkParser(TestCase):
+
+    def compare(self, row, location):
+        if location.type in (LocationType.POINT_ALONG_LINE, LocationType.POI_WITH_ACCESS_POINT):
+            self.assertEqual((row['lon'], row['lat']), location.flrp.coords)
+            for f in LRP_FIELDS:
+                self.assertEqual(row[f], getattr(location.flrp, f), f)
+            self.assertEqual((row['llrp_lon'], row['llrp_lat']), location.llrp.coords)
+            for f in LAST_LRP_FIELDS:
+                self.assertEqual(row['llrp_' + f], getattr(location.llrp, f), f)
+            self.assertEqual(row['poffs'], location.poffs)
+            if location.type == LocationType.POI_WITH_ACCESS_POINT:
+                self.assertEqual((row['poi_lon'], row['poi_lat']), location.coords)
+        elif location.type == LocationType.GEO_COORDINATES:
+            self.assertEqual((row['lon'], row['lat']), location.coords)
+        elif location.type == LocationType.CIRCLE:
+            self.assertEqual((row['lon'], row['lat']), location.coords)
+            self.assertEqual(row['radius'], location.radius)
+        else:
+            self.assertEqual((row['minx'], row['miny'], row['maxx'], row['maxy']), location.bbox)
+            if location.type == LocationType.GRID:
+                self.assertEqual((row['cols'], row['rows']), (location.cols, location.rows))
+
+    def test_parse_bulk(self):
+        """ OpenLR bulk parsing of fixed size locations """
+        payloads = [d for d, _ in LOCATIONS]
+        tables, rejected = parse_bulk(payloads, base64=True)
+
+        expected = dict((i, v) for i, (_, v) in enumerate(LOCATIONS) if v.type in FIXED_SIZE_TYPES)
+        self.assertEqual(sorted(rejected), sorted(set(range(len(payloads))) - set(expected)))
+        self.assertEqual(sum(len(t) for t in tables.values()), len(expected))
+
+        for loc_type, t in tables.items():
+            for row in t:
+                location = expected[row['index']]
+                self.assertEqual(location.type, loc_type)
+                self.assertEqual(row['version'], location.version)
+                self.compare(row, location)
+
+    def test_parse_matrix(self):
+        """ OpenLR bulk parsing of an uint8 matrix """
+        payloads = [d.decode('base64') for d, v in LOCATIONS if v.type == LocationType.POINT_ALONG_LINE]
+        locations = [parse_binary(d) for d in payloads]
+        m = numpy.array([bytearray(d) for d in payloads], dtype=numpy.uint8)
+        t = parse_matrix(LocationType.POINT_ALONG_LINE, m)
+        self.assertEqual(len(t), len(locations))
+        for row, location in zip(t, locations):
+            self.compare(row, location)
+
+    def test_reject_missing_offset(self):
+        """ OpenLR bulk parsing rejects truncated offsets """
+        d, _ = next((d, v) for d, v in LOCATIONS if v.type == LocationType.POINT_ALONG_LINE)
+        tables, rejected = parse_bulk([d.decode('base64')[:-1]])
+        self.assertEqual(rejected, [0])
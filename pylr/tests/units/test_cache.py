@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Test the cache of parsed locations, and the caches of the decoder.
+"""
+
+try:
+    from unittest import TestCase
+    from collections import namedtuple
+    from pylr import (BinaryParseError,
+                      RouteNotFoundException,
+                      RouteConstructionFailed,
+                      MapDatabase,
+                      WITH_LINE_DIRECTION,
+                      AGAINST_LINE_DIRECTION)
+    from pylr.cache import ParseCache, CandidateCache, RouteCache, location_key
+    from pylr.tests.data import LOCATIONS
+except:
+    import traceback
+    traceback.print_exc()
+    raise
+
+
+class TestParseCache(TestCase):
+
+    def test_location_key(self):
+        """ Test that padding does not change the key
+        """
+        for data, _ in LOCATIONS:
+            key = location_key(data, base64=True)
+            self.assertEquals(key, data.decode('base64'))
+            self.assertEquals(location_key(data.rstrip('='), base64=True), key)
+            self.assertEquals(location_key(bytearray(key)), key)
+        with self.assertRaises(BinaryParseError):
+            location_key('CwGvt', base64=True)
+
+    def test_parse_cache(self):
+        """ Test hits, misses and eviction
+        """
+        cache = ParseCache(maxsize=4, base64=True)
+        for data, location in LOCATIONS[:3] * 2:
+            self.assertEquals(cache.parse(data), location)
+        self.assertEquals(cache.info(), (3, 3, 4, 3))
+        self.assertIs(cache.parse(LOCATIONS[0][0].rstrip('=')), cache.parse(LOCATIONS[0][0]))
+
+        # LOCATIONS[1] is the least recently used
+        cache.parse(LOCATIONS[3][0])
+        cache.parse(LOCATIONS[4][0])
+        self.assertEquals(len(cache), 4)
+        self.assertNotIn(LOCATIONS[1][0], cache)
+        self.assertIn(LOCATIONS[2][0], cache)
+
+        with self.assertRaises(BinaryParseError):
+            cache.parse('CwGvtA==')
+        self.assertEquals(len(cache), 4)
+
+        cache.clear()
+        self.assertEquals(cache.info(), (0, 0, 4, 0))
+
+
+class TestCandidateCache(TestCase):
+
+    def test_candidate_key(self):
+        """ Test that close LRPs share the same key
+        """
+        cache = CandidateCache()
+        lrp = LOCATIONS[0][1].flrp
+        key = cache.key(lrp, WITH_LINE_DIRECTION)
+        close = lrp._replace(coords=lrp.coords._replace(lon=lrp.coords.lon + 1e-7))
+        self.assertEquals(cache.key(close, WITH_LINE_DIRECTION), key)
+        self.assertNotEqual(cache.key(lrp, AGAINST_LINE_DIRECTION), key)
+        self.assertNotEqual(cache.key(lrp._replace(bear=lrp.bear + 1), WITH_LINE_DIRECTION), key)
+        far = lrp._replace(coords=lrp.coords._replace(lon=lrp.coords.lon + 1e-4))
+        self.assertNotEqual(cache.key(far, WITH_LINE_DIRECTION), key)
+
+    def test_candidate_cache(self):
+        """ Test hits, misses, eviction and expiry
+        """
+        now = [0]
+        cache = CandidateCache(maxsize=3, max_lines=4, ttl=10, clock=lambda: now[0])
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', [1, 2])
+        cache.put('b', [])
+        self.assertEquals(cache.get('a'), [1, 2])
+        self.assertEquals(cache.get('b'), [])
+        self.assertEquals(cache.info(), (2, 1, 3, 2))
+        self.assertAlmostEqual(cache.hit_rate, 2 / 3.0)
+
+        # Line bound: 'a' is the least recently used
+        cache.put('c', [3, 4, 5])
+        self.assertIsNone(cache.get('a'))
+        self.assertEquals(cache.num_lines, 3)
+        # Entries bound
+        cache.put('d', [6])
+        cache.put('e', [])
+        self.assertEquals(len(cache), 3)
+        self.assertIsNone(cache.get('b'))
+        # Too many lines to be cached
+        cache.put('f', range(5))
+        self.assertIsNone(cache.get('f'))
+
+        self.assertEquals(cache.evictions, 2)
+
+        now[0] = 10
+        self.assertIsNone(cache.get('c'))
+        self.assertEquals(cache.num_lines, 1)
+        self.assertFalse(cache.check_version(None))
+        self.assertTrue(cache.check_version(2))
+        self.assertEquals((len(cache), cache.num_lines, cache.invalidations), (0, 0, 1))
+        cache.clear()
+        self.assertEquals((len(cache), cache.num_lines, cache.hit_rate), (0, 0, 0.0))
+
+
+Line = namedtuple('Line', ('id', 'len'))
+
+
+class RouteDatabase(MapDatabase):
+    """ Routes of one line between lines, of the given lengths """
+
+    def __init__(self, lengths):
+        self.lengths = lengths
+        self.calls = 0
+
+    def calculate_route(self, l1, l2, maxdist, lfrc, islastrp):
+        self.calls += 1
+        length = self.lengths.get((l1.id, l2.id))
+        if length is None:
+            raise RouteConstructionFailed("No line")
+        if length > maxdist:
+            raise RouteNotFoundException("Too long")
+        return iter([l1, l2]), length
+
+
+class ManyRouteDatabase(RouteDatabase):
+    """ Routes searched from one line to several lines """
+
+    def calculate_routes(self, l1, targets, maxdist, lfrc, islastrp):
+        self.calls += 1
+        return dict((l2.id, ([l1, l2], self.lengths[l1.id, l2.id])) for l2 in targets
+                    if self.lengths.get((l1.id, l2.id), maxdist + 1) <= maxdist)
+
+
+ProjectedLine = namedtuple('ProjectedLine', ('id', 'len', 'projected_len'))
+
+
+class TestRouteCache(TestCase):
+
+    def test_route_cache(self):
+        """ Test the reuse of routes found with other distance bounds
+        """
+        a, b, c = Line('a', 10), Line('b', 10), Line('c', 10)
+        mdb = RouteDatabase({('a', 'b'): 100, ('a', 'c'): 300})
+        cache = RouteCache(maxsize=2)
+
+        self.assertEquals(cache.calculate_route(mdb, a, b, 200, 3, False), ((a, b), 100))
+        self.assertEquals(cache.calculate_route(mdb, a, b, 150, 3, False), ((a, b), 100))
+        self.assertEquals(cache.calculate_route(mdb, a, b, 1000, 3, False), ((a, b), 100))
+        with self.assertRaises(RouteNotFoundException):
+            cache.calculate_route(mdb, a, b, 50, 3, False)
+        self.assertEquals(mdb.calls, 1)
+        # Other frc, other key
+        cache.calculate_route(mdb, a, b, 200, 4, False)
+        self.assertEquals(mdb.calls, 2)
+
+        # Failures are reused for lower bounds only
+        with self.assertRaises(RouteNotFoundException):
+            cache.calculate_route(mdb, a, c, 200, 3, False)
+        with self.assertRaises(RouteNotFoundException):
+            cache.calculate_route(mdb, a, c, 100, 3, False)
+        self.assertEquals(mdb.calls, 3)
+        self.assertEquals(cache.calculate_route(mdb, a, c, 400, 3, False), ((a, c), 300))
+        self.assertEquals(mdb.calls, 4)
+
+        # Construction failures are not cached
+        for _ in range(2):
+            with self.assertRaises(RouteConstructionFailed):
+                cache.calculate_route(mdb, b, c, 400, 3, False)
+        self.assertEquals(mdb.calls, 6)
+
+        self.assertEquals(cache.info(), (4, 6, 2, 2))
+        self.assertEquals(cache.evictions, 1)
+        cache.check_version('new map')
+        self.assertEquals(len(cache), 0)
+        cache.calculate_route(mdb, a, c, 400, 3, False)
+        self.assertEquals(mdb.calls, 7)
+
+    def test_route_cache_many(self):
+        """ Test that cached routes hold the start and target lines of each call
+        """
+        a, b, c = (ProjectedLine(name, 10, None) for name in 'abc')
+        mdb = ManyRouteDatabase({('a', 'b'): 100, ('a', 'c'): 300})
+        cache = RouteCache()
+        self.assertEquals(cache.calculate_routes(mdb, a, [b, c], 200, 3, True), {'b': ((a, b), 100)})
+        # Same lines, other projections
+        a2, b2, c2 = a._replace(projected_len=4.0), b._replace(projected_len=6.0), c._replace(projected_len=8.0)
+        self.assertEquals(cache.calculate_routes(mdb, a2, [b2, c2], 150, 3, True), {'b': ((a2, b2), 100)})
+        self.assertEquals(mdb.calls, 1)
+        self.assertEquals(cache.calculate_route(mdb, a2, b2, 150, 3, True), ((a2, b2), 100))
+        self.assertEquals(cache.calculate_routes(mdb, a2, [b2, c2], 400, 3, True),
+                          {'b': ((a2, b2), 100), 'c': ((a2, c2), 300)})
+        self.assertEquals(mdb.calls, 2)
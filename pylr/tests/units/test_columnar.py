@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Test the columnar storage of parsed locations.
+"""
+
+try:
+    import os
+    import shutil
+    import tempfile
+    from unittest import TestCase, skipIf
+    from pylr import parse_binary_many, LocationType
+    from pylr.tests.data import LOCATIONS
+    from pylr.tests.xml_data import XML_LOCATIONS
+    try:
+        import numpy
+        from pylr.columnar import to_columns, from_columns, save_npz, save_npy, load_columns
+    except ImportError:
+        numpy = None
+except:
+    import traceback
+    traceback.print_exc()
+    raise
+
+
+@skipIf(numpy is None, "numpy is not installed")
+class TestColumnar(TestCase):
+
+    def setUp(self):
+        self.locations = list(parse_binary_many([d for d, _ in LOCATIONS])) + XML_LOCATIONS
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_columns(self):
+        """ Convert locations to columns and back """
+        columns = to_columns(self.locations)
+        self.assertEqual(len(columns['type']), len(self.locations))
+        self.assertEqual(from_columns(columns), self.locations)
+        self.assertEqual(from_columns(columns, 3, 7), self.locations[3:7])
+        self.assertEqual(from_columns(columns, 5, 5), [])
+
+        line = self.locations.index(next(v for v in self.locations if v.type == LocationType.LINE_LOCATION))
+        a, z = columns['lrp_offsets'][line:line + 2]
+        self.assertEqual(z - a, len(self.locations[line].points) + 2)
+        self.assertTrue(numpy.isnan(columns['lrp_dnp'][z - 1]))
+
+        empty = to_columns([])
+        self.assertEqual(from_columns(empty), [])
+        self.assertRaises(ValueError, to_columns, [self.locations[0]._replace(type=99)])
+
+    def test_files(self):
+        """ Save columns and load them back """
+        columns = to_columns(self.locations)
+
+        for compressed in (False, True):
+            filename = os.path.join(self.tmpdir, 'locations.npz')
+            save_npz(filename, columns, compressed)
+            self.assertEqual(from_columns(load_columns(filename)), self.locations)
+
+        directory = os.path.join(self.tmpdir, 'locations')
+        save_npy(directory, columns)
+        loaded = load_columns(directory)
+        self.assertTrue(isinstance(loaded['lrp_lon'], numpy.memmap))
+        self.assertEqual(from_columns(loaded), self.locations)
+
+        os.remove(os.path.join(directory, 'radius.npy'))
+        self.assertRaises(ValueError, load_columns, directory)
+        del columns['radius']
+        self.assertRaises(ValueError, save_npz, os.path.join(self.tmpdir, 'invalid.npz'), columns)
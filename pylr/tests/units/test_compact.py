@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Test the compact representation of locations references.
+"""
+
+try:
+    import pickle
+    from unittest import TestCase
+    from pylr import parse_binary, BinaryParseError, InvalidDataSizeError
+    from pylr.compact import parse_compact, COMPACT_TYPES
+    from pylr.tests.data import LOCATIONS
+except:
+    import traceback
+    traceback.print_exc()
+    raise
+
+
+class TestCompact(TestCase):
+
+    def test_compact_locations(self):
+        """ Test that compact locations are equal to parsed locations
+        """
+        count = 0
+        for data, _ in LOCATIONS:
+            location = parse_binary(data, base64=True)
+            if location.type not in COMPACT_TYPES:
+                continue
+            count += 1
+            compact = parse_compact(data, base64=True)
+            self.assertEqual(compact.expand(), location)
+            self.assertEqual(compact, location)
+            for field in location._fields:
+                self.assertEqual(getattr(compact, field), getattr(location, field), field)
+            self.assertEqual(pickle.loads(pickle.dumps(compact, pickle.HIGHEST_PROTOCOL)), location)
+            self.assertFalse(hasattr(compact, '__dict__'))
+        self.assertTrue(count > 0)
+
+    def test_compact_errors(self):
+        """ Test compact parsing of unsupported and truncated locations
+        """
+        data, location = next((d, l) for d, l in LOCATIONS if l.type not in COMPACT_TYPES)
+        with self.assertRaises(BinaryParseError):
+            parse_compact(data, base64=True)
+        # Point along line with the positive offset flag and no offset byte
+        with self.assertRaises(InvalidDataSizeError):
+            parse_compact('K/6P+CKSvxJWCf0S/20SRQ==', base64=True)
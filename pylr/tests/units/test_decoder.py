@@ -18,11 +18,13 @@ try:
                       Coords,
                       Decoder,
                       DecoderError,
+                      RouteNotFoundException,
                       MapDatabase,
                       AGAINST_LINE_DIRECTION,
                       WITH_LINE_DIRECTION,
                       fow )
     from pylr.rating import get_fow_rating_category
+    from pylr.cache import CandidateCache, RouteCache
     import pyproj
 except:
     import traceback
@@ -189,3 +191,161 @@ class TestDecoder(TestCase):
             for fow2 in fows:
                 self.assertEquals(get_fow_rating_category(fow1,fow2),
                                   get_fow_rating_category(fow2,fow1))
+
+    def test_22_candidate_cache(self):
+        """ OpenLR decoder: candidate lines are cached between locations """
+        calls = []
+
+        class CountingDatabase(DummyDatabase):
+            def find_closeby_nodes(self, coords, max_node_dist):
+                calls.append(coords)
+                return DummyDatabase.find_closeby_nodes(self, coords, max_node_dist)
+
+        cache = CandidateCache()
+        decoder = Decoder(CountingDatabase(), candidate_cache=cache)
+        lines = decoder.find_candidate_lines(LRP1)
+        self.assertEquals(lines, self.decoder.find_candidate_lines(LRP1))
+        self.assertIs(decoder.find_candidate_lines(LRP1), lines)
+        self.assertEquals(len(calls), 1)
+
+        # No line found: cached as well
+        lrp = LRP1._replace(coords=Coords(0.0, 0.0))
+        for _ in range(2):
+            with self.assertRaises(DecoderError):
+                decoder.find_candidate_lines(lrp)
+        self.assertEquals(len(calls), 2)
+        self.assertEquals(cache.info(), (2, 2, cache.maxsize, 2))
+
+        # Details are not cached
+        decoder.find_candidate_lines(LRP1, with_details=True)
+        self.assertEquals(len(calls), 3)
+
+    def test_23_route_cache(self):
+        """ OpenLR decoder: routes are cached between locations """
+        calls = []
+
+        class RouteDatabase(DummyDatabase):
+            def calculate_route(self, l1, l2, maxdist, lfrc, islastrp):
+                calls.append((l1.id, l2.id, maxdist))
+                return [l1, l2], 50
+
+        mdb = RouteDatabase()
+        cache = RouteCache()
+        decoder = Decoder(mdb, route_cache=cache, candidate_cache=CandidateCache())
+        l1, l2 = self._database._Lines[:2]
+        lrp = LRP1._replace(dnp=60.)
+        for _ in range(2):
+            self.assertEquals(decoder._calculate_route(l1, l2, lrp, True), ((l1, l2), 50))
+        self.assertEquals(len(calls), 1)
+
+        decoder.check_caches()
+        self.assertEquals(len(cache), 1)
+        mdb.version = 2
+        decoder.check_caches()
+        self.assertEquals(len(cache), 0)
+        self.assertEquals(decoder.candidate_cache.map_version, 2)
+
+    def test_24_one_to_many_routes(self):
+        """ OpenLR decoder: routes from a start line are searched at once """
+
+        class PairDatabase(DummyDatabase):
+            lengths = {('a1', 'b2'): 250, ('a2', 'b1'): 150}
+
+            def __init__(self):
+                self.calls = 0
+
+            def calculate_route(self, l1, l2, maxdist, lfrc, islastrp):
+                self.calls += 1
+                length = self.lengths.get((l1.id, l2.id))
+                if length is None or length > maxdist:
+                    raise RouteNotFoundException("No route")
+                return [l1, l2], length
+
+        class OneToManyDatabase(PairDatabase):
+            def calculate_routes(self, l1, targets, maxdist, lfrc, islastrp):
+                self.calls += 1
+                lengths = ((l2, self.lengths.get((l1.id, l2.id))) for l2 in targets)
+                return dict((l2.id, ([l1, l2], length)) for l2, length in lengths
+                            if length is not None and length <= maxdist)
+
+        line = lambda lid: Line(id=lid, bear=0, frc=3, fow=3, len=100, projected_len=None,
+                                start=None, end=None, bearin=0, bearout=0)
+        a1, a2, b1, b2 = map(line, ('a1', 'a2', 'b1', 'b2'))
+        lrp = LRP1._replace(dnp=200.)
+        location = LOCATION1._replace(flrp=lrp)
+        candidates = ((lrp, [(a1, 1000), (a2, 900)]), (LRP2, [(b1, 1000), (b2, 990)]))
+
+        single = PairDatabase()
+        expected = Decoder(single).resolve_route(location, candidates)
+        self.assertEquals(expected, (([a1, b2], 250),))
+        self.assertEquals(single.calls, 2)
+
+        mdb = OneToManyDatabase()
+        decoder = Decoder(mdb, route_cache=RouteCache())
+        self.assertEquals(decoder.resolve_route(location, candidates), (((a1, b2), 250),))
+        self.assertEquals(mdb.calls, 1)
+        decoder.resolve_route(location, candidates)
+        self.assertEquals(mdb.calls, 1)
+        self.assertEquals(Decoder(OneToManyDatabase()).resolve_route(location, candidates), expected)
+
+    def test_25_batched_lookups(self):
+        """ OpenLR decoder: candidate lines of all LRPs are found with batch requests """
+
+        class BatchDatabase(DummyDatabase):
+            def __init__(self):
+                self.calls = []
+
+            def find_closeby_nodes_many(self, coords_list, max_node_dist):
+                self.calls.append('nodes')
+                return [list(self.find_closeby_nodes(c, max_node_dist)) for c in coords_list]
+
+            def connected_lines_many(self, requests):
+                self.calls.append('connected')
+                return [list(self.connected_lines(*r)) for r in requests]
+
+            def find_closeby_lines_many(self, requests, max_node_dist):
+                self.calls.append('lines')
+                return [list(self.find_closeby_lines(c, max_node_dist, f, b)) for c, f, b in requests]
+
+        lrps = [(LRP1, WITH_LINE_DIRECTION), (LRP2, WITH_LINE_DIRECTION), (LRP2, AGAINST_LINE_DIRECTION)]
+        expected = [self.decoder.find_candidate_lines(lrp, beardir) for lrp, beardir in lrps]
+        self.assertEquals(self.decoder.find_candidate_lines_many(lrps), expected)
+
+        mdb = BatchDatabase()
+        decoder = Decoder(mdb, candidate_cache=CandidateCache())
+        self.assertEquals(decoder.find_candidate_lines_many(lrps), expected)
+        self.assertEquals(mdb.calls, ['nodes', 'connected', 'lines'])
+        # Cached LRPs are not requested again
+        self.assertEquals(decoder.find_candidate_lines_many(lrps[:2]), expected[:2])
+        self.assertEquals(len(mdb.calls), 3)
+
+        with self.assertRaises(DecoderError):
+            decoder.find_candidate_lines_many([(LRP1._replace(coords=Coords(0.0, 0.0)), WITH_LINE_DIRECTION)])
+
+    def test_26_overridden_candidate_lines(self):
+        """ OpenLR decoder: overrides of find_candidate_lines are used by batch lookups """
+        calls = []
+
+        class CustomDecoder(Decoder):
+            def find_candidate_lines(self, lrp, beardir=WITH_LINE_DIRECTION, with_details=False):
+                calls.append((lrp, beardir))
+                return super(CustomDecoder, self).find_candidate_lines(lrp, beardir, with_details)
+
+        lrps = [(LRP1, WITH_LINE_DIRECTION), (LRP2, AGAINST_LINE_DIRECTION)]
+        expected = self.decoder.find_candidate_lines_many(lrps)
+        self.assertEquals(CustomDecoder(self._database).find_candidate_lines_many(lrps), expected)
+        self.assertEquals(calls, lrps)
+
+    def test_27_overridden_candidate_nodes(self):
+        """ OpenLR decoder: overrides of find_candidate_nodes are used by batch lookups """
+        calls = []
+
+        class CustomDecoder(Decoder):
+            def find_candidate_nodes(self, lrp):
+                calls.append(lrp)
+                return super(CustomDecoder, self).find_candidate_nodes(lrp)
+
+        lrps = [(LRP1, WITH_LINE_DIRECTION), (LRP2, AGAINST_LINE_DIRECTION)]
+        expected = self.decoder.find_candidate_lines_many(lrps)
+        self.assertEquals(CustomDecoder(self._database).find_candidate_lines_many(lrps), expected)
+        self.assertEquals(calls, [LRP1, LRP2])
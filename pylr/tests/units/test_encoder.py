@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Test the binary encoder, and check the fast parser against the
+reference one on random locations.
+"""
+
+try:
+    import random
+    from StringIO import StringIO
+    from unittest import TestCase
+    from pylr import (parse_binary,
+                      iter_length_prefixed,
+                      LocationType,
+                      BITSTRING_BACKEND,
+                      FAST_BACKEND)
+    from pylr.constants import BINARY_VERSION_2
+    from pylr.encoder import (encode_binary,
+                              random_location,
+                              write_corpus,
+                              EncoderError,
+                              ENCODED_TYPES)
+    from pylr.tests.data import LOCATIONS
+except:
+    import traceback
+    traceback.print_exc()
+    raise
+
+
+class TestEncoder(TestCase):
+
+    def test_encode_locations(self):
+        """ Test that sample locations are encoded to the same data
+        """
+        for data, location in LOCATIONS:
+            self.assertEquals(encode_binary(location, base64=True), data)
+
+    def test_random_locations(self):
+        """ Test that both backends parse random locations alike
+        """
+        rnd = random.Random(0)
+        for loc_type in ENCODED_TYPES:
+            for _ in xrange(200):
+                location = random_location(loc_type, rnd)
+                data = encode_binary(location)
+                parsed = parse_binary(data, backend=FAST_BACKEND)
+                self.assertEquals(parsed, parse_binary(data, backend=BITSTRING_BACKEND))
+                self.assertEquals(encode_binary(parsed), data)
+
+    def test_encoder_errors(self):
+        """ Test invalid locations
+        """
+        location = next(v for _, v in LOCATIONS if v.type == LocationType.POINT_ALONG_LINE)
+        with self.assertRaises(EncoderError):
+            encode_binary(location._replace(version=BINARY_VERSION_2))
+        with self.assertRaises(EncoderError):
+            encode_binary(location._replace(llrp=location.llrp._replace(coords=location.flrp.coords._replace(lon=0))))
+
+    def test_write_corpus(self):
+        """ Test that a corpus can be read back
+        """
+        f = StringIO()
+        self.assertEquals(write_corpus(f, ENCODED_TYPES, 10, seed=1), 10 * len(ENCODED_TYPES))
+        records = list(iter_length_prefixed(f.getvalue()))
+        self.assertEquals(len(records), 10 * len(ENCODED_TYPES))
+        self.assertEquals(sorted(set(parse_binary(r).type for r in records)), sorted(ENCODED_TYPES))
+
+    def test_num_points(self):
+        """ Test random locations with a given number of points
+        """
+        rnd = random.Random(2)
+        for n in (0, 1, 50):
+            self.assertEquals(len(random_location(LocationType.LINE_LOCATION, rnd, num_points=n).points), n)
+            self.assertEquals(len(random_location(LocationType.CLOSED_LINE, rnd, num_points=n).points), n)
+        for n in (3, 50):
+            location = random_location(LocationType.POLYGON, rnd, num_points=n)
+            self.assertEquals(len(parse_binary(encode_binary(location)).points), n)
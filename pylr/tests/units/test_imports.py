@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Test the lazy import of the package.
+"""
+
+try:
+    from unittest import TestCase
+    import pylr
+    from pylr.tests.benchmarks.bench_import import import_profile
+except:
+    import traceback
+    traceback.print_exc()
+    raise
+
+
+class TestImports(TestCase):
+
+    def test_lazy_import(self):
+        """ Importing the package imports none of its submodules """
+        modules = import_profile('import pylr')['modules']
+        self.assertFalse([m for m in modules if m.startswith('pylr.') and m not in ('pylr.version', 'pylr.utils')],
+                         modules)
+
+    def test_parse_only(self):
+        """ Parsing imports neither the decoder nor bitstring """
+        profile = import_profile('from pylr import parse_binary; parse_binary("CwOyQCDbSxJPBwAA/osSXxM=", '
+                                 'base64=True)', breakdown=True)
+        self.assertIn('pylr.parser', profile['modules'])
+        for name in ('pylr.decoder', 'pylr.rating', 'bitstring'):
+            self.assertNotIn(name, profile['modules'])
+        self.assertIn('pylr.parser', [name for name, _, _ in profile['imports']])
+        self.assertIn('bitstring', import_profile('from pylr import parse_binary, BITSTRING_BACKEND; '
+                                                  'parse_binary("CwOyQCDbSxJPBwAA/osSXxM=", base64=True, '
+                                                  'backend=BITSTRING_BACKEND)')['modules'])
+
+    def test_public_names(self):
+        """ Public names are still available """
+        for name in pylr.__all__:
+            self.assertTrue(hasattr(pylr, name), name)
+            self.assertIn(name, dir(pylr))
+        self.assertTrue(pylr.Decoder is pylr.decoder.ClassicDecoder)
+        self.assertTrue(pylr.parse_binary is pylr.parser.parse_binary)
+        self.assertEqual(pylr.fow.MOTORWAY, 1)
+        self.assertRaises(AttributeError, getattr, pylr, 'unknown')
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Test the in-memory map database.
+"""
+
+try:
+    from unittest import TestCase, skipIf
+    from pylr import (LineLocation, LocationReferencePoint, Coords, ClassicDecoder, RouteNotFoundException,
+                      WITH_LINE_DIRECTION, AGAINST_LINE_DIRECTION)
+    from pylr import PointAlongLineLocation, LocationType
+    from pylr.cache import CandidateCache, RouteCache
+    from pylr.xmlparser import iter_xml_locations
+    from pylr.tests.xml_data import openlr_document
+    from StringIO import StringIO
+    from pylr.spatial import distance
+    try:
+        import numpy
+        from pylr.mapdb import MemoryMapDatabase
+    except ImportError:
+        numpy = None
+except:
+    import traceback
+    traceback.print_exc()
+    raise
+
+
+SIZE = 10
+STEP = 0.001
+ORIGIN = (5.0, 50.0)
+
+
+def grid_network():
+    """ Square grid of two way roads """
+    nodes = [(ORIGIN[0] + STEP * i, ORIGIN[1] + STEP * j) for j in xrange(SIZE) for i in xrange(SIZE)]
+    lines = []
+    for j in xrange(SIZE):
+        for i in xrange(SIZE):
+            n = j * SIZE + i
+            # Rows are main roads
+            if i + 1 < SIZE:
+                lines += [(n, n + 1, 2, 3), (n + 1, n, 2, 3)]
+            if j + 1 < SIZE:
+                lines += [(n, n + SIZE, 5, 3), (n + SIZE, n, 5, 3)]
+    return nodes, lines
+
+
+@skipIf(numpy is None, "numpy is not installed")
+class TestMemoryMapDatabase(TestCase):
+
+    def setUp(self):
+        self.nodes, self.lines = grid_network()
+        self.db = MemoryMapDatabase.from_lines(self.nodes, self.lines)
+        self.line_ids = dict(((start, end), i) for i, (start, end, _, _) in enumerate(self.lines))
+
+    def path(self, *nodes):
+        return [self.line_ids[n1, n2] for n1, n2 in zip(nodes, nodes[1:])]
+
+    def test_01_lines(self):
+        """ Line lengths and bearings """
+        db = self.db
+        east, north = self.line_ids[0, 1], self.line_ids[0, SIZE]
+        self.assertAlmostEqual(db.line_len[east], distance(Coords(*self.nodes[0]), Coords(*self.nodes[1])))
+        self.assertEqual((db.line_bear_out[east], db.line_bear_in[east]), (8, 24))
+        self.assertEqual((db.line_bear_out[north], db.line_bear_in[north]), (0, 16))
+        self.assertGreater(db.nbytes, 0)
+
+    def test_02_shapes(self):
+        """ Shaped lines: length and bearings follow the shape points """
+        nodes = [(5.0, 50.0), (5.001, 50.0)]
+        db = MemoryMapDatabase.from_lines(nodes, [(0, 1, 3, 3, [(5.0, 50.001), (5.001, 50.001)])])
+        points = [Coords(*p) for p in (nodes[0], (5.0, 50.001), (5.001, 50.001), nodes[1])]
+        self.assertAlmostEqual(db.line_len[0], sum(distance(a, b) for a, b in zip(points, points[1:])))
+        self.assertEqual((db.line_bear_out[0], db.line_bear_in[0]), (0, 0))
+        line, d = db.find_closeby_lines((5.0005, 50.0011), 20, 7, WITH_LINE_DIRECTION)[0]
+        self.assertEqual(line.bear, 8)
+        self.assertAlmostEqual(d, 11.132, places=2)
+        self.assertAlmostEqual(line.projected_len, db.line_len[0] / 2.0, places=1)
+
+    def test_03_closeby_nodes(self):
+        """ Nodes found by the grid are the ones of a full scan """
+        db = self.db
+        for coords in ((5.0021, 50.0033), (4.9999, 50.0), (5.0045, 50.0095)):
+            for radius in (10, 100, 300):
+                expected = sorted(i for i, c in enumerate(self.nodes)
+                                  if distance(Coords(*c), Coords(*coords)) <= radius)
+                found = db.find_closeby_nodes(coords, radius)
+                self.assertEqual(sorted(n.id for n in found), expected)
+                for n in found:
+                    self.assertAlmostEqual(n.distance, distance(Coords(*self.nodes[n.id]), Coords(*coords)))
+
+    def test_04_closeby_lines(self):
+        """ Lines found by the grid, projections and bearings """
+        db = self.db
+        coords = (5.0025, 50.0031)
+        found = dict((line.id, (line, d)) for line, d in db.find_closeby_lines(coords, 100, 7, WITH_LINE_DIRECTION))
+        # Lines around the nearest row only
+        east = self.line_ids[3 * SIZE + 2, 3 * SIZE + 3]
+        west = self.line_ids[3 * SIZE + 3, 3 * SIZE + 2]
+        self.assertIn(east, found)
+        self.assertIn(west, found)
+        self.assertAlmostEqual(found[east][1], 11.132, places=2)
+        self.assertEqual(found[east][0].bear, 8)
+        self.assertEqual(found[west][0].bear, 24)
+        self.assertAlmostEqual(found[east][0].projected_len, db.line_len[east] / 2.0, places=1)
+        self.assertAlmostEqual(found[west][0].projected_len, db.line_len[west] / 2.0, places=1)
+        for line, d in found.itervalues():
+            self.assertLessEqual(d, 100)
+        # Bearings against the line direction
+        against = dict((line.id, line) for line, _ in db.find_closeby_lines(coords, 100, 7, AGAINST_LINE_DIRECTION))
+        self.assertEqual(against[east].bear, 24)
+        # FRC filter
+        frcs = set(db.line_frc[line.id] for line, _ in db.find_closeby_lines(coords, 100, 2, WITH_LINE_DIRECTION))
+        self.assertEqual(frcs, set([2]))
+        self.assertEqual(db.find_closeby_lines((6.0, 50.0), 100, 7, WITH_LINE_DIRECTION), [])
+
+    def test_05_connected_lines(self):
+        """ Lines leaving and entering a node """
+        db = self.db
+        node = db.find_closeby_nodes(self.nodes[SIZE + 1], 1)[0]
+        out = db.connected_lines(node, 7, WITH_LINE_DIRECTION)
+        self.assertEqual(sorted(line.id for line in out),
+                         sorted(i for i, l in enumerate(self.lines) if l[0] == SIZE + 1))
+        self.assertEqual(sorted(line.bear for line in out), [0, 8, 16, 24])
+        into = db.connected_lines(node, 7, AGAINST_LINE_DIRECTION)
+        self.assertEqual(sorted(line.id for line in into),
+                         sorted(i for i, l in enumerate(self.lines) if l[1] == SIZE + 1))
+        self.assertEqual(sorted(line.bear for line in into), [0, 8, 16, 24])
+        self.assertEqual(len(db.connected_lines(node, 2, WITH_LINE_DIRECTION)), 2)
+
+    def test_06_routes(self):
+        """ Shortest routes between lines """
+        db = self.db
+        lines = db._lines(numpy.arange(len(self.lines)), db.line_bear_out)
+        path = self.path(0, 1, 2, 3, 4)
+        l1, l2 = lines[path[0]], lines[path[-1]]
+        route, length = db.calculate_route(l1, l2, 1000, 7, False)
+        self.assertEqual([line.id for line in route], path[:-1])
+        self.assertAlmostEqual(length, sum(db.line_len[path[:-1]]))
+        route, length = db.calculate_route(l1, l2, 1000, 7, True)
+        self.assertEqual([line.id for line in route], path)
+        self.assertAlmostEqual(length, sum(db.line_len[path]))
+        # Distance bound
+        with self.assertRaises(RouteNotFoundException):
+            db.calculate_route(l1, l2, 150, 7, False)
+        # Lowest FRC: rows are the only allowed lines
+        l2 = lines[self.line_ids[SIZE + 1, SIZE + 2]]
+        with self.assertRaises(RouteNotFoundException):
+            db.calculate_route(l1, l2, 1000, 2, False)
+        route, _ = db.calculate_route(l1, l2, 1000, 5, False)
+        self.assertEqual([line.id for line in route], self.path(0, 1, SIZE + 1))
+
+    def test_07_routes_many(self):
+        """ Routes to several lines from a single search """
+        db = self.db
+        lines = db._lines(numpy.arange(len(self.lines)), db.line_bear_out)
+        l1 = lines[0]
+        targets = [lines[i] for i in xrange(0, len(lines), 7)]
+        for islastrp in (False, True):
+            routes = db.calculate_routes(l1, targets, 500, 7, islastrp)
+            for l2 in targets:
+                try:
+                    expected = db.calculate_route(l1, l2, 500, 7, islastrp)
+                except RouteNotFoundException:
+                    self.assertNotIn(l2.id, routes)
+                    continue
+                route, length = routes[l2.id]
+                self.assertAlmostEqual(length, expected[1])
+                self.assertLessEqual(length, 500)
+                self.assertEqual(route[0], l1)
+
+    def test_08_invalid_arrays(self):
+        """ Inconsistent arrays """
+        with self.assertRaises(ValueError):
+            MemoryMapDatabase([0.0, 1.0], [0.0], [], [], [], [])
+        with self.assertRaises(ValueError):
+            MemoryMapDatabase([0.0, 1.0], [0.0, 1.0], [0], [1, 0], [3], [3])
+        with self.assertRaises(ValueError):
+            MemoryMapDatabase([0.0, 1.0], [0.0, 1.0], [0], [2], [3], [3])
+        with self.assertRaises(ValueError):
+            MemoryMapDatabase([0.0, 1.0], [0.0, 1.0], [0], [1], [3], [3], [0, 1], [0.0], [0.0])
+
+    def test_09_decode(self):
+        """ Decode a line location on the map database """
+        db = self.db
+        path = self.path(*xrange(2 * SIZE + 1, 2 * SIZE + 8))
+        lrp_lines = (path[:3], path[3:])
+
+        def lrp(line, lines):
+            return LocationReferencePoint(Coords(*self.nodes[self.lines[line][0]]), int(db.line_bear_out[line]),
+                                          0, 2, 3, 2, float(sum(db.line_len[lines])))
+
+        last = path[-1]
+        llrp = LocationReferencePoint(Coords(*self.nodes[self.lines[last][1]]), int(db.line_bear_in[last]),
+                                      0, 2, 3, None, None)
+        location = LineLocation(3, 1, lrp(path[0], lrp_lines[0]), llrp, [lrp(path[3], lrp_lines[1])], 0, 0)
+        decoders = (ClassicDecoder(db),
+                    ClassicDecoder(db, candidate_cache=CandidateCache(), route_cache=RouteCache()))
+        for decoder in decoders:
+            for _ in xrange(2):
+                route = decoder.decode(location)
+                self.assertEqual(route[0], path)
+                self.assertAlmostEqual(route[1], sum(db.line_len[path]))
+
+    def test_10_cached_projections(self):
+        """ Cached routes keep the projections of the LRPs of each location """
+        nodes = [(5.0 + 0.005 * i, 50.0) for i in xrange(5)]
+        lines = [line for i in xrange(4) for line in ((i, i + 1, 2, 3), (i + 1, i, 2, 3))]
+        db = MemoryMapDatabase.from_lines(nodes, lines)
+        length = sum(db.line_len[[0, 2, 4, 6]])
+        llrp = LocationReferencePoint(Coords(*nodes[4]), 24, 0, 2, 3, None, None)
+
+        def location(fraction):
+            # First LRP far from the nodes: its line is found directly
+            flrp = LocationReferencePoint(Coords(5.0 + 0.005 * fraction, 50.0), 8, 0, 2, 3, 2,
+                                          float(length - fraction * db.line_len[0]))
+            return LineLocation(3, 1, flrp, llrp, [], 50, 0)
+
+        locations = [location(0.3), location(0.6)]
+        expected = [ClassicDecoder(db).decode(loc) for loc in locations]
+        self.assertNotEqual(expected[0][2], expected[1][2])
+        for one_to_many in (False, True):
+            decoder = ClassicDecoder(db, route_cache=RouteCache())
+            decoder._one_to_many = one_to_many
+            self.assertEqual([decoder.decode(loc) for loc in locations], expected)
+            self.assertEqual(decoder.route_cache.hits, 1)
+
+    def test_11_decode_xml_point(self):
+        """ Offsets of XML point locations are in meters """
+        nodes = [(5.0 + 0.005 * i, 50.0) for i in xrange(5)]
+        lines = [line for i in xrange(4) for line in ((i, i + 1, 2, 3), (i + 1, i, 2, 3))]
+        db = MemoryMapDatabase.from_lines(nodes, lines)
+        flrp = LocationReferencePoint(Coords(*nodes[1]), 8, 0, 2, 3, 2, 715.0)
+        llrp = LocationReferencePoint(Coords(*nodes[3]), 24, 0, 2, 3, None, None)
+        location = PointAlongLineLocation(3, LocationType.POINT_ALONG_LINE, flrp, llrp, 400)
+        document, expected = openlr_document([location])
+        location, = iter_xml_locations(StringIO(document))
+        self.assertEqual(location, expected[0])
+        lines, _, poff, _ = ClassicDecoder(db).decode(location)
+        self.assertEqual(lines, [4])
+        self.assertAlmostEqual(poff, 400 - db.line_len[2])
+
+    def test_12_long_segment(self):
+        """ Grid index of a long diagonal segment is linear in its length """
+        db = MemoryMapDatabase.from_lines([(5.0, 50.0), (6.0, 51.0)], [(0, 1, 3, 3)])
+        # 500 cells wide: indexing the bounding box would take 250000 cells
+        self.assertLess(db.nbytes, 100000)
+        for coords in ((5.0, 50.0), (5.5003, 50.4997), (6.0, 51.0)):
+            (line, d), = db.find_closeby_lines(coords, 50, 7, WITH_LINE_DIRECTION)
+            self.assertEqual(line.id, 0)
+            self.assertLess(d, 50)
+        self.assertEqual(db.find_closeby_lines((5.1, 50.9), 50, 7, WITH_LINE_DIRECTION), [])
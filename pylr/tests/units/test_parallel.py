@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Test the parallel parsing of locations references.
+"""
+
+try:
+    from unittest import TestCase
+    from pylr import (ON_ERROR_SKIP,
+                      ON_ERROR_RAISE,
+                      BinaryParseError,
+                      InvalidDataSizeError)
+    from pylr.parallel import ParsePool, parse_parallel
+    from pylr.tests.data import LOCATIONS
+except:
+    import traceback
+    traceback.print_exc()
+    raise
+
+
+class TestParallel(TestCase):
+
+    def test_parse_parallel(self):
+        """ Test that locations are returned in input order
+        """
+        data = [d for d, _ in LOCATIONS] * 3
+        expected = [v for _, v in LOCATIONS] * 3
+        self.assertEquals(list(parse_parallel(data, processes=2, chunksize=7)), expected)
+
+    def test_parse_pool_errors(self):
+        """ Test error policies of the parse pool
+        """
+        data = [d for d, _ in LOCATIONS]
+        expected = [v for _, v in LOCATIONS]
+        invalid = ['CwGvtA==', '!!']
+        with ParsePool(processes=2, chunksize=3) as pool:
+            result = list(pool.imap(data + invalid))
+            self.assertEquals(result[:-2], expected)
+            self.assertIsInstance(result[-2], InvalidDataSizeError)
+            self.assertIsInstance(result[-1], BinaryParseError)
+
+            self.assertEquals(list(pool.imap(invalid + data, on_error=ON_ERROR_SKIP)), expected)
+
+            errors = []
+            self.assertEquals(list(pool.imap(data + invalid, on_error=lambda d, e: errors.append(e))), expected)
+            self.assertEquals(len(errors), 2)
+
+            with self.assertRaises(InvalidDataSizeError):
+                list(pool.imap(invalid, on_error=ON_ERROR_RAISE))
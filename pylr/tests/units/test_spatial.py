@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Test the spatial attributes of parsed locations.
+"""
+
+try:
+    import pickle
+    from unittest import TestCase, skipIf
+    from pylr import (parse_binary,
+                      parse_binary_many,
+                      spatial_location,
+                      LocationType,
+                      BBox,
+                      Coords,
+                      BITSTRING_BACKEND)
+    from pylr.spatial import tile_key, bbox_intersects, distance, distances
+    from pylr.tests.data import LOCATIONS
+    try:
+        import numpy
+    except ImportError:
+        numpy = None
+except:
+    import traceback
+    traceback.print_exc()
+    raise
+
+
+class TestSpatial(TestCase):
+
+    def test_tile_key(self):
+        """ Test the Z-order of tile keys
+        """
+        self.assertEquals(tile_key(-180, -90), 0)
+        self.assertEquals(tile_key(180, 90), (1 << 32) - 1)
+        self.assertEquals(tile_key(0.0, 0.0, level=1), 3)
+        self.assertEquals(tile_key(-1.0, 1.0, level=1), 2)
+        self.assertEquals(tile_key(1.0, -1.0, level=1), 1)
+
+    def test_spatial_locations(self):
+        """ Test that spatial attributes are computed while parsing
+        """
+        for data, location in LOCATIONS:
+            spatial = parse_binary(data, base64=True, spatial=True)
+            self.assertEquals(spatial, location)
+            expected = spatial_location(location)
+            for attr in ('bounds', 'centroid', 'tile'):
+                self.assertEquals(getattr(spatial, attr), getattr(expected, attr), attr)
+            reference = parse_binary(data, base64=True, spatial=True, backend=BITSTRING_BACKEND)
+            self.assertEquals(reference.bounds, spatial.bounds)
+
+            bounds = spatial.bounds
+            self.assertTrue(bounds.minx <= spatial.centroid.lon <= bounds.maxx)
+            self.assertTrue(bounds.miny <= spatial.centroid.lat <= bounds.maxy)
+            if location.type == LocationType.LINE_LOCATION:
+                lons = [p.coords.lon for p in [location.flrp, location.llrp] + location.points]
+                self.assertEquals((bounds.minx, bounds.maxx), (min(lons), max(lons)))
+
+            copy = pickle.loads(pickle.dumps(spatial, pickle.HIGHEST_PROTOCOL))
+            self.assertEquals(copy.bounds, bounds)
+
+        spatial = list(parse_binary_many([d for d, _ in LOCATIONS], spatial=True))
+        self.assertEquals(spatial, [v for _, v in LOCATIONS])
+        region = BBox(4.9, 52.0, 5.2, 52.2)
+        self.assertTrue(any(bbox_intersects(s.bounds, region) for s in spatial))
+        self.assertFalse(all(bbox_intersects(s.bounds, region) for s in spatial))
+
+    @skipIf(numpy is None, "numpy is not installed")
+    def test_distances(self):
+        """ Vectorized distances are the ones of spatial.distance
+        """
+        points = [loc.flrp.coords for _, loc in LOCATIONS if hasattr(loc, 'flrp')] + [Coords(179.9, 10.0)]
+        other = points[1:] + [Coords(-179.9, 10.0)]
+        lon1, lat1, lon2, lat2 = (numpy.array(v) for v in zip(*[a + b for a, b in zip(points, other)]))
+        expected = [distance(a, b) for a, b in zip(points, other)]
+        for d, e in zip(distances(lon1, lat1, lon2, lat2).tolist(), expected):
+            self.assertAlmostEqual(d, e)
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Test the sanity checks of parsed locations.
+"""
+
+try:
+    from unittest import TestCase, skipIf
+    from pylr import (LocationType,
+                      Coords,
+                      BBox,
+                      RectangleLocation,
+                      GridLocation,
+                      Decoder,
+                      MapDatabase,
+                      DecoderInvalidLocation)
+    from pylr.validation import location_error, reject_mask, MAX_DNP
+    from pylr.tests.data import LOCATIONS
+    try:
+        import numpy
+        from pylr.columnar import to_columns, reject_mask_columns
+    except ImportError:
+        numpy = None
+except:
+    import traceback
+    traceback.print_exc()
+    raise
+
+
+def _sample(loc_type, predicate=lambda v: True):
+    return next(v for _, v in LOCATIONS if v.type == loc_type and predicate(v))
+
+
+def invalid_locations():
+    """ Sample locations made invalid """
+    line = _sample(LocationType.LINE_LOCATION, lambda v: len(v.points) > 2)
+    short = _sample(LocationType.LINE_LOCATION, lambda v: not v.points)
+    point = _sample(LocationType.POINT_ALONG_LINE)
+    polygon = _sample(LocationType.POLYGON)
+    closed_line = _sample(LocationType.CLOSED_LINE)
+    circle = _sample(LocationType.CIRCLE)
+    return [
+        line._replace(points=line.points[:1] + [line.points[1]._replace(coords=Coords(181.0, 48.0))] +
+                      line.points[2:]),
+        line._replace(points=line.points[:1] + [line.points[1]._replace(lfrcnp=line.points[1].frc - 1)] +
+                      line.points[2:]),
+        line._replace(points=line.points[:1] + [line.points[1]._replace(dnp=None)] + line.points[2:]),
+        line._replace(flrp=line.flrp._replace(dnp=MAX_DNP + 1)),
+        # Distance to next point much shorter than the distance between LRPs
+        line._replace(flrp=line.flrp._replace(dnp=29.0)),
+        short._replace(poffs=60.0, noffs=40.0),
+        short._replace(version=2, noffs=short.flrp.dnp + 500),
+        point._replace(poffs=100.0),
+        point._replace(version=2, poffs=point.flrp.dnp + 500),
+        point._replace(version=4),
+        circle._replace(radius=0),
+        circle._replace(coords=Coords(5.0, -91.0)),
+        polygon._replace(points=polygon.points[:2]),
+        polygon._replace(points=polygon.points[:-1] + [Coords(-181.0, 0.0)]),
+        closed_line._replace(bear=32),
+        # The last line goes back to the first LRP
+        closed_line._replace(points=[closed_line.flrp._replace(coords=Coords(closed_line.flrp.coords.lon + 0.1,
+                                                                             closed_line.flrp.coords.lat),
+                                                               dnp=MAX_DNP)]),
+    ]
+
+
+class TestValidation(TestCase):
+
+    def test_valid_locations(self):
+        """ Sample locations are valid """
+        for _, location in LOCATIONS:
+            self.assertEqual(location_error(location), None, location)
+
+    def test_invalid_locations(self):
+        """ Invalid locations are rejected """
+        for location in invalid_locations():
+            self.assertNotEqual(location_error(location), None, location)
+        locations = [v for _, v in LOCATIONS] + invalid_locations()
+        self.assertEqual(reject_mask(locations), [False] * len(LOCATIONS) + [True] * len(invalid_locations()))
+
+    @skipIf(numpy is None, "numpy is not installed")
+    def test_reject_mask_columns(self):
+        """ Vectorized checks give the same results """
+        locations = [v for _, v in LOCATIONS] + invalid_locations() + [
+            RectangleLocation(3, LocationType.RECTANGLE, BBox(5.11, 52.1, 5.09, 52.11)),
+            GridLocation(3, LocationType.GRID, BBox(5.09, 52.1, 5.11, 52.11), 0, 2),
+            GridLocation(3, LocationType.GRID, BBox(5.09, 52.1, 5.11, 52.11), 3, 2)]
+        expected = reject_mask(locations)
+        self.assertEqual(expected[-3:], [True, True, False])
+        self.assertEqual(reject_mask_columns(to_columns(locations)).tolist(), expected)
+        self.assertEqual(reject_mask_columns(to_columns([])).tolist(), [])
+
+    def test_decoder_rejects_invalid_locations(self):
+        """ The decoder rejects invalid locations before any database access """
+        class FailingDatabase(MapDatabase):
+            def find_closeby_nodes(self, coords, max_node_dist):
+                raise AssertionError("Database accessed")
+
+        decoder = Decoder(FailingDatabase(), validate=True)
+        for location in invalid_locations():
+            if location.type in (LocationType.LINE_LOCATION, LocationType.POINT_ALONG_LINE):
+                self.assertRaises(DecoderInvalidLocation, decoder.decode, location)
+        # Not checked by default
+        decoder = Decoder(FailingDatabase())
+        self.assertRaises(AssertionError, decoder.decode, invalid_locations()[0])
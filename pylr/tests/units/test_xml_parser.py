@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+Test the OpenLR XML parser.
+"""
+
+try:
+    from StringIO import StringIO
+    from unittest import TestCase
+    from pylr.xmlparser import iter_xml_locations, XMLParseError
+    from pylr.tests.xml_data import XML_DOCUMENT, XML_LOCATIONS, location_xml
+    from pylr.tests.data import LOCATIONS
+except:
+    import traceback
+    traceback.print_exc()
+    raise
+
+
+class TestXMLParser(TestCase):
+
+    def test_xml_locations(self):
+        """ Test parsing of an XML document
+        """
+        self.assertEquals(list(iter_xml_locations(StringIO(XML_DOCUMENT))), XML_LOCATIONS)
+
+    def test_single_openlr_document(self):
+        """ Test a document with one OpenLR element, without namespace
+        """
+        xml, expected = location_xml(LOCATIONS[0][1])
+        self.assertEquals(list(iter_xml_locations(StringIO('<OpenLR>{}</OpenLR>'.format(xml)))), [expected])
+
+    def test_invalid_xml_locations(self):
+        """ Test invalid location references
+        """
+        for xml in ('<OpenLR><XMLLocationReference/></OpenLR>',
+                    '<OpenLR><XMLLocationReference><LineLocationReference/></XMLLocationReference></OpenLR>',
+                    '<OpenLR><XMLLocationReference><PointLocationReference><GeoCoordinate><Coordinates>'
+                    '<Longitude>x</Longitude><Latitude>1</Latitude></Coordinates></GeoCoordinate>'
+                    '</PointLocationReference></XMLLocationReference></OpenLR>'):
+            with self.assertRaises(XMLParseError):
+                list(iter_xml_locations(StringIO(xml)))
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+'''
+.. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+OpenLR XML documents built from the sample locations
+'''
+
+from pylr import LocationType, Coords, BBox, GridLocation, RectangleLocation, BEARING_SECTOR
+from pylr.xmlparser import (OPENLR_NAMESPACE,
+                            XML_LOCATION_VERSION,
+                            FOW_VALUES,
+                            SIDE_VALUES,
+                            ORIENTATION_VALUES)
+from pylr.tests.data import LOCATIONS
+
+
+_FOW_NAMES = dict((v, k) for k, v in FOW_VALUES.items() if k != 'TRAFFIC_SQUARE')
+_SIDE_NAMES = dict((v, k) for k, v in SIDE_VALUES.items())
+_ORIENTATION_NAMES = dict((v, k) for k, v in ORIENTATION_VALUES.items())
+
+
+def _coords(c, tag='Coordinates'):
+    return '<{0}><Longitude>{1!r}</Longitude><Latitude>{2!r}</Latitude></{0}>'.format(tag, c.lon, c.lat)
+
+
+def _line_attributes(frc, fow, bear):
+    return '<LineAttributes><FRC>FRC{}</FRC><FOW>{}</FOW><BEAR>{}</BEAR></LineAttributes>'.format(
+        frc, _FOW_NAMES[fow], int((bear + 0.5) * BEARING_SECTOR))
+
+
+def _lrp(lrp, tag='LocationReferencePoint'):
+    xml = _coords(lrp.coords) + _line_attributes(lrp.frc, lrp.fow, lrp.bear)
+    if lrp.dnp is not None:
+        xml += '<PathAttributes><LFRCNP>FRC{}</LFRCNP><DNP>{}</DNP></PathAttributes>'.format(lrp.lfrcnp, int(lrp.dnp))
+    return '<{0}>{1}</{0}>'.format(tag, xml)
+
+
+def _point(loc, tag):
+    xml = _lrp(loc.flrp) + _lrp(loc.llrp, 'LastLocationReferencePoint')
+    xml += '<Offsets><PosOff>{}</PosOff></Offsets>'.format(int(loc.poffs))
+    xml += '<SideOfRoad>{}</SideOfRoad><Orientation>{}</Orientation>'.format(
+        _SIDE_NAMES[loc.llrp.orient], _ORIENTATION_NAMES[loc.flrp.orient])
+    if loc.type == LocationType.POI_WITH_ACCESS_POINT:
+        xml += _coords(loc.coords)
+    return '<PointLocationReference><{0}>{1}</{0}></PointLocationReference>'.format(tag, xml)
+
+
+def _bbox(bbox):
+    return '<Rectangle>{}{}</Rectangle>'.format(_coords(Coords(bbox.minx, bbox.miny), 'LowerLeft'),
+                                                 _coords(Coords(bbox.maxx, bbox.maxy), 'UpperRight'))
+
+
+def location_xml(loc):
+    """ XMLLocationReference element of a location, and the location expected
+        from parsing it (with XML units).
+    """
+    t = loc.type
+    if t == LocationType.LINE_LOCATION:
+        xml = '<LineLocationReference>{}{}<Offsets><PosOff>{}</PosOff><NegOff>{}</NegOff></Offsets></LineLocationReference>'.format(
+            ''.join(_lrp(p) for p in [loc.flrp] + loc.points), _lrp(loc.llrp, 'LastLocationReferencePoint'),
+            int(loc.poffs), int(loc.noffs))
+        loc = loc._replace(poffs=int(loc.poffs), noffs=int(loc.noffs))
+    elif t == LocationType.POINT_ALONG_LINE:
+        xml = _point(loc, 'PointAlongLine')
+        loc = loc._replace(poffs=int(loc.poffs))
+    elif t == LocationType.POI_WITH_ACCESS_POINT:
+        xml = _point(loc, 'PoiWithAccessPoint')
+        loc = loc._replace(poffs=int(loc.poffs))
+    elif t == LocationType.GEO_COORDINATES:
+        xml = '<PointLocationReference><GeoCoordinate>{}</GeoCoordinate></PointLocationReference>'.format(
+            _coords(loc.coords))
+    elif t == LocationType.CIRCLE:
+        xml = ('<AreaLocationReference><CircleLocationReference><GeoCoordinate>{}</GeoCoordinate>'
+               '<Radius>{}</Radius></CircleLocationReference></AreaLocationReference>').format(
+            _coords(loc.coords), loc.radius)
+    elif t == LocationType.RECTANGLE:
+        xml = '<AreaLocationReference><RectangleLocationReference>{}</RectangleLocationReference></AreaLocationReference>'.format(
+            _bbox(loc.bbox))
+    elif t == LocationType.GRID:
+        xml = ('<AreaLocationReference><GridLocationReference>{}<NumColumns>{}</NumColumns>'
+               '<NumRows>{}</NumRows></GridLocationReference></AreaLocationReference>').format(
+            _bbox(loc.bbox), loc.cols, loc.rows)
+    elif t == LocationType.POLYGON:
+        xml = ('<AreaLocationReference><PolygonLocationReference><PolygonCorners>{}</PolygonCorners>'
+               '</PolygonLocationReference></AreaLocationReference>').format(''.join(_coords(c) for c in loc.points))
+    elif t == LocationType.CLOSED_LINE:
+        xml = ('<AreaLocationReference><ClosedLineLocationReference>{}<LastLine>{}</LastLine>'
+               '</ClosedLineLocationReference></AreaLocationReference>').format(
+            ''.join(_lrp(p) for p in [loc.flrp] + loc.points), _line_attributes(loc.frc, loc.fow, loc.bear))
+    return '<XMLLocationReference>{}</XMLLocationReference>'.format(xml), loc._replace(version=XML_LOCATION_VERSION)
+
+
+def openlr_document(locations):
+    """ XML document holding one OpenLR element per location
+
+        :returns: Document, expected locations
+        :rtype: string, list
+    """
+    elements, expected = [], []
+    for i, loc in enumerate(locations):
+        xml, loc = location_xml(loc)
+        elements.append('<OpenLR><LocationID>{}</LocationID>{}</OpenLR>'.format(i, xml))
+        expected.append(loc)
+    return ('<?xml version="1.0" encoding="UTF-8"?><OpenLRDump xmlns="{}">{}</OpenLRDump>'.format(
+        OPENLR_NAMESPACE, ''.join(elements)), expected)
+
+
+''' XML document of the sample locations, and the expected locations '''
+XML_DOCUMENT, XML_LOCATIONS = openlr_document(
+    [v for _, v in LOCATIONS] +
+    [RectangleLocation(3, LocationType.RECTANGLE, BBox(5.09, 52.1, 5.11, 52.11)),
+     GridLocation(3, LocationType.GRID, BBox(5.09, 52.1, 5.11, 52.11), 3, 2)])
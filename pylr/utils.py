@@ -5,6 +5,9 @@
     
 '''
 
+from types import ModuleType
+from importlib import import_module
+
 
 def enum(*sequential, **named):
     """ Create an enum type, as in the C language.
@@ -45,3 +48,37 @@ class lazyproperty(object):
         value = self.fget(obj)
         setattr(obj, self.func_name, value)
         return value
+
+
+class LazyModule(ModuleType):
+    """ Module whose attributes are imported on first access.
+
+        Meant to replace a package in sys.modules, so importing the package
+        does not import all its submodules.
+
+        :param module: Module to replace; its special attributes (__file__,
+                       __path__, __doc__...) are kept
+        :param dict exports: (module name, attribute name) by exported name,
+                             module names may be relative to the package.
+                             If the attribute name is None, the exported name
+                             is the module itself.
+    """
+    def __init__(self, module, exports):
+        ModuleType.__init__(self, module.__name__)
+        self.__dict__.update((k, v) for k, v in module.__dict__.items() if k.startswith('__'))
+        self.__all__ = sorted(exports)
+        self._exports = exports
+
+    def __getattr__(self, name):
+        try:
+            modname, attr = self._exports[name]
+        except KeyError:
+            raise AttributeError("'module' object has no attribute '{}'".format(name))
+        value = import_module(modname, self.__name__)
+        if attr is not None:
+            value = getattr(value, attr)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(self._exports))
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+''' Sanity checks of parsed locations
+
+    .. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+    A location reference may be well formed and still be meaningless:
+    coordinates out of range, a distance to next point shorter than the
+    distance between the LRPs, a lowest FRC to next point better than the
+    FRC of the LRP, offsets out of the first or last segment...
+
+    Decoding such a location fails, after spatial queries and route
+    searches on the map database. The checks defined here only use the
+    location itself, and reject it before any map database access. The
+    decoder only runs them when created with ``validate=True``; batch
+    pipelines may filter locations with :py:func:`reject_mask` instead.
+    See :py:func:`pylr.columnar.reject_mask_columns` for the vectorized
+    version of the same checks.
+'''
+
+from .constants import (LocationType,
+                        BINARY_VERSION_2,
+                        BINARY_VERSION_3,
+                        LENGTH_INTERVAL,
+                        OFFSET_BUCKETS,
+                        BEARING_SECTORS)
+from .spatial import distance
+
+
+''' Maximum distance to next point (in meters) '''
+MAX_DNP = OFFSET_BUCKETS * LENGTH_INTERVAL
+
+''' Number of functional road classes and forms of way '''
+FRC_COUNT = 8
+FOW_COUNT = 8
+
+''' Maximum relative offset (in percent, excluded) '''
+MAX_RELATIVE_OFFSET = 100.0
+
+''' Tolerance on distances to next point (in meters): the encoded distance
+    is the middle of an interval of LENGTH_INTERVAL meters
+'''
+DNP_TOLERANCE = LENGTH_INTERVAL
+
+
+def _coords_error(c):
+    if not (-180.0 <= c.lon <= 180.0 and -90.0 <= c.lat <= 90.0):
+        return "Coordinates out of range: {}".format(tuple(c))
+
+
+def _lrp_error(lrp, last=False):
+    error = _coords_error(lrp.coords)
+    if error is not None:
+        return error
+    if not (0 <= lrp.bear < BEARING_SECTORS and 0 <= lrp.frc < FRC_COUNT and 0 <= lrp.fow < FOW_COUNT):
+        return "Invalid LRP attributes: bear={}, frc={}, fow={}".format(lrp.bear, lrp.frc, lrp.fow)
+    if last:
+        return None
+    if lrp.dnp is None or not (0 < lrp.dnp <= MAX_DNP):
+        return "Invalid distance to next point: {}".format(lrp.dnp)
+    if lrp.lfrcnp is None or not (lrp.frc <= lrp.lfrcnp < FRC_COUNT):
+        return "Invalid lowest FRC to next point: frc={}, lfrcnp={}".format(lrp.frc, lrp.lfrcnp)
+
+
+def _path_error(lrps, tolerance):
+    """ Check the LRPs of a path, and their distances to next point """
+    for i, lrp in enumerate(lrps):
+        error = _lrp_error(lrp, i == len(lrps) - 1)
+        if error is not None:
+            return error
+    for lrp, nextlrp in zip(lrps, lrps[1:]):
+        d = distance(lrp.coords, nextlrp.coords)
+        if d > lrp.dnp + tolerance:
+            return "Distance to next point {} shorter than the distance between LRPs {:.0f}".format(lrp.dnp, d)
+
+
+def _offset_error(location, poffs, noffs, first, last, tolerance):
+    """ Offsets must be in the first (positive offset) and last (negative
+        offset) segments
+    """
+    if poffs < 0 or noffs < 0:
+        return "Negative offset"
+    if location.version == BINARY_VERSION_3:
+        if poffs >= MAX_RELATIVE_OFFSET or noffs >= MAX_RELATIVE_OFFSET:
+            return "Relative offset out of range"
+        if first is last and poffs + noffs >= MAX_RELATIVE_OFFSET:
+            return "Offsets cover the whole location"
+    elif location.version == BINARY_VERSION_2:
+        if poffs > first.dnp + tolerance or noffs > last.dnp + tolerance:
+            return "Offset longer than its segment"
+
+
+def _line_error(location, tolerance):
+    lrps = [location.flrp] + list(location.points) + [location.llrp]
+    return (_path_error(lrps, tolerance) or
+            _offset_error(location, location.poffs, location.noffs, lrps[0], lrps[-2], tolerance))
+
+
+def _point_along_line_error(location, tolerance):
+    return (_path_error([location.flrp, location.llrp], tolerance) or
+            _offset_error(location, location.poffs, 0, location.flrp, location.flrp, tolerance))
+
+
+def _geo_coordinates_error(location, tolerance):
+    return _coords_error(location.coords)
+
+
+def _poi_with_access_point_error(location, tolerance):
+    return _point_along_line_error(location, tolerance) or _coords_error(location.coords)
+
+
+def _circle_error(location, tolerance):
+    if not location.radius > 0:
+        return "Invalid radius: {}".format(location.radius)
+    return _coords_error(location.coords)
+
+
+def _bbox_error(bbox):
+    if not (-180.0 <= bbox.minx <= bbox.maxx <= 180.0 and -90.0 <= bbox.miny <= bbox.maxy <= 90.0):
+        return "Invalid bounding box: {}".format(tuple(bbox))
+
+
+def _rectangle_error(location, tolerance):
+    return _bbox_error(location.bbox)
+
+
+def _grid_error(location, tolerance):
+    if not (location.cols > 0 and location.rows > 0):
+        return "Invalid grid size: {}x{}".format(location.cols, location.rows)
+    return _bbox_error(location.bbox)
+
+
+def _closed_line_error(location, tolerance):
+    # The last line goes back to the first LRP
+    lrps = [location.flrp] + list(location.points)
+    if not (0 <= location.bear < BEARING_SECTORS and 0 <= location.frc < FRC_COUNT and
+            0 <= location.fow < FOW_COUNT):
+        return "Invalid last line attributes"
+    return _path_error(lrps + [location.flrp._replace(lfrcnp=None, dnp=None)], tolerance)
+
+
+def _polygon_error(location, tolerance):
+    if len(location.points) < 3:
+        return "Polygon with less than 3 corners"
+    for c in location.points:
+        error = _coords_error(c)
+        if error is not None:
+            return error
+
+
+_CHECKS = {LocationType.LINE_LOCATION: _line_error,
+           LocationType.POINT_ALONG_LINE: _point_along_line_error,
+           LocationType.GEO_COORDINATES: _geo_coordinates_error,
+           LocationType.POI_WITH_ACCESS_POINT: _poi_with_access_point_error,
+           LocationType.CIRCLE: _circle_error,
+           LocationType.RECTANGLE: _rectangle_error,
+           LocationType.GRID: _grid_error,
+           LocationType.CLOSED_LINE: _closed_line_error,
+           LocationType.POLYGON: _polygon_error}
+
+
+def location_error(location, tolerance=DNP_TOLERANCE):
+    """ Check a parsed location
+
+        :param location: Object describing the location
+        :param float tolerance: Tolerance on distances to next point (in meters)
+        :returns: Description of the first failed check, None if the location is valid
+        :rtype: str
+    """
+    if location.version not in (BINARY_VERSION_2, BINARY_VERSION_3):
+        return "Invalid version: {}".format(location.version)
+    check = _CHECKS.get(location.type)
+    if check is None:
+        return "Invalid location type: {}".format(location.type)
+    return check(location, tolerance)
+
+
+def reject_mask(locations, tolerance=DNP_TOLERANCE):
+    """ Check a batch of parsed locations
+
+        :param locations: iterable of objects describing the locations
+        :param float tolerance: Tolerance on distances to next point (in meters)
+        :returns: One boolean per location, True if the location is rejected
+        :rtype: list
+    """
+    return [location_error(location, tolerance) is not None for location in locations]
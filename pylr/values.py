@@ -5,12 +5,13 @@
 
 '''
 
-from .utils import signum
 from .constants import (BIT24FACTOR_REVERSED,
                         DECA_MICRO_DEG_FACTOR,
                         BEARING_SECTOR,
                         LENGTH_INTERVAL,
-                        RELATIVE_OFFSET_LENGTH)
+                        RELATIVE_OFFSET_LENGTH,
+                        BINARY_VERSION_2,
+                        BINARY_VERSION_3)
 
 
 def _get32BitRepresentation(v):
@@ -21,7 +22,12 @@ def _get32BitRepresentation(v):
         :return: Coordinate (in degrees)
         :rtype: float  
     """
-    return (v - signum(v)*0.5) * BIT24FACTOR_REVERSED
+    # Same result as (v - signum(v)*0.5) * BIT24FACTOR_REVERSED
+    if v > 0:
+        return (v - 0.5) * BIT24FACTOR_REVERSED
+    if v < 0:
+        return (v + 0.5) * BIT24FACTOR_REVERSED
+    return 0.0
 
 
 def coordinates_values(lon, lat):
@@ -94,3 +100,20 @@ def relative_distance(offset):
     lower = offset * RELATIVE_OFFSET_LENGTH
     upper = (offset + 1) * RELATIVE_OFFSET_LENGTH
     return (lower + upper) / 2
+
+
+# ----------------
+# Lookup tables
+# ----------------
+
+''' Distance estimates, indexed by the 8 bits distance (dnp) or offset interval '''
+DISTANCE_ESTIMATES = tuple(distance_estimate(i) for i in xrange(256))
+
+''' Relative offset estimates, indexed by the 8 bits offset interval '''
+RELATIVE_DISTANCES = tuple(relative_distance(i) for i in xrange(256))
+
+''' Offset estimates tables by binary version. Offsets of other
+    versions are not converted.
+'''
+OFFSET_ESTIMATES = {BINARY_VERSION_2: DISTANCE_ESTIMATES,
+                    BINARY_VERSION_3: RELATIVE_DISTANCES}
@@ -0,0 +1,328 @@
+# -*- coding: utf-8 -*-
+''' Streaming parser of the OpenLR XML physical format
+
+    .. moduleauthor:: David Marteau <david.marteau@mappy.com>
+
+    XML documents are read with ``iterparse``: each ``XMLLocationReference``
+    element is converted to the namedtuple returned by
+    :py:func:`pylr.parser.parse_binary` for the same location, then
+    released, so memory does not grow with the size of the document.
+
+    Values are converted to the units of the binary format: bearings are
+    sector numbers, road classes and forms of way are integers. XML offsets
+    are distances in meters, so locations are given the version
+    BINARY_VERSION_2, whose offsets are read as meters by the decoder (for
+    line and point locations). The binary format version 2 only holds line
+    locations: other XML locations cannot be encoded back to binary.
+'''
+
+try:
+    from xml.etree.cElementTree import iterparse
+except ImportError:
+    from xml.etree.ElementTree import iterparse
+
+from .constants import (LocationType,
+                        BINARY_VERSION_2,
+                        BEARING_SECTOR,
+                        ON_ROAD_OR_UNKNOWN,
+                        RIGTH_SIDE,
+                        LEFT_SIDE,
+                        BOTH_SIDE,
+                        NO_ORIENTATION_OR_UNKNOWN,
+                        WITH_LINE_DIRECTION,
+                        AGAINST_LINE_DIRECTION,
+                        BOTH_DIRECTIONS)
+from .binary import Coords, LocationReferencePoint
+from .parser import (LineLocation,
+                     PointAlongLineLocation,
+                     GeoCoordinateLocation,
+                     PoiWithAccessPointLocation,
+                     CircleLocation,
+                     RectangleLocation,
+                     GridLocation,
+                     ClosedLineLocation,
+                     PolygonLocation,
+                     BBox)
+from . import fow
+
+
+''' The OpenLR XML namespace '''
+OPENLR_NAMESPACE = 'http://www.openlr.org/openlr'
+
+''' Version given to parsed locations '''
+XML_LOCATION_VERSION = BINARY_VERSION_2
+
+
+class XMLParseError(Exception):
+    pass
+
+
+FOW_VALUES = {'UNDEFINED': fow.UNDEFINED,
+              'MOTORWAY': fow.MOTORWAY,
+              'MULTIPLE_CARRIAGEWAY': fow.MULTIPLE_CARRIAGEWAY,
+              'SINGLE_CARRIAGEWAY': fow.SINGLE_CARRIAGEWAY,
+              'ROUNDABOUT': fow.ROUNDABOUT,
+              'TRAFFICSQUARE': fow.TRAFFICSQUARE,
+              'TRAFFIC_SQUARE': fow.TRAFFICSQUARE,
+              'SLIPROAD': fow.SLIPROAD,
+              'OTHER': fow.OTHER}
+
+SIDE_VALUES = {'ON_ROAD_OR_UNKNOWN': ON_ROAD_OR_UNKNOWN,
+               'RIGHT': RIGTH_SIDE,
+               'LEFT': LEFT_SIDE,
+               'BOTH': BOTH_SIDE}
+
+ORIENTATION_VALUES = {'NO_ORIENTATION_OR_UNKNOWN': NO_ORIENTATION_OR_UNKNOWN,
+                      'WITH_LINE_DIRECTION': WITH_LINE_DIRECTION,
+                      'AGAINST_LINE_DIRECTION': AGAINST_LINE_DIRECTION,
+                      'BOTH': BOTH_DIRECTIONS}
+
+
+# ----------------
+# Element helpers
+# ----------------
+
+_LOCAL_NAMES = {}
+
+
+def _local_name(tag):
+    """ Tag without namespace """
+    try:
+        return _LOCAL_NAMES[tag]
+    except KeyError:
+        name = _LOCAL_NAMES[tag] = tag.rpartition('}')[2]
+        return name
+
+
+def _children(elem):
+    """ Child elements by local name
+
+        :returns: dict of lists of elements
+    """
+    children = {}
+    for child in elem:
+        children.setdefault(_local_name(child.tag), []).append(child)
+    return children
+
+
+def _child(children, name, optional=False):
+    try:
+        return children[name][0]
+    except KeyError:
+        if optional:
+            return None
+        raise XMLParseError("Missing element {}".format(name))
+
+
+def _text(children, name, convert=int, default=None):
+    elem = _child(children, name, default is not None)
+    if elem is None:
+        return default
+    try:
+        return convert(elem.text.strip())
+    except (AttributeError, ValueError, KeyError):
+        raise XMLParseError("Invalid value for {}: {!r}".format(name, elem.text))
+
+
+def _frc(text):
+    """ Functional road class, from 'FRC0' to 'FRC7' """
+    if not text.startswith('FRC'):
+        raise ValueError(text)
+    return int(text[3:])
+
+
+def _bearing(text):
+    """ Bearing sector from a bearing in degrees """
+    return int(int(text) % 360 / BEARING_SECTOR)
+
+
+# ----------------
+# Location parts
+# ----------------
+
+def _coordinates(elem):
+    children = _children(elem)
+    return Coords(_text(children, 'Longitude', float), _text(children, 'Latitude', float))
+
+
+def _line_attributes(elem):
+    """ :returns: frc, fow, bearing sector """
+    children = _children(elem)
+    return (_text(children, 'FRC', _frc),
+            _text(children, 'FOW', FOW_VALUES.__getitem__),
+            _text(children, 'BEAR', _bearing))
+
+
+def _lrp(elem, orient=0, last=False):
+    children = _children(elem)
+    coords = _coordinates(_child(children, 'Coordinates'))
+    frc, fow_, bear = _line_attributes(_child(children, 'LineAttributes'))
+    if last:
+        return LocationReferencePoint(coords, bear, orient, frc, fow_, None, None)
+    path = _children(_child(children, 'PathAttributes'))
+    return LocationReferencePoint(coords, bear, orient, frc, fow_,
+                                  _text(path, 'LFRCNP', _frc), float(_text(path, 'DNP')))
+
+
+def _offsets(children):
+    """ :returns: positive offset, negative offset """
+    elem = _child(children, 'Offsets', True)
+    if elem is None:
+        return 0, 0
+    offsets = _children(elem)
+    return _text(offsets, 'PosOff', default=0), _text(offsets, 'NegOff', default=0)
+
+
+def _point_lrps(children):
+    """ First and last LRPs of point locations, with orientation and side of road """
+    orient = _text(children, 'Orientation', ORIENTATION_VALUES.__getitem__, NO_ORIENTATION_OR_UNKNOWN)
+    side = _text(children, 'SideOfRoad', SIDE_VALUES.__getitem__, ON_ROAD_OR_UNKNOWN)
+    return (_lrp(_child(children, 'LocationReferencePoint'), orient),
+            _lrp(_child(children, 'LastLocationReferencePoint'), side, True))
+
+
+def _bbox(elem):
+    children = _children(elem)
+    ll = _coordinates(_child(children, 'LowerLeft'))
+    ur = _coordinates(_child(children, 'UpperRight'))
+    return BBox(ll.lon, ll.lat, ur.lon, ur.lat)
+
+
+# ----------------
+# Location parsers
+# ----------------
+
+def _parse_line(elem):
+    children = _children(elem)
+    lrps = [_lrp(e) for e in children.get('LocationReferencePoint', ())]
+    if not lrps:
+        raise XMLParseError("Missing element LocationReferencePoint")
+    llrp = _lrp(_child(children, 'LastLocationReferencePoint'), last=True)
+    poffs, noffs = _offsets(children)
+    return LineLocation(XML_LOCATION_VERSION, LocationType.LINE_LOCATION, lrps[0], llrp, lrps[1:], poffs, noffs)
+
+
+def _parse_point_along_line(elem):
+    children = _children(elem)
+    flrp, llrp = _point_lrps(children)
+    return PointAlongLineLocation(XML_LOCATION_VERSION, LocationType.POINT_ALONG_LINE, flrp, llrp,
+                                  _offsets(children)[0])
+
+
+def _parse_geo_coordinates(elem):
+    return GeoCoordinateLocation(XML_LOCATION_VERSION, LocationType.GEO_COORDINATES,
+                                 _coordinates(_child(_children(elem), 'Coordinates')))
+
+
+def _parse_poi_with_access_point(elem):
+    children = _children(elem)
+    flrp, llrp = _point_lrps(children)
+    return PoiWithAccessPointLocation(XML_LOCATION_VERSION, LocationType.POI_WITH_ACCESS_POINT, flrp, llrp,
+                                      _offsets(children)[0], _coordinates(_child(children, 'Coordinates')))
+
+
+def _parse_point(elem):
+    for child in elem:
+        parser = _POINT_PARSERS.get(_local_name(child.tag))
+        if parser is not None:
+            return parser(child)
+    raise XMLParseError("Unknown point location")
+
+
+def _parse_circle(elem):
+    children = _children(elem)
+    coords = _coordinates(_child(_children(_child(children, 'GeoCoordinate')), 'Coordinates'))
+    return CircleLocation(XML_LOCATION_VERSION, LocationType.CIRCLE, coords, _text(children, 'Radius'))
+
+
+def _parse_rectangle(elem):
+    children = _children(elem)
+    return RectangleLocation(XML_LOCATION_VERSION, LocationType.RECTANGLE,
+                             _bbox(_child(children, 'Rectangle')))
+
+
+def _parse_grid(elem):
+    children = _children(elem)
+    return GridLocation(XML_LOCATION_VERSION, LocationType.GRID, _bbox(_child(children, 'Rectangle')),
+                        _text(children, 'NumColumns'), _text(children, 'NumRows'))
+
+
+def _parse_polygon(elem):
+    corners = _children(_child(_children(elem), 'PolygonCorners'))
+    return PolygonLocation(XML_LOCATION_VERSION, LocationType.POLYGON,
+                           [_coordinates(e) for e in corners.get('Coordinates', ())])
+
+
+def _parse_closed_line(elem):
+    children = _children(elem)
+    lrps = [_lrp(e) for e in children.get('LocationReferencePoint', ())]
+    if not lrps:
+        raise XMLParseError("Missing element LocationReferencePoint")
+    frc, fow_, bear = _line_attributes(_child(_children(_child(children, 'LastLine')), 'LineAttributes'))
+    return ClosedLineLocation(XML_LOCATION_VERSION, LocationType.CLOSED_LINE, lrps[0], lrps[1:], frc, fow_, bear)
+
+
+def _parse_area(elem):
+    for child in elem:
+        parser = _AREA_PARSERS.get(_local_name(child.tag))
+        if parser is not None:
+            return parser(child)
+    raise XMLParseError("Unknown area location")
+
+
+_POINT_PARSERS = {'PointAlongLine': _parse_point_along_line,
+                  'GeoCoordinate': _parse_geo_coordinates,
+                  'PoiWithAccessPoint': _parse_poi_with_access_point}
+
+_AREA_PARSERS = {'CircleLocationReference': _parse_circle,
+                 'RectangleLocationReference': _parse_rectangle,
+                 'GridLocationReference': _parse_grid,
+                 'PolygonLocationReference': _parse_polygon,
+                 'ClosedLineLocationReference': _parse_closed_line}
+
+_PARSERS = {'LineLocationReference': _parse_line,
+            'PointLocationReference': _parse_point,
+            'AreaLocationReference': _parse_area}
+
+
+def parse_xml_location(elem):
+    """ Parse a location reference element
+
+        :param elem: XMLLocationReference element
+        :returns: Object describing the location
+        :raises XMLParseError: if the element is not a valid location reference
+    """
+    for child in elem:
+        parser = _PARSERS.get(_local_name(child.tag))
+        if parser is not None:
+            return parser(child)
+    raise XMLParseError("Unknown location reference")
+
+
+def iter_xml_locations(source):
+    """ Parse the location references of an OpenLR XML document.
+
+        The document is streamed: location references are yielded in document
+        order as soon as they are read, and their elements are released. The
+        document may hold one OpenLR element, or any number of them under a
+        common root.
+
+        :param source: File name or file object
+        :returns: Generator of objects describing the parsed locations
+        :raises XMLParseError: if a location reference is invalid
+    """
+    parents = []
+    for event, elem in iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            parents.append(elem)
+            continue
+        parents.pop()
+        name = _local_name(elem.tag)
+        if name == 'XMLLocationReference':
+            yield parse_xml_location(elem)
+            elem.clear()
+        elif name == 'OpenLR':
+            # Release the whole OpenLR element (location ID...)
+            elem.clear()
+            if parents:
+                parents[-1].remove(elem)
@@ -18,6 +18,8 @@ if setuptools is not None:
    # If setuptools is not available, you're on your own for dependencies.
    install_requires = ['bitstring']
    kwargs['install_requires'] = install_requires
+   # Optional features
+   kwargs['extras_require'] = {'bulk': ['numpy']}
 
 
 def get_version():